@@ -0,0 +1,129 @@
+# address_plan.py
+
+from typing import List
+import numpy as np
+from link_table import LinkTable, BASE_ADDRESS, int_to_ip
+from node import SwitchType
+
+# see ip_address_schema.md
+CORE_BASE = 0xAC100000  # 172.16.0.0/14, core <-> aggregation links
+CORE_SPACE = 1 << 18
+POD_BASE = 0xAC140000   # 172.20.0.0 - 172.31.255.255, one aggregatable block per pod
+POD_SPACE = 12 << 16
+
+
+def _prefix(base: int, size: int) -> str:
+    return f"{int_to_ip(base)}/{32 - (size.bit_length() - 1)}"
+
+
+class AddressPlan:
+    """Decides which /30 every link of a LinkTable gets and which prefixes each switch announces.
+
+    Subclasses implement assign() and announce(). Switches keep advertised_prefixes = None (announce every
+    connected /30) unless the plan hands out aggregatable blocks.
+    """
+
+    name = None
+
+    def assign(self, fat_tree, table: LinkTable):
+        """Fills table.ip_a/table.ip_b and sets the announcement attributes of the fat tree's switches"""
+        raise NotImplementedError
+
+    def announce(self, fat_tree):
+        """Sets the announcement attributes of the fat tree's switches only, for addresses that were assigned
+        earlier (see ArtifactCache)"""
+        raise NotImplementedError
+
+    @staticmethod
+    def for_topology(name: str, k: int) -> 'AddressPlan':
+        """Returns the plan with the given name, or for name None the hierarchical plan when it fits k and the
+        sequential plan otherwise"""
+        if name is None:
+            return HierarchicalPlan() if HierarchicalPlan.fits(k) else SequentialPlan()
+        plans = {plan.name: plan for plan in (SequentialPlan, HierarchicalPlan)}
+        if name not in plans:
+            raise ValueError(f"Unknown address plan '{name}', expected one of {sorted(plans)}")
+        return plans[name]()
+
+
+class SequentialPlan(AddressPlan):
+    """Link i gets the i-th /30 of 172.16.0.0/12. Uses the whole space (up to k=70), but nothing can be summarized,
+    so every switch announces every connected /30."""
+
+    name = "sequential"
+
+    def assign(self, fat_tree, table: LinkTable):
+        table.assign_sequential(BASE_ADDRESS)
+        self.announce(fat_tree)
+
+    def announce(self, fat_tree):
+        for switch in fat_tree.all_switches():
+            switch.advertised_prefixes = None
+            switch.aggregate_prefixes = []
+
+
+class HierarchicalPlan(AddressPlan):
+    """Core links come from 172.16.0.0/14 and each pod gets its own power-of-two block starting at 172.20.0.0.
+
+    Every pod's aggregation/edge/server links sit inside the pod block, so the aggregation switches announce
+    the block as one summary (aggregate-address ... summary-only) and core switches carry one route per pod.
+    Links are numbered by their index within the core block or their pod, so addresses only depend on the
+    topology, not on dict iteration order.
+    """
+
+    name = "hierarchical"
+
+    @staticmethod
+    def pod_block_size(k: int) -> int:
+        """Addresses per pod block: the next power of two that holds the pod's (k/2)^2 + (k/2)^2 /30s"""
+        pod_links = 2 * (k // 2) ** 2
+        return 1 << max(2, (4 * pod_links - 1).bit_length())
+
+    @classmethod
+    def fits(cls, k: int) -> bool:
+        """Whether the core links and all pod blocks of a k-ary fat tree fit the schema's ranges"""
+        core_links = (k // 2) ** 2 * k
+        return 4 * core_links <= CORE_SPACE and k * cls.pod_block_size(k) <= POD_SPACE
+
+    def pod_prefix(self, k: int, pod_num: int) -> str:
+        size = self.pod_block_size(k)
+        return _prefix(POD_BASE + pod_num * size, size)
+
+    def assign(self, fat_tree, table: LinkTable):
+        k = fat_tree.k
+        if not self.fits(k):
+            raise ValueError(f"k={k} does not fit the hierarchical address plan, use the sequential plan")
+        block_size = self.pod_block_size(k)
+
+        # core links are the ones whose a-side has no pod; everything else belongs to the b-side's pod
+        link_pod = table.node_pod[table.endpoint_b]
+        is_core = table.node_pod[table.endpoint_a] < 0
+        category = np.where(is_core, -1, link_pod)
+
+        # index of every link within its category, links keep their relative table order
+        order = np.argsort(category, kind="stable")
+        sorted_category = category[order]
+        starts = np.searchsorted(sorted_category, sorted_category, side="left")
+        rank = np.empty(len(table), dtype=np.int64)
+        rank[order] = np.arange(len(table)) - starts
+
+        base = np.where(is_core, CORE_BASE, POD_BASE + link_pod.astype(np.int64) * block_size)
+        subnets = (base + 4 * rank).astype(np.uint32)
+        table.assign(subnets + np.uint32(1), subnets + np.uint32(2))
+        self.announce(fat_tree)
+
+    def announce(self, fat_tree):
+        k = fat_tree.k
+        for switch in fat_tree.core_switches:
+            # cores only forward; the pod summaries they learn are all they need
+            switch.advertised_prefixes = []
+            switch.aggregate_prefixes = []
+        for pod in fat_tree.pods:
+            prefix = self.pod_prefix(k, pod.pod_num)
+            for switch in pod.aggregation_switches + pod.edge_switches:
+                switch.advertised_prefixes = [prefix]
+                switch.aggregate_prefixes = [prefix] if switch.type == SwitchType.AGGREGATE else []
+
+    def summaries(self, fat_tree) -> List[str]:
+        """Pod summary prefixes, in pod order"""
+        return [self.pod_prefix(fat_tree.k, pod.pod_num) for pod in fat_tree.pods]
@@ -0,0 +1,82 @@
+# admission.py
+
+from typing import List, Optional, Tuple
+
+
+def projected_nodes(k: int) -> Tuple[int, int]:
+    """Switches (k^2/4 core plus k^2 aggregation and edge, 5k^2/4) and servers (k^3/4) of a fat tree"""
+    return 5 * k * k // 4, k ** 3 // 4
+
+
+def available_memory_mb() -> Optional[float]:
+    """MemAvailable from /proc/meminfo in MB, None where there is no /proc/meminfo"""
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class AdmissionError(Exception):
+    """Raised when a build does not fit on the host next to the fabrics already there"""
+
+
+class AdmissionController:
+    """Decides whether one more fabric fits on the host, so that several sessions can share it.
+
+    The projected node count of all fabrics on the host is capped by max_containers. Memory is checked
+    against MemAvailable: fabrics that finished building already show up in it, so only builds still in
+    progress are charged on top of the new one. The fabrics on the host are passed in by the caller (see
+    JobStore.reservations), so the controller itself keeps no state.
+    """
+
+    def __init__(self, max_containers: int = 2500, switch_mb: float = 64.0, server_mb: float = 16.0,
+                 reserve_mb: float = 1024.0):
+        """
+        Args:
+            max_containers (int): nodes over all sessions
+            switch_mb (float): expected memory of one switch (FRR container and its runtime shim)
+            server_mb (float): expected memory of one server
+            reserve_mb (float): memory left to the host and the app itself
+        """
+        self.max_containers = max_containers
+        self.switch_mb = switch_mb
+        self.server_mb = server_mb
+        self.reserve_mb = reserve_mb
+
+    def projected_containers(self, k: int) -> int:
+        return sum(projected_nodes(k))
+
+    def projected_mb(self, k: int) -> float:
+        switches, servers = projected_nodes(k)
+        return switches * self.switch_mb + servers * self.server_mb
+
+    def admit(self, k: int, reservations: List[Tuple[int, bool]]):
+        """Checks that a fat tree of the given k fits next to the fabrics already on the host.
+
+        Args:
+            k (int): k of the new fat tree
+            reservations (List[Tuple[int, bool]]): (k, still building) of every other fabric
+
+        Raises:
+            AdmissionError: Raised if the node cap or the available memory would be exceeded
+        """
+        containers = self.projected_containers(k)
+        in_use = sum(self.projected_containers(other) for other, _ in reservations)
+        if in_use + containers > self.max_containers:
+            raise AdmissionError(
+                f"a k={k} fat tree needs {containers} containers, {max(self.max_containers - in_use, 0)} of "
+                f"{self.max_containers} are left"
+            )
+        available = available_memory_mb()
+        if available is not None:
+            pending = sum(self.projected_mb(other) for other, building in reservations if building)
+            needed = self.projected_mb(k)
+            if pending + needed > available - self.reserve_mb:
+                raise AdmissionError(
+                    f"a k={k} fat tree needs about {needed:.0f} MB, only "
+                    f"{max(available - self.reserve_mb - pending, 0):.0f} MB are available"
+                )
@@ -5,8 +5,14 @@ eventlet.monkey_patch()
 
 import os
 import subprocess
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, jsonify
-from fat_tree import FatTree  # Ensure fat_tree.py is in the same directory or properly referenced
+import threading
+from flask import Flask, render_template, request, redirect, url_for, send_from_directory, send_file, jsonify
+from node import PullPolicy
+from address_plan import AddressPlan
+from artifact_cache import ArtifactCache, HTML_NAME
+from admission import AdmissionController, AdmissionError
+from jobs import JobStore, JobState, event_data, fat_tree_for, spawn_workers
+from diagnostics import DiagnosticsBatch, batch_pairs
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import uuid
 import logging
@@ -19,13 +25,67 @@ socketio = SocketIO(app, async_mode='eventlet')  # Ensure eventlet is installed
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Directory to store generated topology HTML files
+# Directory of pre-generated topology HTML files, still served under their old names
 TOPOLOGY_DIR = os.path.join(os.getcwd(), 'generated_topologies')
 os.makedirs(TOPOLOGY_DIR, exist_ok=True)
 
-# Dictionary to manage multiple FatTree instances
+# When to pull the switch/server images: always, if-missing or never
+PULL_POLICY = PullPolicy(os.environ.get('FAT_TREE_PULL_POLICY', PullPolicy.IF_MISSING.value))
+
+# When set, every build writes its profile (JSON and Chrome trace) to a sub folder named after its session
+PROFILE_DIR = os.environ.get('FAT_TREE_PROFILE_DIR')
+
+# Where switches and servers run: docker, netns (bare network namespaces) or dry-run (see backends.py)
+SWITCH_BACKEND = os.environ.get('FAT_TREE_SWITCH_BACKEND', 'docker')
+SERVER_BACKEND = os.environ.get('FAT_TREE_SERVER_BACKEND', SWITCH_BACKEND)
+
+# When set to 1, commands inside nodes (ping, traceroute, fping, vtysh) run over persistent shells (see exec_mux.py)
+EXEC_MUX = os.environ.get('FAT_TREE_EXEC_MUX') == '1'
+
+# Fabrics of different sessions share the host; a build is only started if it fits (see admission.py)
+admission = AdmissionController(
+    max_containers=int(os.environ.get('FAT_TREE_MAX_CONTAINERS', 2500)),
+    switch_mb=float(os.environ.get('FAT_TREE_SWITCH_MB', 64)),
+    server_mb=float(os.environ.get('FAT_TREE_SERVER_MB', 16)),
+    reserve_mb=float(os.environ.get('FAT_TREE_RESERVE_MB', 1024))
+)
+
+# Topology HTML, configs and address plan of every k built so far, least recently used evicted first (see
+# artifact_cache.py)
+ARTIFACT_DIR = os.environ.get('FAT_TREE_ARTIFACT_DIR', os.path.join(os.getcwd(), 'artifact_cache'))
+ARTIFACT_CACHE_MB = int(os.environ.get('FAT_TREE_ARTIFACT_CACHE_MB', 1024))
+artifacts = ArtifactCache(ARTIFACT_DIR, ARTIFACT_CACHE_MB << 20)
+
+# Pings/traceroutes a /diagnostics batch runs at once
+DIAGNOSTICS_PARALLEL = int(os.environ.get('FAT_TREE_DIAGNOSTICS_PARALLEL', 16))
+
+# Builds run in separate worker processes; jobs and their progress messages are kept in SQLite (see jobs.py)
+JOB_DB = os.environ.get('FAT_TREE_JOB_DB', os.path.join(os.getcwd(), 'fat_tree_jobs.sqlite3'))
+BUILD_WORKERS = int(os.environ.get('FAT_TREE_BUILD_WORKERS', 2))
+job_store = JobStore(JOB_DB)
+submit_lock = threading.Lock()
+
+# Seconds between looks for new progress messages of the workers
+EVENT_POLL_INTERVAL = 0.25
+relayed = {'last_id': 0} # id of the last event relayed to the rooms
+
+# FatTree models of ready jobs, restored on first use (see get_fat_tree)
 fat_tree_instances = {}
 
+def get_fat_tree(session_id):
+    """FatTree of a session whose build is ready, None otherwise"""
+    fat_tree = fat_tree_instances.get(session_id)
+    if fat_tree is None:
+        job = job_store.get(session_id) if session_id else None
+        if job is None or job['state'] != JobState.READY.value:
+            return None
+        fat_tree = fat_tree_for(job)
+        if EXEC_MUX:
+            fat_tree.enable_exec_mux()
+        fat_tree.restore()
+        fat_tree_instances[session_id] = fat_tree
+    return fat_tree
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -41,65 +101,30 @@ def generate_topology():
         logger.exception("Failed to parse 'k' from form data.")
         return "Error: Invalid value for k.", 400
 
-    config_folder = f"configs/configs_k{k}"
-    if not os.path.exists("configs"):
-        os.makedirs("configs")
-    if not os.path.exists(config_folder):
-        os.makedirs(config_folder)
-
-    filename = f"fat_tree_k{k}_topology.html"
-
     # Generate a unique session ID for this build process
     session_id = str(uuid.uuid4())
-    logger.info("Starting build process with session_id: %s", session_id)
-
-    def build_topology_task(k, config_folder, filename, session_id):
+    # every session gets its own config folders, container names and cleanup scope
+    config_folder = os.path.join("configs", session_id, f"configs_k{k}")
+    filename = artifacts.html_name(artifacts.key(k, AddressPlan.for_topology(None, k).name))
+    options = {
+        'switch_backend': SWITCH_BACKEND,
+        'server_backend': SERVER_BACKEND,
+        'pull_policy': PULL_POLICY.value,
+        'profile_dir': os.path.join(PROFILE_DIR, session_id) if PROFILE_DIR else None,
+        'exec_mux': EXEC_MUX,
+        'artifact_dir': ARTIFACT_DIR,
+        'artifact_max_mb': ARTIFACT_CACHE_MB,
+    }
+
+    with submit_lock:
         try:
-            # Initialize FatTree with a callback to emit messages to the specific room
-            fat_tree = FatTree(
-                k,
-                config_folder,
-                lambda msg, error=False: emit_message(message=msg, error=error, session_id=session_id)
-            )
-            fat_tree_instances[session_id] = fat_tree
-            fat_tree.build_fat_tree()
-            fat_tree.generate_topology_graph_plotly()
-
-            # Move the generated HTML to the topology directory
-            generated_html = f"fat_tree_k{k}_topology.html"
-            generated_html_path = os.path.join(os.getcwd(), generated_html)
-            output_html_path = os.path.join(TOPOLOGY_DIR, generated_html)
-            if os.path.exists(generated_html_path):
-                os.rename(generated_html_path, output_html_path)
-                emit_message("Topology HTML file generated successfully.", session_id=session_id)
-            else:
-                emit_message("Error: Topology HTML file not found.", error=True, session_id=session_id)
-                return
-
-            # Emit completion event
-            emit_message("Build complete!", complete=True, session_id=session_id)
-        except Exception as e:
-            logger.exception("Error during build process: %s", e)
-            emit_message(f"Error during build: {str(e)}", error=True, session_id=session_id)
-
-    def emit_message(message, error=False, complete=False, session_id=None):
-        """Helper function to emit messages to the client in a specific room."""
-        data = {'message': message}
-        if error:
-            data['error'] = True
-        if complete:
-            data['complete'] = True
-        if session_id:
-            # Emit to the specific room
-            socketio.emit('build_status', data, room=session_id)
-            logger.info("Emitted message to session_id %s: %s", session_id, data)
-        else:
-            # Emit to all clients (fallback)
-            socketio.emit('build_status', data)
-            logger.info("Emitted message to all clients: %s", data)
-
-    # Start the build process in a background task
-    socketio.start_background_task(target=build_topology_task, k=k, config_folder=config_folder, filename=filename, session_id=session_id)
+            admission.admit(k, job_store.reservations())
+        except AdmissionError as e:
+            logger.warning("Rejected build for k=%s: %s", k, e)
+            return f"Error: not enough capacity on this host, {e}.", 503
+        job_store.submit(session_id, k, config_folder, options)
+    job_store.add_event(session_id, f"Queued the build of a k={k} fat tree.")
+    logger.info("Queued build process with session_id: %s", session_id)
 
     # Redirect to the loading screen with the unique session ID
     return redirect(url_for('loading_screen', filename=filename, session_id=session_id))
@@ -109,18 +134,29 @@ def cleanup():
     data = request.get_json()
     session_id = data.get('session_id')
 
-    if not session_id or session_id not in fat_tree_instances:
+    if not session_id or not job_store.request_teardown(session_id):
         logger.error("Invalid or missing session ID for cleanup: %s", session_id)
         return jsonify({'error': 'Invalid or missing session ID.'}), 400
 
-    fat_tree = fat_tree_instances.pop(session_id)
-    try:
-        fat_tree.cleanup()  # Assuming the cleanup method handles Docker and network cleanup
-        logger.info("Cleaned up FatTree instance for session_id: %s", session_id)
-        return jsonify({'success': True, 'message': 'Cleanup completed successfully.'})
-    except Exception as e:
-        logger.exception("Error during cleanup for session_id %s: %s", session_id, e)
-        return jsonify({'success': False, 'message': f'Cleanup failed: {str(e)}'}), 500
+    fat_tree = fat_tree_instances.pop(session_id, None)
+    if fat_tree is not None and fat_tree.exec_mux is not None:
+        fat_tree.exec_mux.close()
+    logger.info("Queued cleanup of session_id: %s", session_id)
+    return jsonify({'success': True, 'message': 'Cleanup queued, the nodes of this session are being removed.'})
+
+def relay_job_events():
+    """Forwards the progress messages the build workers store to the clients in the session rooms"""
+    relayed['last_id'] = job_store.last_event_id()
+    while True:
+        try:
+            for event in job_store.events_after(relayed['last_id']):
+                data = event_data(event)
+                socketio.emit('build_status', data, room=event['session_id'])
+                logger.info("Emitted message to session_id %s: %s", event['session_id'], data)
+                relayed['last_id'] = event['id']
+        except Exception:
+            logger.exception("Failed to relay build events")
+        socketio.sleep(EVENT_POLL_INTERVAL)
 
 @app.route('/loading/<filename>')
 def loading_screen(filename):
@@ -140,7 +176,16 @@ def view_topology(filename):
 
 @app.route('/topology_file/<filename>')
 def topology_file(filename):
-    return send_from_directory(TOPOLOGY_DIR, filename)
+    key = artifacts.key_of(filename)
+    if key is None:
+        return send_from_directory(TOPOLOGY_DIR, filename)
+    # send_file opens the file right away, so the entry only has to outlive this block
+    with artifacts.reading(key) as entry:
+        if entry is None:
+            return "Error: Topology not built yet or evicted from the cache.", 404
+        # the name is content-addressed, so the key doubles as the ETag and browsers revalidate with a 304
+        return send_file(os.path.join(entry, HTML_NAME), mimetype='text/html', conditional=True, etag=key,
+                         max_age=3600)
 
 # app.py
 @app.route('/ping', methods=['POST'])
@@ -150,7 +195,8 @@ def ping():
     source = data.get('source')
     destination = data.get('destination')
 
-    if not session_id or session_id not in fat_tree_instances:
+    fat_tree = get_fat_tree(session_id)
+    if fat_tree is None:
         logger.error("Invalid or missing session ID for ping: %s", session_id)
         return jsonify({'error': 'Invalid or missing session ID.'}), 400
 
@@ -158,7 +204,6 @@ def ping():
         logger.error("Missing source or destination for ping.")
         return jsonify({'error': 'Source and destination are required.'}), 400
 
-    fat_tree = fat_tree_instances[session_id]
     result = fat_tree.ping(source, destination)
     return jsonify(result)
 
@@ -169,7 +214,8 @@ def traceroute():
     source = data.get('source')
     destination = data.get('destination')
 
-    if not session_id or session_id not in fat_tree_instances:
+    fat_tree = get_fat_tree(session_id)
+    if fat_tree is None:
         logger.error("Invalid or missing session ID for traceroute: %s", session_id)
         return jsonify({'error': 'Invalid or missing session ID.'}), 400
 
@@ -177,19 +223,60 @@ def traceroute():
         logger.error("Missing source or destination for traceroute.")
         return jsonify({'error': 'Source and destination are required.'}), 400
 
-    fat_tree = fat_tree_instances[session_id]
     result = fat_tree.traceroute(source, destination)
     return jsonify(result)
 
+@app.route('/diagnostics', methods=['POST'])
+def diagnostics():
+    """Starts a batch of pings or traceroutes and returns right away (202). Every result is sent to the session's
+    room as a diagnostic_result event as soon as it is in, followed by one diagnostics_complete event.
+
+    Takes {'session_id', 'kind': 'ping' or 'traceroute', 'pairs': [[source, destination], ...],
+    'patterns': [{'source_pod', 'destination_pod'}, ...], 'max_parallel'}, see diagnostics.py.
+    """
+    data = request.get_json()
+    session_id = data.get('session_id')
+
+    fat_tree = get_fat_tree(session_id)
+    if fat_tree is None:
+        logger.error("Invalid or missing session ID for diagnostics: %s", session_id)
+        return jsonify({'error': 'Invalid or missing session ID.'}), 400
+
+    try:
+        pairs = batch_pairs(fat_tree, data.get('pairs'), data.get('patterns'))
+        max_parallel = min(int(data.get('max_parallel', DIAGNOSTICS_PARALLEL)), DIAGNOSTICS_PARALLEL)
+        batch = DiagnosticsBatch(fat_tree, data.get('kind', 'ping'), pairs, max_parallel=max_parallel)
+    except (ValueError, TypeError) as e:
+        logger.error("Invalid diagnostics request: %s", e)
+        return jsonify({'error': str(e)}), 400
+    if not pairs:
+        return jsonify({'error': 'No server pairs to run.'}), 400
+
+    batch_id = uuid.uuid4().hex
+    batch.on_result = lambda result: socketio.emit('diagnostic_result', dict(result, batch_id=batch_id),
+                                                   room=session_id)
+    socketio.start_background_task(run_diagnostics, batch, session_id, batch_id)
+    logger.info("Started %s batch %s of %d pairs for session_id: %s", batch.kind, batch_id, len(pairs), session_id)
+    return jsonify({'batch_id': batch_id, 'kind': batch.kind, 'pairs': pairs}), 202
+
+def run_diagnostics(batch, session_id, batch_id):
+    try:
+        results = batch.run()
+        failed = sum(not result['success'] for result in results)
+        socketio.emit('diagnostics_complete', {'batch_id': batch_id, 'total': len(results), 'failed': failed},
+                      room=session_id)
+    except Exception as e:
+        logger.exception("Diagnostics batch %s failed", batch_id)
+        socketio.emit('diagnostics_complete', {'batch_id': batch_id, 'error': str(e)}, room=session_id)
+
 @app.route('/get_servers/<session_id>', methods=['GET'])
 def get_servers(session_id):
-    if not session_id or session_id not in fat_tree_instances:
+    fat_tree = get_fat_tree(session_id)
+    if fat_tree is None:
         logger.error("Invalid or missing session ID for get_servers: %s", session_id)
         return jsonify({'error': 'Invalid or missing session ID.'}), 400
 
-    fat_tree = fat_tree_instances[session_id]
-    server_names = [server.name for pod in fat_tree.pods for server in pod.servers]
-    return jsonify({'servers': server_names})
+    return jsonify({'servers': fat_tree.node_index.server_names, 'pods': len(fat_tree.pods)})
 
 # Handle client connection and joining room
 @socketio.on('join')
@@ -198,6 +285,9 @@ def handle_join(data):
     if session_id:
         join_room(session_id)
         emit('joined', {'message': f'Joined room {session_id}'})
+        # messages sent before the client joined; later ones reach it through relay_job_events
+        for event in job_store.events_after(0, session_id=session_id, up_to=relayed['last_id']):
+            emit('build_status', event_data(event))
         logger.info("Client joined room: %s", session_id)
     else:
         logger.error("Client attempted to join without a session_id.")
@@ -208,5 +298,18 @@ def handle_disconnect():
     logger.info("Client disconnected.")
 
 if __name__ == '__main__':
+    debug = True
+    # with the debug reloader this file runs twice: in the watching process, which lives as long as the app,
+    # and in the serving process, which is restarted on every code change
+    serving_process = os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    if not serving_process:
+        recovered = job_store.recover()
+        if recovered:
+            logger.info("Recovered %d interrupted build jobs", recovered)
+        # they exit together with this process, see jobs.py
+        workers = spawn_workers(JOB_DB, BUILD_WORKERS)
+        logger.info("Started %d build workers", len(workers))
+    if serving_process or not debug:
+        socketio.start_background_task(relay_job_events)
     # Replace app.run() with socketio.run()
-    socketio.run(app, host="0.0.0.0", port=5000, debug=True)
+    socketio.run(app, host="0.0.0.0", port=5000, debug=debug)
@@ -0,0 +1,177 @@
+# artifact_cache.py
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+import numpy as np
+
+HTML_NAME = "topology.html"
+CONFIGS_NAME = "configs.json"
+ADDRESS_PLAN_NAME = "address_plan.npz"
+META_NAME = "meta.json"
+
+# modules whose code decides what a topology's artifacts contain
+GENERATOR_MODULES = ("fat_tree.py", "pod.py", "node.py", "link_table.py", "address_plan.py", "frr_renderer.py")
+
+_HTML_FILE = re.compile(r"^fat_tree_(k\d+-[0-9a-f]+)\.html$")
+
+_generator_version = None
+
+
+def generator_version() -> str:
+    """Hash of the generator modules' source, so that a code change invalidates every cached artifact"""
+    global _generator_version
+    if _generator_version is None:
+        digest = hashlib.sha256()
+        folder = os.path.dirname(os.path.abspath(__file__))
+        for name in GENERATOR_MODULES:
+            with open(os.path.join(folder, name), "rb") as source:
+                digest.update(name.encode() + b"\0" + source.read() + b"\0")
+        _generator_version = digest.hexdigest()
+    return _generator_version
+
+
+def _folder_size(folder: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(folder) for name in names)
+
+
+class ArtifactCache:
+    """Content-addressed store of everything a topology produces that depends on k alone: the Plotly HTML,
+    every switch's config files and the address plan.
+
+    An entry is a folder named after its key (k, address plan and generator version), written to a temp
+    folder and renamed into place, so readers never see half an entry and concurrent writers of the same key
+    simply keep the first one. Entries are evicted least recently used first once the cache grows beyond
+    max_bytes; every get counts as a use. Eviction holds an exclusive lock on the cache, so an entry opened
+    through reading() is not removed before the reader is done with it.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 1 << 30):
+        """
+        Args:
+            root (str): cache folder, created if missing
+            max_bytes (int): disk space the entries may take
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(k: int, address_plan: str) -> str:
+        digest = hashlib.sha256(f"{k}\0{address_plan}\0{generator_version()}".encode()).hexdigest()
+        return f"k{k}-{digest[:20]}"
+
+    @staticmethod
+    def html_name(key: str) -> str:
+        """File name the topology HTML of an entry is served under"""
+        return f"fat_tree_{key}.html"
+
+    @staticmethod
+    def key_of(filename: str) -> Optional[str]:
+        """Key of an html_name, None for any other file name"""
+        match = _HTML_FILE.match(filename)
+        return match.group(1) if match else None
+
+    def path(self, key: str, name: str = "") -> str:
+        return os.path.join(self.root, key, name)
+
+    def get(self, key: str) -> Optional[str]:
+        """Folder of an entry, None if it is not cached"""
+        meta = self.path(key, META_NAME)
+        try:
+            os.utime(meta)
+        except FileNotFoundError:
+            return None
+        return self.path(key)
+
+    @contextmanager
+    def reading(self, key: str):
+        """Context manager yielding the folder of an entry (None if it is not cached) that cannot be evicted
+        until the block ends"""
+        with open(os.path.join(self.root, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            yield self.get(key)
+
+    def put(self, key: str, fill: Callable[[str], None]) -> str:
+        """Adds an entry unless it is cached already.
+
+        Args:
+            key (str): see key
+            fill (function): Called as fill(folder) to write the entry's files into an empty folder.
+
+        Returns:
+            str: folder of the entry
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+        folder = tempfile.mkdtemp(dir=self.root, prefix=".tmp-")
+        try:
+            fill(folder)
+            meta = {'key': key, 'created': time.time(), 'version': generator_version()}
+            meta['size'] = _folder_size(folder)
+            with open(os.path.join(folder, META_NAME), "w") as meta_file:
+                json.dump(meta, meta_file)
+            try:
+                os.rename(folder, self.path(key))
+            except OSError:
+                # published by another process in the meantime
+                shutil.rmtree(folder)
+        except BaseException:
+            shutil.rmtree(folder, ignore_errors=True)
+            raise
+        self.evict(keep=key)
+        return self.path(key)
+
+    def evict(self, keep: Optional[str] = None):
+        """Removes least recently used entries until the cache fits in max_bytes"""
+        with open(os.path.join(self.root, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = []
+            for key in os.listdir(self.root):
+                try:
+                    with open(self.path(key, META_NAME)) as meta_file:
+                        size = json.load(meta_file)['size']
+                    entries.append((os.path.getmtime(self.path(key, META_NAME)), key, size))
+                except (OSError, ValueError, KeyError):
+                    continue  # temp folders and the lock file
+            total = sum(size for _, _, size in entries)
+            for _, key, size in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                shutil.rmtree(self.path(key), ignore_errors=True)
+                total -= size
+
+    def discard(self, key: str):
+        """Removes an entry that turned out to be unreadable, so the next build stores it again"""
+        with open(os.path.join(self.root, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            shutil.rmtree(self.path(key), ignore_errors=True)
+
+    @staticmethod
+    def save_address_plan(folder: str, ip_a: np.ndarray, ip_b: np.ndarray):
+        np.savez(os.path.join(folder, ADDRESS_PLAN_NAME), ip_a=ip_a, ip_b=ip_b)
+
+    def load_address_plan(self, key: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(ip_a, ip_b) arrays of the link table, see LinkTable.assign"""
+        with np.load(self.path(key, ADDRESS_PLAN_NAME)) as plan:
+            return plan['ip_a'], plan['ip_b']
+
+    @staticmethod
+    def save_configs(folder: str, configs: Dict[str, Dict[str, str]]):
+        with open(os.path.join(folder, CONFIGS_NAME), "w") as configs_file:
+            json.dump(configs, configs_file)
+
+    def load_configs(self, key: str) -> Dict[str, Dict[str, str]]:
+        """switch name -> file name -> content, see ConfigWriter.write"""
+        with open(self.path(key, CONFIGS_NAME)) as configs_file:
+            return json.load(configs_file)
@@ -0,0 +1,734 @@
+# backends.py
+
+import itertools
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from docker.errors import ImageNotFound, NotFound
+from docker.types import Mount
+from pyroute2 import netns
+from node import Node, PullPolicy, FRR_IMAGE, SERVER_IMAGE, NODE_LABEL, ROLE_LABEL, SESSION_LABEL
+from link_fabric import netns_socket
+from profiler import timed_run
+from server_agent import AgentClient, AgentError, DEFAULT_SOCKET, DEFAULT_PREFIX, NETNS_DIR
+
+# same shape as docker's exec result, so callers read .exit_code and .output (bytes) whatever the backend
+ExecResult = namedtuple('ExecResult', ['exit_code', 'output'])
+
+
+class Backend:
+    """Runs nodes somewhere: creates them, runs commands in them and exposes their network namespace.
+
+    A node keeps the handle its backend returned in node.container (a docker container, a namespace name,
+    ...); everything else goes through node.backend.
+
+    With a session (see FatTree), every instance is named <session>.<node name> and running, remove_by_name
+    and cleanup only see the instances of that session, so several fabrics can share a host.
+    """
+
+    name = None
+    exec_mux = None # when set (see FatTree.enable_exec_mux), Node.exec_run goes through this ExecMux
+    session = None # set by FatTree(session=...)
+    runs_routing = True # False if switches run no FRR, so there is no convergence to wait for
+
+    def instance_name(self, name: str) -> str:
+        """Name of a node's instance (container, namespace, ...) on this backend"""
+        return f"{self.session}.{name}" if self.session else name
+
+    def node_name(self, instance: str) -> Optional[str]:
+        """Node name of an instance, None if the instance belongs to another session (node names have no dots)"""
+        if self.session:
+            prefix = f"{self.session}."
+            return instance[len(prefix):] if instance.startswith(prefix) else None
+        return None if "." in instance else instance
+
+    def prepare(self, policy: PullPolicy):
+        """Called once before nodes are created, e.g. to pull images"""
+
+    def create(self, node: Node):
+        """Creates and starts the node, setting node.container"""
+        raise NotImplementedError
+
+    def attach(self, node: Node):
+        """Adopts an already existing instance of the node (starting it if needed) instead of creating one"""
+        raise NotImplementedError
+
+    def running(self) -> Dict[str, str]:
+        """Instances of this backend's session on this host: node name -> role ('switch' or 'server')"""
+        return {}
+
+    def remove(self, node: Node):
+        """Stops and removes the node. Does nothing if it was never created."""
+        raise NotImplementedError
+
+    def remove_by_name(self, name: str):
+        """Removes an instance that has no node in the model (see running)"""
+        raise NotImplementedError
+
+    def restart(self, node: Node):
+        raise NotImplementedError
+
+    def pause(self, node: Node):
+        """Freezes every process of the node, leaving its interfaces up"""
+        raise NotImplementedError
+
+    def unpause(self, node: Node):
+        raise NotImplementedError
+
+    def exec(self, node: Node, command) -> ExecResult:
+        """Runs a command (string or argument list) inside the node and waits for it, stderr merged into stdout"""
+        raise NotImplementedError
+
+    def netns_path(self, node: Node) -> str:
+        """Path of the node's network namespace"""
+        raise NotImplementedError
+
+    def shell_argv(self, node: Node) -> Optional[List[str]]:
+        """Host command opening a shell inside the node that reads commands from stdin (see exec_mux.py),
+        None if the backend has none"""
+        return None
+
+    def shell_prelude(self, node: Node) -> Optional[str]:
+        """Shell code run once when such a shell starts"""
+        return None
+
+    def netns_socket(self, node: Node):
+        """Context manager yielding an IPRoute socket inside the node's namespace"""
+        return netns_socket(self.netns_path(node))
+
+    def host_netlink(self):
+        """Netlink socket of the host namespace, used to create veth pairs"""
+        return Node.get_iproute()
+
+    def docker_client(self):
+        """Docker client whose API calls the build profiler times, None if the backend does not use docker"""
+        return None
+
+    def cleanup(self, log):
+        """Removes every instance of this backend's session on the host.
+
+        Args:
+            log (function): Called as log(message, error=False), e.g. FatTree.log.
+        """
+
+
+class DockerBackend(Backend):
+    """One container per node: FRR containers for switches, netshoot containers for servers (the default)"""
+
+    name = 'docker'
+
+    def prepare(self, policy: PullPolicy = PullPolicy.IF_MISSING):
+        """Makes sure the switch and server images are available locally.
+
+        Args:
+            policy (PullPolicy): when to pull from the registry
+
+        Raises:
+            ImageNotFound: Raised with PullPolicy.NEVER if an image is not present locally
+        """
+        client = Node.get_client()
+        for image in (FRR_IMAGE, SERVER_IMAGE):
+            if policy != PullPolicy.ALWAYS:
+                try:
+                    client.images.get(image)
+                    print(f"Using local image {image}")
+                    continue
+                except ImageNotFound:
+                    if policy == PullPolicy.NEVER:
+                        raise
+            print(f"Pulling {image}...")
+            client.images.pull(image)
+
+    def container_config(self, node: Node) -> dict:
+        config = {
+            'name': node.container_name,
+            'network_mode': 'none',
+            'privileged': True,
+            'cap_add': ['NET_ADMIN', 'SYS_ADMIN'],
+            'labels': {NODE_LABEL: node.name, ROLE_LABEL: node.role},
+        }
+        if self.session:
+            config['labels'][SESSION_LABEL] = self.session
+        if node.role == 'switch':
+            config['image'] = FRR_IMAGE
+            config['mounts'] = [Mount(target='/etc/frr', source=node.folder_path, type='bind')]
+        else:
+            config['image'] = SERVER_IMAGE
+            config['command'] = "tail -f /dev/null"
+        return config
+
+    @staticmethod
+    def resolve_namespace(node: Node) -> int:
+        """Inspects the container once and caches its PID. Called right after the container is started.
+
+        Returns:
+            int: PID of the container's init process
+        """
+        node.container.reload()
+        node._pid = node.container.attrs['State']['Pid']
+        return node._pid
+
+    def create(self, node: Node):
+        # set before starting, so a rollback also removes containers that were created but failed to start
+        node.container = Node.get_client().containers.create(**self.container_config(node))
+        node.container.start()
+        self.resolve_namespace(node)
+        print(f"Successfully started {node.container.name}!")
+
+    def attach(self, node: Node):
+        container = Node.get_client().containers.get(node.container_name)
+        node.container = container
+        if container.status != 'running':
+            container.start()
+        self.resolve_namespace(node)
+        print(f"Attached to existing container {container.name}")
+
+    def running(self) -> Dict[str, str]:
+        containers = Node.get_client().containers.list(all=True, filters={'label': NODE_LABEL})
+        return {container.labels[NODE_LABEL]: container.labels.get(ROLE_LABEL) for container in containers
+                if container.labels.get(SESSION_LABEL) == self.session}
+
+    def remove(self, node: Node):
+        if node.container is None:
+            return
+        name = node.container.name
+        node.container.remove(force=True)
+        node.container = None
+        node._pid = None
+        print(f"Removed {name}")
+
+    def remove_by_name(self, name: str):
+        try:
+            Node.get_client().containers.get(self.instance_name(name)).remove(force=True)
+        except NotFound:
+            pass
+
+    def restart(self, node: Node):
+        """Restarts the container. The restarted container has a new PID, so the namespace cache is refreshed."""
+        node.container.restart()
+        self.resolve_namespace(node)
+        print(f"Restarted {node.container.name}")
+
+    def pause(self, node: Node):
+        node.container.pause()
+
+    def unpause(self, node: Node):
+        node.container.unpause()
+
+    def exec(self, node: Node, command) -> ExecResult:
+        result = node.container.exec_run(command)
+        return ExecResult(result.exit_code, result.output)
+
+    def netns_path(self, node: Node) -> str:
+        if node._pid is None:
+            self.resolve_namespace(node)
+        return f"/proc/{node._pid}/ns/net"
+
+    def shell_argv(self, node: Node) -> List[str]:
+        return ["docker", "exec", "-i", node.container.name, "sh"]
+
+    def docker_client(self):
+        return Node.get_client()
+
+    def cleanup(self, log):
+        """Stops and removes all Docker containers, deletes network namespaces, and prunes Docker networks.
+        With a session only the containers carrying its session label are removed."""
+        if self.session:
+            self._cleanup_session(log)
+            return
+        try:
+            # Get all container IDs
+            container_ids = timed_run(
+                ["docker", "ps", "-a", "-q"],
+                capture_output=True,
+                text=True,
+                check=True
+            ).stdout.strip()
+
+            if container_ids:
+                # Stop all containers
+                timed_run(
+                    ["docker", "stop"] + container_ids.split("\n"),
+                    check=True
+                )
+                log("Stopped all Docker containers.")
+
+                # Remove all containers
+                timed_run(
+                    ["docker", "rm"] + container_ids.split("\n"),
+                    check=True
+                )
+                log("Removed all Docker containers.")
+
+            # Get list of network namespaces
+            namespaces = timed_run(
+                ["ip", "netns"],
+                capture_output=True,
+                text=True,
+                check=True
+            ).stdout.strip()
+
+            if namespaces:
+                # Delete each network namespace
+                for ns in namespaces.split("\n"):
+                    timed_run(
+                        ["sudo", "ip", "netns", "delete", ns],
+                        check=True
+                    )
+                    log(f"Deleted network namespace: {ns}")
+
+            # Prune Docker networks
+            timed_run(
+                ["docker", "network", "prune", "-f"],
+                check=True
+            )
+            log("Pruned Docker networks.")
+
+            log("Cleanup completed successfully.")
+
+        except subprocess.CalledProcessError as e:
+            log(f"An error occurred during cleanup: {e}", error=True)
+            raise
+
+
+    def _cleanup_session(self, log):
+        try:
+            container_ids = timed_run(
+                ["docker", "ps", "-a", "-q", "--filter", f"label={SESSION_LABEL}={self.session}"],
+                capture_output=True,
+                text=True,
+                check=True
+            ).stdout.strip()
+
+            if container_ids:
+                timed_run(
+                    ["docker", "rm", "-f"] + container_ids.split("\n"),
+                    check=True,
+                    capture_output=True
+                )
+            log(f"Removed {len(container_ids.split()) if container_ids else 0} containers of session {self.session}.")
+
+        except subprocess.CalledProcessError as e:
+            log(f"An error occurred during cleanup of session {self.session}: {e}", error=True)
+            raise
+
+
+class NetnsBackend(Backend):
+    """Bare network namespaces (`ip netns`), no containers.
+
+    Every node is a named namespace /var/run/netns/<prefix><instance name>. Commands run through `ip netns exec`, so
+    the tools the nodes use (ping, fping, traceroute, iperf3) must be installed on the host. Switches run
+    the host's FRR inside their namespace: FRR's init script starts a separate instance per pathspace, and
+    when a namespace of the same name exists it starts the daemons inside it. The instance reads its config
+    from /etc/frr/<namespace>, which is linked to the switch's config folder, and vtysh/frr-reload.py are
+    pointed at it with -N/--pathspace. Needs root and FRR 7.5 or newer on the host.
+
+    Servers only cost a namespace here instead of a container, which is most of a fabric (k^3/4 servers).
+    """
+
+    name = 'netns'
+
+    def __init__(self, prefix: str = 'ft-', frr_init: str = '/usr/lib/frr/frrinit.sh', frr_etc: str = '/etc/frr',
+                 frr_run: str = '/var/run/frr'):
+        """
+        Args:
+            prefix (str): prepended to node names to form namespace names, also used to find them again
+            frr_init (str): FRR's init script
+            frr_etc (str): FRR's config directory, holding one sub directory per pathspace
+            frr_run (str): FRR's state directory, holding the pid files of each pathspace
+        """
+        self.prefix = prefix
+        self.frr_init = frr_init
+        self.frr_etc = frr_etc
+        self.frr_run = frr_run
+
+    def namespace(self, name: str) -> str:
+        return f"{self.prefix}{self.instance_name(name)}"
+
+    def _frr(self, action: str, namespace: str):
+        timed_run([self.frr_init, action, namespace], check=True, capture_output=True)
+
+    def _frr_pids(self, namespace: str) -> List[int]:
+        folder = os.path.join(self.frr_run, namespace)
+        pids = []
+        if os.path.isdir(folder):
+            for name in os.listdir(folder):
+                if name.endswith('.pid'):
+                    with open(os.path.join(folder, name)) as pid_file:
+                        pids.append(int(pid_file.read().strip()))
+        return pids
+
+    def _frr_running(self, namespace: str) -> bool:
+        for pid in self._frr_pids(namespace):
+            try:
+                os.kill(pid, 0)
+                return True
+            except ProcessLookupError:
+                continue
+        return False
+
+    def _start(self, node: Node):
+        namespace = node.container
+        if namespace not in netns.listnetns():
+            netns.create(namespace)
+        with self.netns_socket(node) as ns:
+            ns.link('set', index=ns.link_lookup(ifname='lo')[0], state='up')
+        if node.role == 'switch':
+            config_link = os.path.join(self.frr_etc, namespace)
+            if not os.path.islink(config_link):
+                os.symlink(os.path.abspath(node.folder_path), config_link)
+            if not self._frr_running(namespace):
+                self._frr('start', namespace)
+
+    def create(self, node: Node):
+        node.container = self.namespace(node.name)
+        self._start(node)
+        print(f"Successfully started {node.container}!")
+
+    def attach(self, node: Node):
+        node.container = self.namespace(node.name)
+        self._start(node)
+        print(f"Attached to existing namespace {node.container}")
+
+    def running(self) -> Dict[str, str]:
+        nodes = {}
+        for namespace in netns.listnetns():
+            name = self.node_name(namespace[len(self.prefix):]) if namespace.startswith(self.prefix) else None
+            if name is not None:
+                role = 'switch' if os.path.islink(os.path.join(self.frr_etc, namespace)) else 'server'
+                nodes[name] = role
+        return nodes
+
+    def _remove_namespace(self, namespace: str):
+        config_link = os.path.join(self.frr_etc, namespace)
+        if os.path.islink(config_link):
+            if self._frr_running(namespace):
+                self._frr('stop', namespace)
+            os.unlink(config_link)
+        if namespace in netns.listnetns():
+            netns.remove(namespace)
+
+    def remove(self, node: Node):
+        if node.container is None:
+            return
+        self._remove_namespace(node.container)
+        print(f"Removed {node.container}")
+        node.container = None
+
+    def remove_by_name(self, name: str):
+        self._remove_namespace(self.namespace(name))
+
+    def restart(self, node: Node):
+        """Restarts the switch's FRR instance. The namespace and its links stay as they are."""
+        if node.role == 'switch':
+            self._frr('restart', node.container)
+        print(f"Restarted {node.container}")
+
+    def _signal(self, node: Node, signum: int):
+        for pid in self._frr_pids(node.container):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def pause(self, node: Node):
+        self._signal(node, signal.SIGSTOP)
+
+    def unpause(self, node: Node):
+        self._signal(node, signal.SIGCONT)
+
+    def _frr_args(self, namespace: str, args: List[str]) -> List[str]:
+        """Points FRR's tools at the node's pathspace instead of the host's default instance"""
+        program = os.path.basename(args[0]) if args else ''
+        if program == 'vtysh':
+            return [args[0], '-N', namespace] + args[1:]
+        if program == 'frr-reload.py':
+            config = os.path.join(self.frr_etc, 'frr.conf')
+            args = [os.path.join(self.frr_etc, namespace, 'frr.conf') if arg == config else arg for arg in args]
+            return [args[0], '--pathspace', namespace] + args[1:]
+        return args
+
+    def exec(self, node: Node, command) -> ExecResult:
+        args = shlex.split(command) if isinstance(command, str) else list(command)
+        if node.role == 'switch':
+            args = self._frr_args(node.container, args)
+        result = timed_run(["ip", "netns", "exec", node.container] + args,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return ExecResult(result.returncode, result.stdout)
+
+    def netns_path(self, node: Node) -> str:
+        return f"/var/run/netns/{node.container or self.namespace(node.name)}"
+
+    def shell_argv(self, node: Node) -> List[str]:
+        return ["ip", "netns", "exec", node.container, "sh"]
+
+    def shell_prelude(self, node: Node) -> Optional[str]:
+        if node.role == 'switch':
+            return f'vtysh() {{ command vtysh -N {node.container} "$@"; }}'
+        return None
+
+    def cleanup(self, log):
+        """Stops the FRR instances and deletes the namespaces of every node of this backend's session"""
+        for name in self.running():
+            self.remove_by_name(name)
+            log(f"Deleted network namespace: {self.namespace(name)}")
+
+
+class AgentServerBackend(Backend):
+    """Servers as bare network namespaces held by a single agent process (server_agent.py).
+
+    Nothing runs per server: the agent creates the namespaces and answers every ping (natively, from a raw
+    ICMP socket), traceroute and iperf3 request for all servers over one Unix socket connection. The agent
+    is started on first use unless one is already listening. Only servers can run here; use it as the
+    server backend next to a switch backend, e.g. FatTree(k, folder, server_backend=AgentServerBackend()).
+    """
+
+    name = 'agent'
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, prefix: str = DEFAULT_PREFIX, start_timeout: float = 10.0):
+        """
+        Args:
+            socket_path (str): Unix socket of the agent
+            prefix (str): prefix of the agent's namespace names
+            start_timeout (float): seconds to wait for a freshly started agent to listen
+        """
+        self.socket_path = socket_path
+        self.prefix = prefix
+        self.start_timeout = start_timeout
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self) -> AgentClient:
+        """Connection to the agent, starting the agent first if nothing listens on the socket"""
+        with self._lock:
+            if self._client is None:
+                try:
+                    self._client = AgentClient(self.socket_path)
+                except OSError:
+                    self._client = self._start_agent()
+            return self._client
+
+    def _start_agent(self) -> AgentClient:
+        agent = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server_agent.py')
+        subprocess.Popen([sys.executable, agent, '--socket', self.socket_path, '--prefix', self.prefix],
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        deadline = time.monotonic() + self.start_timeout
+        while True:
+            try:
+                return AgentClient(self.socket_path)
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise AgentError(f"server agent did not start listening on {self.socket_path}")
+                time.sleep(0.1)
+
+    def prepare(self, policy: PullPolicy = PullPolicy.IF_MISSING):
+        self.client()
+
+    def create(self, node: Node):
+        if node.role != 'server':
+            raise ValueError(f"{node.name}: the agent backend only runs servers")
+        self.client().request('create', server=node.container_name)
+        node.container = f"{self.prefix}{node.container_name}"
+        print(f"Successfully started {node.container}!")
+
+    def attach(self, node: Node):
+        self.create(node)
+
+    def running(self) -> Dict[str, str]:
+        names = (self.node_name(server) for server in self.client().request('list')['servers'])
+        return {name: 'server' for name in names if name is not None}
+
+    def remove(self, node: Node):
+        if node.container is None:
+            return
+        self.remove_by_name(node.name)
+        print(f"Removed {node.container}")
+        node.container = None
+
+    def remove_by_name(self, name: str):
+        self.client().request('remove', server=self.instance_name(name))
+
+    def restart(self, node: Node):
+        """Nothing runs per server, so there is nothing to restart"""
+
+    @staticmethod
+    def _simple_ping(args: List[str]) -> Optional[dict]:
+        """Arguments of the native ping if the command is a plain `ping [-c N] target`, else None"""
+        if len(args) == 2 and args[0] == 'ping':
+            return {'target': args[1]}
+        if len(args) == 4 and args[0] == 'ping' and args[1] == '-c' and args[2].isdigit():
+            return {'target': args[3], 'count': int(args[2])}
+        return None
+
+    def exec(self, node: Node, command) -> ExecResult:
+        args = shlex.split(command) if isinstance(command, str) else list(command)
+        ping = self._simple_ping(args)
+        if ping is not None:
+            response = self.client().request('ping', server=node.container_name, **ping)
+        else:
+            response = self.client().request('exec', server=node.container_name, argv=args)
+        return ExecResult(response['exit_code'], response['output'].encode())
+
+    def netns_path(self, node: Node) -> str:
+        return os.path.join(NETNS_DIR, f"{self.prefix}{node.container_name}")
+
+    def shell_argv(self, node: Node) -> List[str]:
+        return ["nsenter", f"--net={self.netns_path(node)}", "sh"]
+
+    def cleanup(self, log):
+        """Deletes the agent's server namespaces of this backend's session; the agent itself keeps running"""
+        for name in self.running():
+            self.remove_by_name(name)
+        log("Removed all agent server namespaces" + (f" of session {self.session}." if self.session else "."))
+
+
+class DryRunLink(dict):
+    def __init__(self, index, ifname):
+        super().__init__(index=index)
+        self.attrs = {'IFLA_IFNAME': ifname}
+
+    def get_attr(self, name):
+        return self.attrs.get(name)
+
+
+class DryRunNetlink:
+    """Records the interfaces created in each namespace so that lookups inside a namespace find them"""
+
+    def __init__(self):
+        self.namespaces = {}  # netns path -> {ifname: index}
+        self._indexes = itertools.count(2)
+        self.calls = 0
+
+    def _add(self, netns_path, ifname):
+        self.namespaces.setdefault(netns_path, {})[ifname] = next(self._indexes)
+
+    def link(self, command, **kwargs):
+        self.calls += 1
+        if command == 'add':
+            self._add(kwargs['net_ns_fd'], kwargs['ifname'])
+            peer = kwargs.get('peer')
+            if peer:
+                self._add(peer['net_ns_fd'], peer['ifname'])
+
+    def close(self):
+        pass
+
+
+class DryRunNamespaceSocket:
+    def __init__(self, netlink: DryRunNetlink, netns_path: str):
+        self.netlink = netlink
+        self.interfaces = netlink.namespaces.setdefault(netns_path, {})
+
+    def get_links(self):
+        return [DryRunLink(index, ifname) for ifname, index in self.interfaces.items()]
+
+    def link_lookup(self, ifname):
+        return [self.interfaces[ifname]] if ifname in self.interfaces else []
+
+    def link(self, command, **kwargs):
+        self.netlink.calls += 1
+
+    def addr(self, command, **kwargs):
+        self.netlink.calls += 1
+
+    def route(self, command, **kwargs):
+        self.netlink.calls += 1
+
+    def get_addr(self, **kwargs):
+        return []
+
+    def get_routes(self, **kwargs):
+        return []
+
+    def close(self):
+        pass
+
+
+class DryRunBackend(Backend):
+    """Creates nothing and only records what would have been done, in operations.
+
+    Netlink calls go to an in-memory netlink (DryRunNetlink) that remembers the interfaces created in each
+    namespace, so link creation and lookups run through the real code paths. Commands succeed with no
+    output. Needs neither docker nor root, e.g. for benchmarks/bench_scaling.py.
+    """
+
+    name = 'dry-run'
+    runs_routing = False
+
+    def __init__(self, record: bool = True):
+        """
+        Args:
+            record (bool): keep the operations list; a large fabric execs and creates a lot of nodes
+        """
+        self.record = record
+        self.operations: List[tuple] = [] # (operation, node name or None, detail)
+        self.netlink = DryRunNetlink()
+        self._lock = threading.Lock()
+
+    def _record(self, operation: str, name: Optional[str], detail=None):
+        if self.record:
+            with self._lock:
+                self.operations.append((operation, name, detail))
+
+    def prepare(self, policy: PullPolicy = PullPolicy.IF_MISSING):
+        self._record('prepare', None, policy.value)
+
+    def create(self, node: Node):
+        node.container = node.container_name
+        self._record('create', node.name, node.role)
+
+    def attach(self, node: Node):
+        node.container = node.container_name
+        self._record('attach', node.name, node.role)
+
+    def remove(self, node: Node):
+        if node.container is None:
+            return
+        self._record('remove', node.name)
+        node.container = None
+
+    def remove_by_name(self, name: str):
+        self._record('remove', name)
+
+    def restart(self, node: Node):
+        self._record('restart', node.name)
+
+    def pause(self, node: Node):
+        self._record('pause', node.name)
+
+    def unpause(self, node: Node):
+        self._record('unpause', node.name)
+
+    def exec(self, node: Node, command) -> ExecResult:
+        self._record('exec', node.name, command if isinstance(command, str) else " ".join(command))
+        return ExecResult(0, b"")
+
+    def netns_path(self, node: Node) -> str:
+        return f"dry-run:{node.name}"
+
+    @contextmanager
+    def netns_socket(self, node: Node):
+        yield DryRunNamespaceSocket(self.netlink, self.netns_path(node))
+
+    def host_netlink(self):
+        return self.netlink
+
+    def cleanup(self, log):
+        self._record('cleanup', None)
+
+
+BACKENDS = {backend.name: backend for backend in (DockerBackend, NetnsBackend, AgentServerBackend, DryRunBackend)}
+
+
+def get_backend(name: str) -> Backend:
+    """Creates a backend by name: 'docker', 'netns', 'agent' (servers only) or 'dry-run'"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}', expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
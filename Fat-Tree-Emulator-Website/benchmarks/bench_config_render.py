@@ -0,0 +1,64 @@
+# bench_config_render.py
+#
+# Times frr.conf generation for every switch of a k-ary fat tree, without docker or root:
+#     python3 benchmarks/bench_config_render.py --k 48
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fat_tree import FatTree
+from frr_renderer import FrrRenderer
+
+
+def build_model(k: int, address_plan=None) -> FatTree:
+    """Builds the node/link model and assigns IPs, with the per-node log lines silenced"""
+    fat_tree = FatTree(k, "bench_configs", address_plan=address_plan)
+    with contextlib.redirect_stdout(io.StringIO()):
+        fat_tree.generate_core_switches()
+        fat_tree.generate_pods()
+        fat_tree.connect_pods_and_core()
+        fat_tree.generate_ips()
+    return fat_tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FRR config rendering benchmark")
+    parser.add_argument("--k", type=int, default=48)
+    parser.add_argument("--address-plan", choices=["sequential", "hierarchical"], default=None)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    fat_tree = build_model(args.k, args.address_plan)
+    switches = fat_tree.all_switches()
+    renderer = FrrRenderer(fat_tree.link_table)
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        configs = renderer.render_all(switches)
+        timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    per_switch = {switch.name: switch.generate_frr_config() for switch in switches}
+    per_switch_time = time.perf_counter() - start
+
+    if per_switch != configs:
+        mismatched = [name for name in configs if configs[name] != per_switch[name]]
+        raise SystemExit(f"render_all and render_switch disagree for {len(mismatched)} switches, e.g. {mismatched[:3]}")
+
+    total_bytes = sum(len(config) for config in configs.values())
+    print(f"k={args.k} ({fat_tree.address_plan.name} plan): {len(switches)} switches, {len(fat_tree.link_table)} links, "
+          f"{total_bytes / 1e6:.1f} MB of config")
+    print(f"render_all:             best {min(timings) * 1000:.1f} ms, mean {sum(timings) / len(timings) * 1000:.1f} ms "
+          f"over {args.repeat} runs")
+    print(f"per-switch render loop: {per_switch_time * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
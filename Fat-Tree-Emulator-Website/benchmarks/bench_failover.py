@@ -0,0 +1,49 @@
+# bench_failover.py
+#
+# Builds a fat tree, fails a link, a core switch and a paused aggregation switch one after the other while
+# probing server pairs across pods, and writes the JSON report. Needs docker and root:
+#     sudo python3 benchmarks/bench_failover.py --k 4 --output failover_k4.json
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fat_tree import FatTree
+from failover import FailoverBenchmark, FaultEvent
+
+
+def default_events(fat_tree: FatTree, hold: float, settle: float):
+    pod = fat_tree.pods[0]
+    return [
+        FaultEvent('link', (pod.aggregation_switches[0].name, pod.edge_switches[0].name), hold=hold, settle=settle),
+        FaultEvent('switch', fat_tree.core_switches[0].name, mode='links', hold=hold, settle=settle),
+        FaultEvent('switch', fat_tree.pods[1].aggregation_switches[0].name, mode='pause', hold=hold, settle=settle),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Failure injection and reconvergence benchmark")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between probes")
+    parser.add_argument("--hold", type=float, default=15.0, help="seconds each fault stays in place")
+    parser.add_argument("--settle", type=float, default=15.0, help="seconds after each restore")
+    parser.add_argument("--output", default="failover_report.json")
+    args = parser.parse_args()
+
+    fat_tree = FatTree(args.k, f"configs/configs_k{args.k}")
+    fat_tree.build_fat_tree()
+
+    # first server of pod 0 to the first server of every other pod
+    source = fat_tree.pods[0].servers[0].name
+    pairs = [(source, pod.servers[0].name) for pod in fat_tree.pods[1:]]
+
+    benchmark = FailoverBenchmark(fat_tree, pairs, interval=args.interval)
+    report = benchmark.run(default_events(fat_tree, args.hold, args.settle))
+    FailoverBenchmark.save_report(report, args.output)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
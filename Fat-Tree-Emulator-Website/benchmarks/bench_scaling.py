@@ -0,0 +1,114 @@
+# bench_scaling.py
+#
+# Times every Python-side stage of a build for a range of k on the dry-run backend (backends.DryRunBackend),
+# and records the peak memory of each stage with tracemalloc. No docker or root needed:
+#     python3 benchmarks/bench_scaling.py --k 4 8 16 32 64 --output scaling.json
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import DryRunBackend
+from fat_tree import FatTree
+
+STAGES = ["construct", "generate_ips", "generate_configs", "create_containers", "create_veth_connections", "plot"]
+
+
+def run_stages(k: int, stages, measure_memory: bool) -> dict:
+    """Runs the selected stages for one k inside a temporary working directory"""
+    results = {}
+    fat_tree = None
+
+    def construct():
+        nonlocal fat_tree
+        # the operation log would be billed to the stages, only the netlink bookkeeping is kept
+        fat_tree = FatTree(k, "configs", switch_backend=DryRunBackend(record=False))
+        fat_tree.generate_core_switches()
+        fat_tree.generate_pods()
+        fat_tree.connect_pods_and_core()
+
+    steps = {
+        "construct": construct,
+        "generate_ips": lambda: fat_tree.generate_ips(),
+        "generate_configs": lambda: fat_tree.generate_configs(),
+        "create_containers": lambda: fat_tree.create_containers(),
+        "create_veth_connections": lambda: fat_tree.create_veth_connections(),
+        "plot": lambda: fat_tree.generate_topology_graph_plotly(),
+    }
+
+    # every later stage needs the model, and links need containers
+    required = {"construct"}
+    if set(stages) - {"construct"}:
+        required.add("generate_ips")
+    if "create_veth_connections" in stages:
+        required.add("create_containers")
+
+    with tempfile.TemporaryDirectory() as workdir, open(os.devnull, "w") as devnull:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            for stage in STAGES:
+                if stage not in stages and stage not in required:
+                    continue
+                if measure_memory:
+                    tracemalloc.reset_peak()
+                    before, _ = tracemalloc.get_traced_memory()
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(devnull):
+                    steps[stage]()
+                seconds = time.perf_counter() - start
+                if stage not in stages:
+                    continue
+                results[stage] = {'seconds': seconds}
+                if measure_memory:
+                    current, peak = tracemalloc.get_traced_memory()
+                    results[stage]['peak_mb'] = (peak - before) / 1e6
+                    results[stage]['retained_mb'] = (current - before) / 1e6
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling benchmark of the build stages over k (no docker needed)")
+    parser.add_argument("--k", type=int, nargs="+", default=[4, 8, 16, 24, 32, 48, 64])
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip tracemalloc, which slows allocation heavy stages down")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    measure_memory = not args.no_memory
+    if measure_memory:
+        tracemalloc.start()
+
+    # imports and one time tables (e.g. the address string table) would otherwise be billed to the first k
+    run_stages(4, args.stages, measure_memory=False)
+
+    report = {}
+    header = f"{'k':>4}  {'stage':<26}{'seconds':>10}" + (f"{'peak MB':>10}{'kept MB':>10}" if measure_memory else "")
+    print(header)
+    for k in args.k:
+        results = run_stages(k, args.stages, measure_memory)
+        report[k] = results
+        for stage, result in results.items():
+            line = f"{k:>4}  {stage:<26}{result['seconds']:>10.3f}"
+            if measure_memory:
+                line += f"{result['peak_mb']:>10.1f}{result['retained_mb']:>10.1f}"
+            print(line, flush=True)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# config_writer.py
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+MANIFEST_NAME = ".manifest.json"
+
+
+def atomic_write(path: str, content: str):
+    """Writes a file through a temp file in the same folder plus rename, so readers never see a partial file"""
+    folder = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as tmp_file:
+            tmp_file.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def content_hash(files: Dict[str, str]) -> str:
+    """sha256 over the names and contents of a node's config files"""
+    digest = hashlib.sha256()
+    for name in sorted(files):
+        digest.update(name.encode())
+        digest.update(b"\0")
+        digest.update(files[name].encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ConfigWriter:
+    """Writes per-switch config folders, skipping every switch whose content hash matches the manifest.
+
+    The manifest (root_folder/.manifest.json) maps switch names to the hash of their last written files.
+    Changed folders are written concurrently with atomic writes, folders of switches that are no longer
+    part of the topology are removed, and the list of changed switches tells callers which running FRR
+    daemons need a reload.
+    """
+
+    def __init__(self, root_folder: str, max_workers: int = 8, log: Optional[Callable] = None):
+        """
+        Args:
+            root_folder (str): folder holding one sub folder per switch
+            max_workers (int): number of folders written concurrently
+            log (function): Called with a message for every written or removed folder.
+        """
+        self.root_folder = Path(root_folder)
+        self.manifest_path = self.root_folder / MANIFEST_NAME
+        self.max_workers = max_workers
+        self.log = log or print
+
+    def load_manifest(self) -> Dict[str, str]:
+        if not self.manifest_path.exists():
+            return {}
+        try:
+            return json.loads(self.manifest_path.read_text())
+        except (OSError, ValueError):
+            # a corrupt manifest only costs a full rewrite
+            return {}
+
+    @staticmethod
+    def _write_folder(folder: str, files: Dict[str, str]):
+        os.makedirs(folder, exist_ok=True)
+        for name, content in files.items():
+            atomic_write(os.path.join(folder, name), content)
+
+    def write(self, switches: List, rendered: Optional[Dict[str, Dict[str, str]]] = None) -> List[str]:
+        """Writes the config folder of every switch whose files changed.
+
+        Args:
+            switches (List[Switch]): every switch of the topology
+            rendered (Dict[str, Dict[str, str]]): switch name -> files, rendered up front (e.g. by FrrRenderer).
+                Switches missing from it render their own files.
+
+        Returns:
+            List[str]: names of the switches whose files were (re)written
+        """
+        self.root_folder.mkdir(parents=True, exist_ok=True)
+        manifest = self.load_manifest()
+        new_manifest = {}
+        pending = []
+        for switch in switches:
+            files = rendered.get(switch.name) if rendered else None
+            if files is None:
+                files = switch.generate_config_files()
+            digest = content_hash(files)
+            new_manifest[switch.name] = digest
+            up_to_date = manifest.get(switch.name) == digest and all(
+                os.path.exists(os.path.join(switch.folder_path, name)) for name in files
+            )
+            if not up_to_date:
+                pending.append((switch, files))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self._write_folder, switch.folder_path, files) for switch, files in pending]
+            for future in futures:
+                future.result()
+        for switch, _ in pending:
+            self.log(f"Generated config for {switch.name}")
+
+        for folder in self.root_folder.iterdir():
+            if folder.is_dir() and folder.name not in new_manifest:
+                shutil.rmtree(folder)
+                self.log(f"Removed old config folder: {folder.name}")
+
+        atomic_write(str(self.manifest_path), json.dumps(new_manifest, indent=2, sort_keys=True))
+        return [switch.name for switch, _ in pending]
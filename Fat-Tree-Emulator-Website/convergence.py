@@ -0,0 +1,187 @@
+# convergence.py
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from node import Switch
+from link_table import ip_to_int
+
+
+class ConvergenceError(Exception):
+    """Raised when the fabric does not converge within the timeout"""
+    pass
+
+
+def parse_bgp_peers(output: str) -> Dict[str, str]:
+    """Parses `vtysh -c 'show bgp summary json'`.
+
+    Returns:
+        Dict[str, str]: neighbor address -> session state (e.g. 'Established', 'Active')
+    """
+    try:
+        summary = json.loads(output)
+    except ValueError:
+        return {}
+    peers = summary.get('ipv4Unicast', {}).get('peers', {})
+    return {address: peer.get('state', 'Unknown') for address, peer in peers.items()}
+
+
+def parse_installed_routes(output: str) -> List[str]:
+    """Parses `vtysh -c 'show ip route json'`.
+
+    Returns:
+        List[str]: prefixes that have at least one route installed in the kernel (or are connected)
+    """
+    try:
+        routes = json.loads(output)
+    except ValueError:
+        return []
+    return [
+        prefix for prefix, entries in routes.items()
+        if any(entry.get('installed') or entry.get('protocol') == 'connected' for entry in entries)
+    ]
+
+
+def covered(expected: np.ndarray, prefixes: List[str]) -> np.ndarray:
+    """Which of the expected /30 subnets fall inside at least one of the given prefixes.
+
+    Args:
+        expected (np.ndarray): subnet addresses as uint32
+        prefixes (List[str]): installed prefixes in CIDR notation. Default routes are ignored, they cover
+            everything without telling whether the subnet itself was learned.
+
+    Returns:
+        np.ndarray: boolean mask over expected
+    """
+    by_length: Dict[int, List[int]] = {}
+    for prefix in prefixes:
+        address, _, length = prefix.partition('/')
+        length = int(length or 32)
+        if 0 < length <= 30:
+            by_length.setdefault(length, []).append(ip_to_int(address))
+    mask = np.zeros(len(expected), dtype=bool)
+    for length, networks in by_length.items():
+        netmask = np.uint32((0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF)
+        mask |= np.isin(expected & netmask, np.asarray(networks, dtype=np.uint32) & netmask)
+    return mask
+
+
+class ConvergenceMonitor:
+    """Polls every FRR switch until the fabric is usable and records when each switch got there.
+
+    A switch has converged once every BGP session to its switch neighbors is Established and every
+    server subnet of the fabric is covered by an installed route (its own connected /30, a learned /30
+    or a summary such as a pod prefix). All unconverged switches are polled concurrently each round;
+    a switch's convergence time is the first poll at which it was converged, measured from start_time.
+    """
+
+    def __init__(self, fat_tree, max_workers: int = 16, poll_interval: float = 1.0, timeout: float = 120.0,
+                 progress_callback: Optional[Callable] = None):
+        """
+        Args:
+            fat_tree (FatTree): built fabric, with the link table and running FRR containers
+            max_workers (int): maximum number of switches polled at once
+            poll_interval (float): seconds between the start of two polling rounds
+            timeout (float): seconds after start_time to give up
+            progress_callback (function): Called as progress_callback(switch, seconds, done, total) when a switch converges.
+        """
+        self.fat_tree = fat_tree
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.progress_callback = progress_callback
+
+        table = fat_tree.link_table
+        is_server = np.fromiter((not isinstance(node, Switch) for node in table.nodes), dtype=bool,
+                                count=len(table.nodes))
+        # edge <-> server links, every server sits on the b-side of its link
+        self.server_subnets = table.ip_a[is_server[table.endpoint_b]] & np.uint32(0xFFFFFFFC)
+
+    @staticmethod
+    def expected_neighbors(switch: Switch) -> List[str]:
+        """Addresses of the BGP neighbors configured on a switch"""
+        return [peer.connections[switch] for peer in switch.connections if isinstance(peer, Switch)]
+
+    def check(self, switch: Switch) -> dict:
+        """Polls one switch.
+
+        Returns:
+            dict: 'converged', 'established' and 'neighbors' counts, 'down' neighbors and the number of
+            'missing' server subnets
+        """
+        summary, table = switch.exec_batch([["vtysh", "-c", "show bgp summary json"],
+                                            ["vtysh", "-c", "show ip route json"]])
+        peers = parse_bgp_peers(summary.output.decode(errors='replace'))
+        routes = parse_installed_routes(table.output.decode(errors='replace'))
+        neighbors = self.expected_neighbors(switch)
+        down = [address for address in neighbors if peers.get(address) != 'Established']
+        missing = int(np.count_nonzero(~covered(self.server_subnets, routes)))
+        return {
+            'converged': not down and missing == 0,
+            'neighbors': len(neighbors),
+            'established': len(neighbors) - len(down),
+            'down': down,
+            'missing': missing,
+        }
+
+    def run(self, start_time: Optional[float] = None) -> dict:
+        """Polls until every switch converged or the timeout expired.
+
+        Args:
+            start_time (float): time.monotonic() at which the fabric came up, defaults to now
+
+        Returns:
+            dict: 'converged' (bool), 'fabric_seconds' (time until the last switch converged, None if it never did),
+            'polls' (rounds), 'unconverged' switch names and 'switches', mapping each switch name to its
+            'seconds' (None if it never converged) and last check result
+        """
+        start_time = time.monotonic() if start_time is None else start_time
+        switches = self.fat_tree.all_switches()
+        total = len(switches)
+        metrics = {switch.name: {'seconds': None} for switch in switches}
+        pending = list(switches)
+        polls = 0
+        done = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending:
+                round_start = time.monotonic()
+                polls += 1
+                results = list(pool.map(self._safe_check, pending))
+                now = time.monotonic()
+                still_pending = []
+                for switch, result in zip(pending, results):
+                    checked_at = result.pop('checked_at')
+                    metrics[switch.name].update(result)
+                    if result['converged']:
+                        seconds = checked_at - start_time
+                        metrics[switch.name]['seconds'] = seconds
+                        done += 1
+                        if self.progress_callback:
+                            self.progress_callback(switch, seconds, done, total)
+                    else:
+                        still_pending.append(switch)
+                pending = still_pending
+                if not pending or now - start_time >= self.timeout:
+                    break
+                time.sleep(max(0.0, self.poll_interval - (time.monotonic() - round_start)))
+
+        converged = not pending
+        return {
+            'converged': converged,
+            'fabric_seconds': max((m['seconds'] for m in metrics.values()), default=0.0) if converged else None,
+            'polls': polls,
+            'unconverged': [switch.name for switch in pending],
+            'switches': metrics,
+        }
+
+    def _safe_check(self, switch: Switch) -> dict:
+        # a container that is still starting fails vtysh, which just means not converged yet
+        try:
+            result = self.check(switch)
+        except Exception as e:
+            result = {'converged': False, 'error': str(e)}
+        result['checked_at'] = time.monotonic()
+        return result
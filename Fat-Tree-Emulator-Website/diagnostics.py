@@ -0,0 +1,116 @@
+# diagnostics.py
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional, Tuple
+
+KINDS = ('ping', 'traceroute')
+MAX_BATCH_PAIRS = 4096 # all-to-all of a k=8 fat tree (128 servers) is already 16256 pairs
+
+
+def batch_pairs(fat_tree, pairs: Optional[List] = None, patterns: Optional[List[dict]] = None) -> List[Tuple[str, str]]:
+    """Expands the pairs and patterns of a diagnostics request into (source, destination) server names.
+
+    Args:
+        fat_tree (FatTree): the fabric the servers belong to
+        pairs (List): [source, destination] server names
+        patterns (List[dict]): {'source_pod': int, 'destination_pod': int}, every server of the source pod to
+            every server of the destination pod. A missing or None pod stands for all pods.
+
+    Returns:
+        List[Tuple[str, str]]: distinct pairs in request order, without pairs of a server with itself
+
+    Raises:
+        ValueError: Raised for malformed pairs or patterns, unknown servers or pods, and for batches of more than
+            MAX_BATCH_PAIRS pairs
+    """
+    for name, value in (('pairs', pairs), ('patterns', patterns)):
+        if value is not None and not isinstance(value, list):
+            raise ValueError(f"Expected a list of {name}, got {type(value).__name__}")
+
+    expanded = []
+    for pair in pairs or []:
+        if not isinstance(pair, (list, tuple)) or len(pair) != 2 or not all(isinstance(name, str) for name in pair):
+            raise ValueError(f"Expected a [source, destination] pair of server names, got {pair}")
+        for name in pair:
+            if fat_tree.find_server_by_name(name) is None:
+                raise ValueError(f"Server '{name}' not found")
+        expanded.append(tuple(pair))
+
+    def servers_of(pod_num):
+        if pod_num is None:
+            return fat_tree.node_index.server_names
+        if not isinstance(pod_num, int) or isinstance(pod_num, bool) or not 0 <= pod_num < len(fat_tree.pods):
+            raise ValueError(f"Pod {pod_num!r} not found, the fat tree has pods 0 to {len(fat_tree.pods) - 1}")
+        return [server.name for server in fat_tree.node_index.nodes(pod=pod_num, layer='server')]
+
+    for pattern in patterns or []:
+        if not isinstance(pattern, dict):
+            raise ValueError(f"Expected a {{'source_pod', 'destination_pod'}} pattern, got {pattern}")
+        sources = servers_of(pattern.get('source_pod'))
+        destinations = servers_of(pattern.get('destination_pod'))
+        # the distinct pairs of this pattern alone, checked before expanding it (all-to-all of k=70 is 7e9)
+        if len(sources) * len(destinations) - min(len(sources), len(destinations)) > MAX_BATCH_PAIRS:
+            raise ValueError(f"A batch may hold at most {MAX_BATCH_PAIRS} pairs")
+        expanded.extend((source, destination) for source in sources for destination in destinations)
+
+    batch = list(dict.fromkeys(pair for pair in expanded if pair[0] != pair[1]))
+    if len(batch) > MAX_BATCH_PAIRS:
+        raise ValueError(f"A batch may hold at most {MAX_BATCH_PAIRS} pairs, this one has {len(batch)}")
+    return batch
+
+
+class DiagnosticsBatch:
+    """Runs ping or traceroute (FatTree.ping/FatTree.traceroute) for many server pairs, up to max_parallel at
+    once, and hands every result to a callback as soon as it is in, so callers can stream them.
+    """
+
+    def __init__(self, fat_tree, kind: str, pairs: List[Tuple[str, str]], max_parallel: int = 16,
+                 on_result: Optional[Callable] = None):
+        """
+        Args:
+            fat_tree (FatTree): the fabric to run the commands in
+            kind (str): 'ping' or 'traceroute'
+            pairs (List[Tuple[str, str]]): (source, destination) server names, see batch_pairs
+            max_parallel (int): commands in flight at once
+            on_result (function): Called as on_result(result) with every result, in completion order.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown diagnostic '{kind}', expected one of {list(KINDS)}")
+        self.fat_tree = fat_tree
+        self.kind = kind
+        self.pairs = list(pairs)
+        self.max_parallel = max(1, max_parallel)
+        self.on_result = on_result
+
+    def run(self) -> List[dict]:
+        """Runs the batch.
+
+        Returns:
+            List[dict]: {'source', 'destination', 'success', 'output', 'stats', 'done', 'total'} per pair, in
+            completion order. stats is the ping summary (see parse_ping_summary), None for traceroute.
+        """
+        command = self.fat_tree.ping if self.kind == 'ping' else self.fat_tree.traceroute
+        results = []
+        total = len(self.pairs)
+        with ThreadPoolExecutor(max_workers=min(self.max_parallel, total) or 1) as pool:
+            futures = {pool.submit(command, source, destination): (source, destination)
+                       for source, destination in self.pairs}
+            for future in as_completed(futures):
+                source, destination = futures[future]
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    outcome = {'success': False, 'output': str(e)}
+                result = {
+                    'source': source,
+                    'destination': destination,
+                    'success': outcome['success'],
+                    'output': outcome['output'],
+                    'stats': outcome.get('stats'),
+                    'done': len(results) + 1,
+                    'total': total,
+                }
+                results.append(result)
+                if self.on_result:
+                    self.on_result(result)
+        return results
@@ -0,0 +1,228 @@
+# ecmp.py
+
+import json
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+import numpy as np
+from node import Switch, Server, SwitchType
+from link_table import ip_to_int, int_to_ip
+from throughput import flow_ports, start_iperf3_server, stop_iperf3_server
+
+MAIN_TABLE = 254
+
+
+def read_fib(node) -> List[Tuple[int, int, List[str]]]:
+    """Reads the IPv4 main routing table of a node's namespace over netlink.
+
+    Returns:
+        List[Tuple[int, int, List[str]]]: (network as int, prefix length, next-hop gateways) of every route.
+        Connected routes have no gateway.
+    """
+    routes = []
+    with node.netns_socket() as ns:
+        for route in ns.get_routes(family=socket.AF_INET, table=MAIN_TABLE):
+            destination = route.get_attr('RTA_DST')
+            if destination is None:
+                continue  # default route
+            multipath = route.get_attr('RTA_MULTIPATH')
+            if multipath:
+                gateways = [hop.get_attr('RTA_GATEWAY') for hop in multipath if hop.get_attr('RTA_GATEWAY')]
+            else:
+                gateway = route.get_attr('RTA_GATEWAY')
+                gateways = [gateway] if gateway else []
+            routes.append((ip_to_int(destination), route['dst_len'], gateways))
+    return routes
+
+
+def longest_match(subnets: np.ndarray, routes: List[Tuple[int, int, List[str]]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Finds the most specific route of every subnet.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: number of next hops of the matching route (0 for connected routes) and
+        whether any route matched, both aligned with subnets
+    """
+    hops = np.zeros(len(subnets), dtype=np.int32)
+    matched = np.zeros(len(subnets), dtype=bool)
+    by_length: Dict[int, Dict[int, int]] = {}
+    for network, length, gateways in routes:
+        by_length.setdefault(length, {})[network] = len(gateways)
+    for length in sorted(by_length, reverse=True):
+        netmask = np.uint32((0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF)
+        networks = np.fromiter(by_length[length].keys(), dtype=np.uint32)
+        counts = np.fromiter(by_length[length].values(), dtype=np.int32)
+        order = np.argsort(networks)
+        networks, counts = networks[order], counts[order]
+        masked = subnets & netmask
+        position = np.clip(np.searchsorted(networks, masked), 0, len(networks) - 1)
+        hit = ~matched & (networks[position] == masked)
+        hops[hit] = counts[position[hit]]
+        matched |= hit
+    return hops, matched
+
+
+class EcmpAnalyzer:
+    """Checks that every switch spreads traffic over all equal-cost paths the fat tree offers.
+
+    The expected fan-out towards a server subnet follows from the model: an edge switch reaches everything
+    that is not directly attached through all k/2 aggregation switches of its pod, an aggregation switch
+    reaches other pods through its k/2 core switches and its own pod through exactly one edge switch, and a
+    core switch has one path (the aggregation switch of the destination pod). The installed fan-out is the
+    number of next hops of the longest matching route in the switch's kernel FIB, which is what forwarding
+    actually uses. Note that every switch has its own ASN, so FRR only installs paths through different
+    neighbors as multipath when their AS paths are considered equal.
+    """
+
+    def __init__(self, fat_tree, max_workers: int = 16):
+        """
+        Args:
+            fat_tree (FatTree): built fabric, with the link table and running containers
+            max_workers (int): maximum number of namespaces read at once
+        """
+        self.fat_tree = fat_tree
+        self.max_workers = max_workers
+        table = fat_tree.link_table
+        is_server = np.fromiter((isinstance(node, Server) for node in table.nodes), dtype=bool, count=len(table.nodes))
+        server_links = is_server[table.endpoint_b]
+        # every server subnet with the node id of its edge switch and its pod
+        self.subnets = table.ip_a[server_links] & np.uint32(0xFFFFFFFC)
+        self.subnet_edge = table.endpoint_a[server_links]
+        self.subnet_pod = table.node_pod[self.subnet_edge]
+
+    def expected_fanout(self, switch: Switch) -> np.ndarray:
+        """Expected number of next hops from a switch towards every server subnet (0 where it is connected)"""
+        half = self.fat_tree.k // 2
+        pod = self.fat_tree.link_table.node_pod[switch.node_id]
+        if switch.type == SwitchType.CORE:
+            return np.ones(len(self.subnets), dtype=np.int32)
+        if switch.type == SwitchType.AGGREGATE:
+            return np.where(self.subnet_pod == pod, 1, half).astype(np.int32)
+        return np.where(self.subnet_edge == switch.node_id, 0, half).astype(np.int32)
+
+    def analyze_switch(self, switch: Switch) -> dict:
+        """Compares the installed and the expected fan-out of one switch"""
+        expected = self.expected_fanout(switch)
+        installed, matched = longest_match(self.subnets, read_fib(switch))
+        deficient = (expected > 0) & (installed < expected)
+        missing = (expected > 0) & ~matched
+        examples = [
+            {'subnet': f"{int_to_ip(subnet)}/30", 'expected': int(want), 'installed': int(got)}
+            for subnet, want, got in zip(self.subnets[deficient][:5], expected[deficient][:5], installed[deficient][:5])
+        ]
+        return {
+            'expected_paths': int(expected.max(initial=0)),
+            'min_installed_paths': int(installed[expected > 0].min(initial=0)),
+            'deficient_destinations': int(np.count_nonzero(deficient)),
+            'missing_destinations': int(np.count_nonzero(missing)),
+            'examples': examples,
+        }
+
+    def analyze(self) -> dict:
+        """Reads every switch's FIB in parallel and reports switches with fewer next hops than expected.
+
+        Returns:
+            dict: 'switches' (name -> analyze_switch result), 'deficient' switch names and the number of
+            'destinations' checked per switch
+        """
+        switches = self.fat_tree.all_switches()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = dict(zip((switch.name for switch in switches), pool.map(self.analyze_switch, switches)))
+        deficient = [name for name, result in results.items() if result['deficient_destinations']]
+        for name in deficient:
+            result = results[name]
+            self.fat_tree.log(
+                f"{name}: {result['deficient_destinations']} destination(s) with fewer than "
+                f"{result['expected_paths']} paths (min installed {result['min_installed_paths']})", error=True
+            )
+        self.fat_tree.log(f"ECMP check: {len(deficient)} of {len(switches)} switches below the expected fan-out")
+        return {'destinations': len(self.subnets), 'switches': results, 'deficient': deficient}
+
+    @staticmethod
+    def _tx_bytes(node) -> Dict[str, int]:
+        with node.netns_socket() as ns:
+            return {
+                link.get_attr('IFLA_IFNAME'): link.get_attr('IFLA_STATS64')['tx_bytes']
+                for link in ns.get_links()
+            }
+
+    def link_counters(self) -> Dict[Tuple[str, str], int]:
+        """Bytes sent so far over every switch-to-switch link, per direction: (from, to) -> tx bytes"""
+        switches = self.fat_tree.all_switches()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            counters = dict(zip(switches, pool.map(self._tx_bytes, switches)))
+        return {
+            (switch.name, peer.name): counters[switch].get(switch.veth_name(peer), 0)
+            for switch in switches for peer in switch.connections if isinstance(peer, Switch)
+        }
+
+    def load_test(self, pairs: List[Tuple[str, str]], parallel: int = 8, duration: int = 10,
+                  bins: int = 10) -> dict:
+        """Drives parallel TCP flows between server pairs and histograms how evenly the bytes spread over links.
+
+        Switches are set to hash on L4 ports (fib_multipath_hash_policy=1), so the `iperf3 -P` streams of a
+        pair, which all use different source ports, can take different paths.
+
+        Args:
+            pairs (List[Tuple[str, str]]): (client, server) names; all clients run at the same time
+            parallel (int): streams per pair
+            duration (int): seconds per run
+            bins (int): histogram bins
+
+        Returns:
+            dict: per tier ('edge-agg', 'agg-core') the byte histogram, mean, max/mean ratio and coefficient of
+            variation over all directed links, plus the received Gbps of every pair
+        """
+        switches = self.fat_tree.all_switches()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            list(pool.map(lambda switch: switch.exec_run("sysctl -w net.ipv4.fib_multipath_hash_policy=1"),
+                          switches))
+            # one iperf3 server per flow, so pairs sharing a destination do not find it busy
+            ports = flow_ports(pairs)
+            listening = sorted({(pair[1], port) for pair, port in zip(pairs, ports)})
+            list(pool.map(lambda server_port: start_iperf3_server(self.fat_tree.find_server_by_name(server_port[0]),
+                                                                  server_port[1]), listening))
+
+        def run_pair(pair_port):
+            pair, port = pair_port
+            client = self.fat_tree.find_server_by_name(pair[0])
+            server = self.fat_tree.find_server_by_name(pair[1])
+            result = client.exec_run(f"iperf3 -J -c {server.ip} -p {port} -P {parallel} -t {duration}")
+            try:
+                report = json.loads(result.output.decode())
+                return report['end']['sum_received']['bits_per_second'] / 1e9
+            except (ValueError, KeyError):
+                return None
+
+        try:
+            before = self.link_counters()
+            with ThreadPoolExecutor(max_workers=max(1, len(pairs))) as pool:
+                throughput = list(pool.map(run_pair, zip(pairs, ports)))
+            after = self.link_counters()
+        finally:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                list(pool.map(lambda server_port: stop_iperf3_server(self.fat_tree.find_server_by_name(server_port[0]),
+                                                                     server_port[1]), listening))
+
+        tiers = {'edge-agg': [], 'agg-core': []}
+        nodes = {switch.name: switch for switch in switches}
+        for link, sent in after.items():
+            types = {nodes[link[0]].type, nodes[link[1]].type}
+            tier = 'agg-core' if SwitchType.CORE in types else 'edge-agg'
+            tiers[tier].append(sent - before.get(link, 0))
+
+        histograms = {}
+        for tier, values in tiers.items():
+            values = np.asarray(values, dtype=np.float64)
+            mean = float(values.mean()) if values.size else 0.0
+            counts, edges = np.histogram(values, bins=bins) if values.size else (np.array([]), np.array([]))
+            histograms[tier] = {
+                'links': int(values.size),
+                'mean_bytes': mean,
+                'max_over_mean': float(values.max() / mean) if mean else None,
+                'cv': float(values.std() / mean) if mean else None,
+                'histogram': {'counts': counts.tolist(), 'bin_edges': edges.tolist()},
+            }
+        return {
+            'pairs': {f"{a}->{b}": gbps for (a, b), gbps in zip(pairs, throughput)},
+            'tiers': histograms,
+        }
@@ -0,0 +1,287 @@
+# exec_mux.py
+
+import asyncio
+import importlib
+import os
+import shlex
+import signal
+import sys
+import uuid
+from typing import Callable, Dict, List, Optional
+from backends import ExecResult
+
+MARK = b"__exec_mux__"
+
+
+class ExecMuxError(Exception):
+    """Raised when a shell session dies while a command runs in it"""
+
+
+def _original(name: str):
+    """The module as it was before eventlet monkey patched it (app.py does), or just the module"""
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return importlib.import_module(name)
+    return patcher.original(name)
+
+
+def _wait(event, timeout: Optional[float] = None) -> bool:
+    """Waits for an event set by the mux thread. Green threads hand the wait to eventlet's pool of real
+    threads, so the hub keeps running the other green threads in the meantime."""
+    try:
+        from eventlet import patcher, tpool
+        if patcher.is_monkey_patched('thread'):
+            return tpool.execute(event.wait, timeout)
+    except ImportError:
+        pass
+    return event.wait(timeout)
+
+
+def _script(commands: List[str], token: str) -> bytes:
+    """Shell input running the commands one after the other. Every command runs in a subshell (so an exit or
+    cd does not touch the session) reading /dev/null instead of the session's stdin, and is followed by a
+    newline and a marker line carrying the token and its exit code."""
+    parts = [f"( {command}\n) </dev/null 2>&1; printf '\\n%s %d\\n' '{MARK.decode()}{token}' $?\n"
+             for command in commands]
+    return "".join(parts).encode()
+
+
+class ShellSession:
+    """One long-lived shell inside a node, e.g. `docker exec -i <container> sh`, that runs commands sent to
+    its stdin without paying for a new exec per command."""
+
+    def __init__(self, argv: List[str], prelude: Optional[str] = None):
+        self.argv = argv
+        self.prelude = prelude
+        self.process = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def open(self):
+        self.process = await asyncio.create_subprocess_exec(
+            *self.argv, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT, limit=2 ** 20, start_new_session=True
+        )
+        if self.prelude:
+            self.process.stdin.write(self.prelude.encode() + b"\n")
+
+    async def run(self, commands: List[str], on_line: Optional[Callable] = None) -> List[ExecResult]:
+        """Runs commands in order in one round trip.
+
+        Args:
+            commands (List[str]): shell command lines
+            on_line (function): Called as on_line(index, line) for every output line (bytes, without the
+                newline) as it arrives, index being the command's position in commands.
+
+        Raises:
+            ExecMuxError: Raised if the shell exits before every command finished
+        """
+        token = uuid.uuid4().hex
+        marker = MARK + token.encode() + b" "
+        self.process.stdin.write(_script(commands, token))
+        await self.process.stdin.drain()
+
+        results = []
+        output = bytearray()
+        held = None  # the last line is held back: its newline (or all of it) was added by the marker printf
+        while len(results) < len(commands):
+            line = await self.process.stdout.readline()
+            if not line:
+                raise ExecMuxError(f"shell {' '.join(self.argv)} exited")
+            if line.startswith(marker):
+                if held is not None and held != b"\n":
+                    output += held[:-1]
+                    if on_line:
+                        on_line(len(results), bytes(held[:-1]))
+                results.append(ExecResult(int(line[len(marker):]), bytes(output)))
+                output = bytearray()
+                held = None
+                continue
+            if held is not None:
+                output += held
+                if on_line:
+                    on_line(len(results), bytes(held[:-1]))
+            held = line
+        return results
+
+    def close(self):
+        if self.alive:
+            # the whole group, or a command still running (after a timeout) keeps the output pipe open
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        if self.process is not None:
+            self.process.stdin.close()
+
+
+class _NodeSessions:
+    def __init__(self, size: int):
+        self.idle: List[ShellSession] = []
+        self.semaphore = asyncio.Semaphore(size)
+
+
+_threading = _original('threading')
+
+
+class _Call:
+    # handed between a caller and the mux thread with an unpatched Event only, since eventlet's green locks
+    # must not be touched from the mux thread
+    def __init__(self):
+        self.done = _threading.Event()
+        self.task = None
+        self.result = None
+        self.error = None
+
+
+class ExecMux:
+    """Runs commands inside nodes over persistent shell sessions, from a private asyncio loop.
+
+    Every node gets up to max_per_node shells (opened on demand through its backend's shell_argv, and kept
+    open), each running one request at a time, so at most max_per_node requests per node are in flight; at
+    most max_in_flight run over all nodes. A request may be a batch of commands, which costs one round trip.
+    The loop runs in a real OS thread, so the mux can be used from plain threads and from eventlet green
+    threads alike. Nodes whose backend has no shell (the dry-run backend) fall back to backend.exec.
+
+    Enable it with FatTree.enable_exec_mux(); node.exec_run then goes through it.
+    """
+
+    def __init__(self, max_per_node: int = 2, max_in_flight: int = 64):
+        """
+        Args:
+            max_per_node (int): shells, and therefore requests in flight, per node
+            max_in_flight (int): requests in flight over all nodes
+        """
+        self.max_per_node = max_per_node
+        self.max_in_flight = max_in_flight
+        self.sessions: Dict[object, _NodeSessions] = {}
+        self.shells: List[ShellSession] = []
+        self.loop = None
+        self._thread = None
+        self._host_semaphore = None
+
+    def start(self) -> 'ExecMux':
+        """Starts the loop thread"""
+        if self._thread is not None:
+            return self
+        ready = _threading.Event()
+
+        def serve():
+            self.loop = asyncio.new_event_loop()
+            if sys.version_info < (3, 12) and hasattr(asyncio, 'PidfdChildWatcher'):
+                # the default watcher waits for children from extra threads, which are green under eventlet
+                watcher = asyncio.PidfdChildWatcher()
+                watcher.attach_loop(self.loop)
+                asyncio.get_event_loop_policy().set_child_watcher(watcher)
+            asyncio.set_event_loop(self.loop)
+            self._host_semaphore = asyncio.Semaphore(self.max_in_flight)
+            ready.set()
+            self.loop.run_forever()
+
+        self._thread = _threading.Thread(target=serve, name="exec-mux", daemon=True)
+        self._thread.start()
+        _wait(ready)
+        return self
+
+    async def _run(self, node, commands: List[str], on_line: Optional[Callable]) -> List[ExecResult]:
+        argv = node.backend.shell_argv(node)
+        if argv is None:
+            # only the dry-run backend has no shell, and its exec returns right away
+            return [node.backend.exec(node, command) for command in commands]
+        sessions = self.sessions.get(node)
+        if sessions is None:
+            sessions = self.sessions[node] = _NodeSessions(self.max_per_node)
+        async with sessions.semaphore, self._host_semaphore:
+            session = sessions.idle.pop() if sessions.idle else None
+            if session is None or not session.alive:
+                session = ShellSession(argv, node.backend.shell_prelude(node))
+                await session.open()
+                self.shells = [shell for shell in self.shells if shell.alive] + [session]
+            try:
+                results = await session.run(commands, on_line)
+            except BaseException:
+                # also on timeouts (cancellation): the command may still be running, so the shell is not reused
+                session.close()
+                raise
+            sessions.idle.append(session)
+            return results
+
+    def _call(self, node, commands, on_line=None, timeout: Optional[float] = None) -> List[ExecResult]:
+        if self._thread is None:
+            self.start()
+        commands = [command if isinstance(command, str) else shlex.join(command) for command in commands]
+        call = _Call()
+
+        async def run():
+            try:
+                call.result = await self._run(node, commands, on_line)
+            except Exception as e:
+                call.error = e
+            finally:
+                call.done.set()
+
+        def schedule():
+            call.task = self.loop.create_task(run())
+
+        self.loop.call_soon_threadsafe(schedule)
+        if not _wait(call.done, timeout):
+            self.loop.call_soon_threadsafe(lambda: call.task.cancel())
+            return [ExecResult(124, b"")] * len(commands)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _drop_sessions(self, node):
+        sessions = self.sessions.pop(node, None)
+        if sessions:
+            for session in sessions.idle:
+                session.close()
+
+    def run(self, node, command, timeout: Optional[float] = None, on_line: Optional[Callable] = None) -> ExecResult:
+        """Runs one command inside a node.
+
+        Args:
+            node (Node): node to run it in
+            command (str or List[str]): command line
+            timeout (float): seconds to wait; the result of a command that takes longer has exit code 124
+            on_line (function): Called as on_line(line) with every output line (bytes) as it arrives, from the
+                mux thread
+
+        Returns:
+            ExecResult: exit_code and output (bytes, stdout and stderr), like Node.exec_run
+        """
+        stream = (lambda index, line: on_line(line)) if on_line else None
+        return self._call(node, [command], stream, timeout)[0]
+
+    def run_batch(self, node, commands: List, timeout: Optional[float] = None) -> List[ExecResult]:
+        """Runs several commands in order inside a node in a single round trip"""
+        return self._call(node, list(commands), timeout=timeout)
+
+    def close_node(self, node):
+        """Closes the shells of a node, e.g. before it is removed"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._drop_sessions, node)
+
+    def close(self):
+        """Closes every shell and stops the loop thread"""
+        if self.loop is None:
+            return
+
+        async def stop():
+            for shell in self.shells:
+                shell.close()
+            # reaped (including shells killed after a timeout) before the loop goes away, or their transports
+            # complain about a closed loop
+            await asyncio.gather(*(shell.process.wait() for shell in self.shells))
+            self.sessions.clear()
+            self.shells = []
+            self.loop.stop()
+
+        self.loop.call_soon_threadsafe(lambda: self.loop.create_task(stop()))
+        self._thread.join()
+        self.loop.close()
+        self.loop = None
+        self._thread = None
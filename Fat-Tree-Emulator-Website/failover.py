@@ -0,0 +1,254 @@
+# failover.py
+
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+# reply line of `ping -D`, e.g.
+# [1700000000.123456] 64 bytes from 172.20.0.2: icmp_seq=12 ttl=61 time=0.088 ms
+PING_REPLY = re.compile(r"^\[(?P<timestamp>[\d.]+)\] \d+ bytes from .*icmp_seq=(?P<seq>\d+)")
+PING_TRANSMITTED = re.compile(r"(?P<sent>\d+) packets transmitted")
+BGP_TIMERS = re.compile(r"timers bgp (?P<keepalive>\d+) (?P<hold>\d+)")
+
+
+class FaultEvent:
+    """One failure to inject: fail the target, keep it failed for `hold` seconds, restore it and let the
+    fabric settle for `settle` seconds before the next event."""
+
+    def __init__(self, kind: str, target, mode: str = 'links', hold: float = 10.0, settle: float = 10.0):
+        """
+        Args:
+            kind (str): 'link' or 'switch'
+            target: (name, name) of a link or the name of a switch
+            mode (str): switch failure mode, see FatTree.fail_switch
+            hold (float): seconds the target stays failed
+            settle (float): seconds after the restore before the next event
+        """
+        if kind not in ('link', 'switch'):
+            raise ValueError(f"Unknown fault kind '{kind}', expected 'link' or 'switch'")
+        self.kind = kind
+        self.target = target
+        self.mode = mode
+        self.hold = hold
+        self.settle = settle
+        self.failed_at = None
+        self.restored_at = None
+
+    def fail(self, fat_tree):
+        if self.kind == 'link':
+            fat_tree.fail_link(*self.target)
+        else:
+            fat_tree.fail_switch(self.target, mode=self.mode)
+
+    def restore(self, fat_tree):
+        if self.kind == 'link':
+            fat_tree.restore_link(*self.target)
+        else:
+            fat_tree.restore_switch(self.target)
+
+    def describe(self) -> dict:
+        return {
+            'kind': self.kind,
+            'target': list(self.target) if self.kind == 'link' else self.target,
+            'mode': self.mode if self.kind == 'switch' else None,
+            'hold': self.hold,
+            'settle': self.settle,
+            'failed_at': self.failed_at,
+            'restored_at': self.restored_at,
+        }
+
+
+def parse_timestamped_ping(output: str) -> Tuple[List[Tuple[int, float]], Optional[int]]:
+    """Parses the output of `ping -D`.
+
+    Returns:
+        Tuple[List[Tuple[int, float]], Optional[int]]: (icmp_seq, unix timestamp) of every reply in seq order,
+        and the number of packets sent (None if ping did not print its summary)
+    """
+    replies = {}
+    for line in output.splitlines():
+        match = PING_REPLY.match(line.strip())
+        if match:
+            # duplicates (DUP!) keep the first reply
+            replies.setdefault(int(match.group('seq')), float(match.group('timestamp')))
+    sent = PING_TRANSMITTED.search(output)
+    return sorted(replies.items()), int(sent.group('sent')) if sent else None
+
+
+def loss_windows(replies: List[Tuple[int, float]], sent: Optional[int], start_time: float,
+                 end_time: float) -> List[dict]:
+    """Finds every run of consecutive lost probes.
+
+    A window starts at the last reply before the gap and ends at the first reply after it, so its duration is
+    how long the pair was without connectivity as seen by the probe. Loss before the first reply starts a
+    window at start_time, and a pair without any reply has a single window that never closed.
+
+    Args:
+        replies (List[Tuple[int, float]]): (icmp_seq, timestamp) in seq order
+        sent (int): number of probes sent, to detect loss at the end of the run
+        start_time (float): start of the run, used as the start of a window that was open from the beginning
+        end_time (float): end of the run, used as the end of a window that never closed
+
+    Returns:
+        List[dict]: {'start', 'end', 'duration', 'lost'} per window, 'end' is None if the pair never recovered
+    """
+    if not replies:
+        return [{'start': start_time, 'end': None, 'duration': end_time - start_time, 'lost': sent or 0}]
+    windows = []
+    first_seq, first_timestamp = replies[0]
+    if first_seq > 1:
+        windows.append({'start': start_time, 'end': first_timestamp, 'duration': first_timestamp - start_time,
+                        'lost': first_seq - 1})
+    for (seq, timestamp), (next_seq, next_timestamp) in zip(replies, replies[1:]):
+        if next_seq > seq + 1:
+            windows.append({'start': timestamp, 'end': next_timestamp, 'duration': next_timestamp - timestamp,
+                            'lost': next_seq - seq - 1})
+    if sent is not None and replies[-1][0] < sent:
+        last_seq, last_timestamp = replies[-1]
+        windows.append({'start': last_timestamp, 'end': None, 'duration': end_time - last_timestamp,
+                        'lost': sent - last_seq})
+    return windows
+
+
+class FailoverBenchmark:
+    """Keeps a high-rate ping stream running between server pairs while faults are injected, then reports the
+    loss windows and reconvergence time of every event.
+
+    The probes run `ping -D -i <interval>` inside the source containers for the whole schedule, so every
+    reply carries a host clock timestamp that can be lined up with the fail/restore times. A loss window
+    belongs to every phase it overlaps: after the fail (until the restore) or after the restore (until the
+    next event). The reconvergence time of a phase is the end of its last loss window minus the time of the
+    fail/restore, i.e. how long it took until no more probes of that pair were lost.
+    """
+
+    def __init__(self, fat_tree, pairs: List[Tuple[str, str]], interval: float = 0.01, warmup: float = 5.0):
+        """
+        Args:
+            fat_tree (FatTree): built and converged fabric
+            pairs (List[Tuple[str, str]]): (source, destination) server names to probe
+            interval (float): seconds between probes (below 0.2 needs root inside the container)
+            warmup (float): seconds of probing before the first event
+
+        Raises:
+            ValueError: Raised for an empty pair list and for unknown servers
+        """
+        if not pairs:
+            raise ValueError("A failover benchmark needs at least one (source, destination) pair")
+        for pair in pairs:
+            if len(pair) != 2:
+                raise ValueError(f"Expected a (source, destination) pair, got {pair}")
+            for name in pair:
+                if fat_tree.find_server_by_name(name) is None:
+                    raise ValueError(f"Server '{name}' not found")
+        self.fat_tree = fat_tree
+        self.pairs = pairs
+        self.interval = interval
+        self.warmup = warmup
+
+    def _probe(self, source: str, destination: str, duration: float) -> str:
+        source_server = self.fat_tree.find_server_by_name(source)
+        destination_server = self.fat_tree.find_server_by_name(destination)
+        command = f"ping -D -n -i {self.interval} -w {int(duration) + 1} {destination_server.ip}"
+        return source_server.exec_run(command).output.decode(errors='replace')
+
+    def bgp_timers(self) -> dict:
+        """keepalive/hold timers the switch configs are rendered with (see Switch.generate_frr_config), so reports
+        of different timer settings can be told apart"""
+        switches = self.fat_tree.all_switches()
+        match = BGP_TIMERS.search(switches[0].generate_frr_config()) if switches else None
+        return {key: int(value) for key, value in match.groupdict().items()} if match else {}
+
+    def run(self, events: List[FaultEvent]) -> dict:
+        """Runs the probes, injects every event in order and analyses the result.
+
+        Returns:
+            dict: machine-readable report with the settings, the BGP timers and per event the loss windows and
+            reconvergence times of every pair
+        """
+        duration = self.warmup + sum(event.hold + event.settle for event in events)
+        self.fat_tree.log(f"Failover benchmark: {len(events)} event(s), {len(self.pairs)} pair(s), {duration:.0f}s")
+
+        started_at = time.time()
+        with ThreadPoolExecutor(max_workers=len(self.pairs)) as pool:
+            futures = [pool.submit(self._probe, source, destination, duration) for source, destination in self.pairs]
+            failed = None # event whose target is (possibly partly) failed right now
+            try:
+                time.sleep(self.warmup)
+                for event in events:
+                    event.failed_at = time.time()
+                    failed = event
+                    event.fail(self.fat_tree)
+                    time.sleep(event.hold)
+                    event.restored_at = time.time()
+                    event.restore(self.fat_tree)
+                    failed = None
+                    time.sleep(event.settle)
+            finally:
+                if failed is not None:
+                    # the schedule was aborted, do not leave the fabric broken
+                    try:
+                        failed.restore(self.fat_tree)
+                    except Exception as e:
+                        self.fat_tree.log(f"Could not restore {failed.kind} {failed.target}: {e}", error=True)
+            outputs = [future.result() for future in futures]
+        end_time = time.time()
+
+        probes = {}
+        for (source, destination), output in zip(self.pairs, outputs):
+            replies, sent = parse_timestamped_ping(output)
+            probes[(source, destination)] = {
+                'sent': sent,
+                'received': len(replies),
+                'windows': loss_windows(replies, sent, started_at, end_time),
+            }
+
+        report_events = []
+        for i, event in enumerate(events):
+            next_event = events[i + 1].failed_at if i + 1 < len(events) else end_time
+            phases = {'fail': (event.failed_at, event.restored_at), 'restore': (event.restored_at, next_event)}
+            pairs = {}
+            worst = {'fail': 0.0, 'restore': 0.0}
+            for (source, destination), probe in probes.items():
+                pair_result = {}
+                for phase, (begin, end) in phases.items():
+                    # windows still open when the phase begins count too, e.g. a pair that never got a reply
+                    windows = [window for window in probe['windows']
+                               if window['start'] < end and (window['end'] is None or window['end'] > begin)]
+                    reconvergence = max(((window['end'] or end_time) - begin for window in windows), default=0.0)
+                    worst[phase] = max(worst[phase], reconvergence)
+                    pair_result[phase] = {
+                        'lost': sum(window['lost'] for window in windows),
+                        'loss_windows': windows,
+                        'reconvergence_seconds': reconvergence,
+                    }
+                pairs[f"{source}->{destination}"] = pair_result
+            report_events.append({
+                **event.describe(),
+                'reconvergence_seconds': worst['fail'],
+                'restore_reconvergence_seconds': worst['restore'],
+                'pairs': pairs,
+            })
+            self.fat_tree.log(
+                f"{event.kind} {event.target}: reconverged after {worst['fail']:.2f}s, "
+                f"{worst['restore']:.2f}s after restore"
+            )
+
+        return {
+            'k': self.fat_tree.k,
+            'address_plan': self.fat_tree.address_plan.name,
+            'bgp_timers': self.bgp_timers(),
+            'probe_interval': self.interval,
+            'started_at': started_at,
+            'probes': {
+                f"{source}->{destination}": {'sent': probe['sent'], 'received': probe['received']}
+                for (source, destination), probe in probes.items()
+            },
+            'events': report_events,
+        }
+
+    @staticmethod
+    def save_report(report: dict, path: str):
+        with open(path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
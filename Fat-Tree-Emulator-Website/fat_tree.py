@@ -1,24 +1,58 @@
 # fat_tree.py
 
-import subprocess
-import shutil
+import os
+import time
 from pathlib import Path
 from typing import List
-from node import Switch, Server, SwitchType
+from node import Node, Switch, Server, SwitchType, PullPolicy
+from backends import DockerBackend
+from exec_mux import ExecMux
 from pod import Pod
+from provisioner import ContainerProvisioner
+from link_fabric import LinkFabric, set_link_state
+from reachability import ReachabilityEngine, parse_ping_summary
+from reconcile import TopologyReconciler
+from config_writer import ConfigWriter
+from link_table import LinkTable
+from node_index import NodeIndex
+from address_plan import AddressPlan
+from frr_renderer import FrrRenderer
+from convergence import ConvergenceMonitor, ConvergenceError
+from ecmp import EcmpAnalyzer
+from profiler import BuildProfiler
+from artifact_cache import ArtifactCache, HTML_NAME
+from throughput import (ThroughputSuite, pairwise_pattern, permutation_pattern, all_to_all_pattern,
+                        pod_to_pod_pattern)
 import networkx as nx
 import plotly.graph_objects as go
 from networkx.drawing.nx_agraph import to_agraph
 import plotly.io as pio
 
 class FatTree:
-    def __init__(self, k, config_folder, message_callback=None):
+    def __init__(self, k, config_folder, message_callback=None, max_workers=8, pull_policy=PullPolicy.IF_MISSING,
+                 address_plan=None, profile_dir=None, switch_backend=None, server_backend=None, session=None,
+                 artifact_cache=None):
         """Initializes a fat tree.
 
         Args:
             k (int): k parameter for fat tree, must be even.
             config_folder (str): Base folder where FRR routing configs will be stored.
             message_callback (function): Function to call for emitting messages.
+            max_workers (int): Number of containers that may be created/started concurrently.
+            pull_policy (PullPolicy): When to pull the switch/server images before creating containers.
+            address_plan (str): 'hierarchical' or 'sequential' (see address_plan.py). By default the hierarchical
+                plan is used whenever it fits k.
+            profile_dir (str): Folder to write the build profile to (build_profile.json and build_trace.json, see
+                write_profile). By default the profile is only logged as a summary table.
+            switch_backend (Backend): where switches run (see backends.py), a DockerBackend by default.
+            server_backend (Backend): where servers run, by default the same backend as the switches.
+            session (str): Qualifies the instance names of all nodes (<session>.<node name>) and scopes cleanup and
+                incremental builds to them, so fabrics of different sessions can run side by side. Set on the
+                backends, which therefore must not be shared with a fat tree of another session. Without a session
+                cleanup removes everything earlier builds left on the host.
+            artifact_cache (ArtifactCache): Where the address plan, the rendered configs and the topology HTML of
+                every k are kept (see artifact_cache.py). A build whose k is cached loads them instead of computing
+                them, and store_artifacts adds the ones a build computed.
         """
         if k % 2 != 0:
             raise ValueError("k must be even")
@@ -31,12 +65,33 @@ class FatTree:
         self.num_edge_switches_per_pod = k // 2
         self.num_servers_per_edge_switch = k // 2
         self.root_storage_folder = f"{Path.cwd()}/{config_folder}"
-        self.links = set()
+        self.link_table = None # LinkTable of every link, built by generate_ips
+        self.node_index = None # NodeIndex over the link table, built by generate_ips
+        self.convergence = None # metrics of the last wait_for_convergence
+        self.failed_links = set() # (name, name) pairs taken down by fail_link
+        self.failed_switches = {} # switch name -> mode passed to fail_switch
+        self.profiler = BuildProfiler()
+        self.profile_dir = profile_dir
+        self.address_plan = AddressPlan.for_topology(address_plan, k)
         # Storage for all nodes
         self.core_switches: List[Switch] = []
         self.pods: List[Pod] = [Pod(i) for i in range(self.num_pods)]
         
         self.message_callback = message_callback  # Assign the callback
+        self.max_workers = max_workers
+        self.pull_policy = pull_policy
+        self.switch_backend = switch_backend or DockerBackend()
+        self.server_backend = server_backend or self.switch_backend
+        self.session = session
+        if session:
+            for backend in self.backends():
+                backend.session = session
+        self.exec_mux = None # set by enable_exec_mux
+        self.artifact_cache = artifact_cache
+        self.artifact_key = artifact_cache.key(k, self.address_plan.name) if artifact_cache else None
+        self._artifacts = None # folder of the cache entry of this k, looked up by generate_ips
+        self._cached_configs = None # rendered configs loaded from that entry
+        self._rendered = None # configs rendered by generate_configs, kept for store_artifacts
 
     def get_new_asn(self):
         """Maintains monotonically increasing ASN counter for all switches
@@ -47,6 +102,41 @@ class FatTree:
         self.asn_counter += 1
         return self.asn_counter
     
+    def backends(self) -> list:
+        """The distinct backends nodes run on, switch backend first"""
+        if self.server_backend is self.switch_backend:
+            return [self.switch_backend]
+        return [self.switch_backend, self.server_backend]
+
+    def prepare_backends(self):
+        for backend in self.backends():
+            backend.prepare(self.pull_policy)
+        self.log(f"Prepared {', '.join(backend.name for backend in self.backends())} backend "
+                 f"(pull policy: {self.pull_policy.value})")
+
+    def enable_exec_mux(self, max_per_node=2, max_in_flight=64) -> ExecMux:
+        """Routes every command run inside a node (ping, traceroute, fping, vtysh, iperf3, ...) over persistent
+        shell sessions instead of one exec per command, see ExecMux. Can be called before or after the build.
+
+        Args:
+            max_per_node (int): shells, and therefore commands in flight, per node
+            max_in_flight (int): commands in flight over all nodes
+        """
+        if self.exec_mux is None:
+            self.exec_mux = ExecMux(max_per_node=max_per_node, max_in_flight=max_in_flight).start()
+            for backend in self.backends():
+                backend.exec_mux = self.exec_mux
+            self.log(f"Enabled exec multiplexer ({max_per_node} shells per node, {max_in_flight} commands in flight)")
+        return self.exec_mux
+
+    def all_switches(self) -> List[Switch]:
+        """Core switches followed by each pod's aggregation and edge switches"""
+        switches = list(self.core_switches)
+        for pod in self.pods:
+            switches.extend(pod.aggregation_switches)
+            switches.extend(pod.edge_switches)
+        return switches
+
     def generate_core_switches(self):
         """Create the core switches for the fat tree"""
         for i in range(self.num_core_switches):
@@ -54,7 +144,8 @@ class FatTree:
                 type=SwitchType.CORE,
                 asn=self.get_new_asn(),
                 name=f"C-{i}",
-                config_base=self.root_storage_folder
+                config_base=self.root_storage_folder,
+                backend=self.switch_backend
             )
             self.core_switches.append(core_switch)
             self.log(f"Generated core switch: {core_switch.name}")
@@ -68,7 +159,8 @@ class FatTree:
                     type=SwitchType.AGGREGATE,
                     name=f"A{pod.pod_num}-{i}",
                     asn=self.get_new_asn(),
-                    config_base=self.root_storage_folder
+                    config_base=self.root_storage_folder,
+                    backend=self.switch_backend
                 )
                 pod.aggregation_switches.append(agg_switch)
                 self.log(f"Generated aggregation switch: {agg_switch.name} in Pod {pod.pod_num}")
@@ -79,14 +171,16 @@ class FatTree:
                     type=SwitchType.EDGE,
                     name=f"E{pod.pod_num}-{i}",
                     asn=self.get_new_asn(),
-                    config_base=self.root_storage_folder
+                    config_base=self.root_storage_folder,
+                    backend=self.switch_backend
                 )
                 pod.edge_switches.append(edge_switch)
                 self.log(f"Generated edge switch: {edge_switch.name} in Pod {pod.pod_num}")
                 for j in range(self.num_servers_per_edge_switch):
                     server = Server(
                         name=f"S{pod.pod_num}-{edge_switch.name}-{j}",
-                        config_base=self.root_storage_folder
+                        config_base=self.root_storage_folder,
+                        backend=self.server_backend
                     )
                     pod.servers.append(server)
                     self.log(f"Generated server: {server.name} in Pod {pod.pod_num}")
@@ -108,149 +202,104 @@ class FatTree:
 
     def generate_ips(self):
         """Generates interface IPs for all connections using /30 subnets.
-        Each connection gets its own /30 subnet with 2 usable IPs.
+        All links are collected into a LinkTable (core links first, then each pod's aggregation, edge and
+        server links) and the address plan assigns all of them in one vectorized step.
         """
-        self.current_second_octet = 16
-        self.current_third_octet = 0
-        self.current_fourth_octet = 0
-        
-        def get_next_ip_pair():
-            """Returns a pair of IPs for a point-to-point link"""
-            # In a /30, .0 is network, .3 is broadcast, .1 and .2 are usable
-            ip1 = f"172.{self.current_second_octet}.{self.current_third_octet}.{self.current_fourth_octet + 1}"
-            ip2 = f"172.{self.current_second_octet}.{self.current_third_octet}.{self.current_fourth_octet + 2}"
-            
-            # Increment for next subnet (move by 4 for next /30)
-            self.current_fourth_octet += 4
-            if self.current_fourth_octet >= 256:
-                self.current_fourth_octet = 0
-                self.current_third_octet += 1
-                if self.current_third_octet >= 256:
-                    self.current_third_octet = 0
-                    self.current_second_octet += 1
-                    if self.current_second_octet >= 32:
-                        raise ValueError("IP address space exhausted")
-            
-            return ip1, ip2
-        
-        def assign_connection_ips(node1, node2):
-            """Helper to assign IPs to both ends of a connection"""
-            if node1.connections.get(node2, "") != "":  # Already assigned
-                return
-                
-            ip1, ip2 = get_next_ip_pair()
-            node1.connections[node2] = ip1
-            node2.connections[node1] = ip2
-            self.log(f"Assigned IPs: {node1.name} <-> {node2.name} : {ip1} <-> {ip2}")
-
-        # Assign IPs to core switch connections
-        for core in self.core_switches:
-            for connection in core.connections.keys():
-                assign_connection_ips(core, connection)
-        
-        # Assign IPs to pod connections
+        nodes = list(self.core_switches)
+        pods = [-1] * len(nodes)
+        links = [(core, agg) for core in self.core_switches for agg in core.connections]
         for pod in self.pods:
-            for agg_switch in pod.aggregation_switches:
-                for connection in agg_switch.connections.keys():
-                    if agg_switch.connections.get(connection, "") == "":
-                        assign_connection_ips(agg_switch, connection)
-            
-            for edge_switch in pod.edge_switches:
-                for connection in edge_switch.connections.keys():
-                    if edge_switch.connections.get(connection, "") == "":
-                        assign_connection_ips(edge_switch, connection)
-            
-            for server in pod.servers:
-                for connection in server.connections.keys():
-                    if server.connections.get(connection, "") == "":
-                        assign_connection_ips(server, connection)
+            pod_nodes = pod.aggregation_switches + pod.edge_switches + pod.servers
+            nodes.extend(pod_nodes)
+            pods.extend([pod.pod_num] * len(pod_nodes))
+            links.extend(
+                (agg, edge) for agg in pod.aggregation_switches for edge in agg.connections
+                if edge.type == SwitchType.EDGE
+            )
+            links.extend(
+                (edge, server) for edge in pod.edge_switches for server in edge.connections
+                if isinstance(server, Server)
+            )
+
+        with self.profiler.phase("build link table"):
+            self.link_table = LinkTable(nodes, links, pods)
+        if self.artifact_cache is not None:
+            self._load_artifacts()
+        if self._artifacts is not None:
+            with self.profiler.phase("apply cached addresses"):
+                self.address_plan.announce(self)
+                self.link_table.apply()
+        else:
+            with self.profiler.phase(f"assign addresses ({self.address_plan.name})"):
+                self.address_plan.assign(self, self.link_table)
+                self.link_table.apply()
+        with self.profiler.phase("index nodes"):
+            self.node_index = NodeIndex(self.link_table)
+        self.log(f"Assigned IPs to {len(self.link_table)} links ({self.address_plan.name} address plan"
+                 f"{', from the artifact cache' if self._artifacts else ''})")
 
     def generate_configs(self):
-        # Clear out all the old configs
-        for folder in Path(self.root_storage_folder).iterdir():
-            if folder.is_dir():
-                shutil.rmtree(folder)
-                self.log(f"Removed old config folder: {folder.name}")
-                
-        # Generate new configs
-        for core in self.core_switches:
-            core.generate_config_folder()
-            self.log(f"Generated config for {core.name}")
-        for pod in self.pods:
-            for aggregate in pod.aggregation_switches:
-                aggregate.generate_config_folder()
-                self.log(f"Generated config for {aggregate.name}")
-            for edge in pod.edge_switches:
-                edge.generate_config_folder()
-                self.log(f"Generated config for {edge.name}")
+        """Writes the FRR config folders of all switches, skipping switches whose files are unchanged since the
+        last run (see ConfigWriter) and removing folders of switches that no longer exist.
+        All frr.conf files are rendered in one pass over the link table (see FrrRenderer).
+
+        Returns:
+            List[str]: names of the switches whose config changed
+        """
+        switches = self.all_switches()
+        if self._cached_configs is not None:
+            rendered = self._cached_configs
+        else:
+            with self.profiler.phase("render configs"):
+                frr_configs = FrrRenderer(self.link_table).render_all(switches)
+                rendered = {
+                    switch.name: {"frr.conf": frr_configs[switch.name], "daemons": switch.generate_daemon()}
+                    for switch in switches
+                }
+            self._rendered = rendered
+        with self.profiler.phase("write configs"):
+            writer = ConfigWriter(self.root_storage_folder, max_workers=self.max_workers, log=self.log)
+            changed = writer.write(switches, rendered)
+        self.log(f"Configs up to date: {len(changed)} of {len(switches)} switches changed")
+        return changed
 
     def create_containers(self):
         """
-        Creates Docker containers for all nodes in the fat tree.
+        Creates and starts all nodes in the fat tree on their backends (Docker containers by default), layer by
+        layer (core, aggregation, edge, servers) with up to max_workers nodes in flight.
+        If any node fails, everything started so far is removed and the error is re-raised.
+
         Returns:
-            str: Output messages.
+            List[Node]: nodes that were started.
         """
-        outputs = []
+        layers = [
+            ("core", self.core_switches),
+            ("aggregation", [agg for pod in self.pods for agg in pod.aggregation_switches]),
+            ("edge", [edge for pod in self.pods for edge in pod.edge_switches]),
+            ("server", [server for pod in self.pods for server in pod.servers]),
+        ]
+        provisioner = ContainerProvisioner(
+            max_workers=self.max_workers,
+            progress_callback=lambda node, done, total: self.log(f"Created {node.name} ({done}/{total})"),
+            phase=self.profiler.phase
+        )
         try:
-            for core in self.core_switches:
-                output = core.create_frr_container()
-                outputs.append(output)
-                self.log(f"Created container for {core.name}")
-            for pod in self.pods:
-                for aggregate in pod.aggregation_switches:
-                    output = aggregate.create_frr_container()
-                    outputs.append(output)
-                    self.log(f"Created container for {aggregate.name}")
-                for edge in pod.edge_switches:
-                    output = edge.create_frr_container()
-                    outputs.append(output)
-                    self.log(f"Created container for {edge.name}")
-                for server in pod.servers:
-                    output = server.create_container()
-                    outputs.append(output)
-                    self.log(f"Created container for {server.name}")
-            return "\n".join(outputs)
+            return provisioner.provision(layers)
         except Exception as e:
             self.log(f"Error during container creation: {str(e)}", error=True)
-            return f"Error during container creation: {str(e)}"
+            raise
 
     def create_veth_connections(self):
-        """Creates veth pairs for all connections in the fat tree topology"""
+        """Creates veth pairs for all connections in the fat tree topology.
+        All links of the link table are queued on one LinkFabric and created in a single batch of netlink operations.
+        """
+        fabric = LinkFabric(self.switch_backend.host_netlink())
         try:
-            # Connect core switches to aggregation switches
-            for core_switch in self.core_switches:
-                for other_node in core_switch.connections:
-                    # Avoid repeating links
-                    if((core_switch.name, other_node.name) not in self.links and (other_node.name, core_switch.name) not in self.links):
-                        core_switch.establish_veth_link(other_node)
-                        self.links.add((core_switch.name, other_node.name))
-                        self.log(f"Established veth link between {core_switch.name} and {other_node.name}")
-            
-            for pod in self.pods:
-                # Edge connections
-                for edge_switch in pod.edge_switches:
-                    for other_node in edge_switch.connections:
-                        if((edge_switch.name, other_node.name) not in self.links and (other_node.name, edge_switch.name) not in self.links):
-                            edge_switch.establish_veth_link(other_node)
-                            self.links.add((edge_switch.name, other_node.name))
-                            self.log(f"Established veth link between {edge_switch.name} and {other_node.name}")
-                
-                # Aggregation connections
-                for agg in pod.aggregation_switches:
-                    for other_node in agg.connections:
-                        if((agg.name, other_node.name) not in self.links and (other_node.name, agg.name) not in self.links):
-                            agg.establish_veth_link(other_node)
-                            self.links.add((agg.name, other_node.name))
-                            self.log(f"Established veth link between {agg.name} and {other_node.name}")
-                
-                # Server connections
-                for server in pod.servers:
-                    for other_node in server.connections:
-                        if((server.name, other_node.name) not in self.links and (other_node.name, server.name) not in self.links):
-                            server.establish_veth_link(other_node)
-                            self.links.add((server.name, other_node.name))
-                            self.log(f"Established veth link between {server.name} and {other_node.name}")
-            
+            for node_a, node_b in self.link_table.pairs():
+                fabric.add_link(node_a, node_b)
+            fabric.build(
+                progress_callback=lambda a, b: self.log(f"Established veth link between {a.name} and {b.name}")
+            )
             self.log("Completed creating all veth connections")
         except Exception as e:
             self.log(f"Error during veth connection creation: {str(e)}", error=True)
@@ -265,116 +314,328 @@ class FatTree:
             print(message)  # Also print to server console for debugging
 
 
-    def build_fat_tree(self):
-        """Build the complete fat tree topology."""
-        self.cleanup()
-        self.log("Cleaned up existing Docker containers and networks.")
+    def build_fat_tree(self, incremental=False, convergence_timeout=120):
+        """Build the complete fat tree topology.
+
+        Args:
+            incremental (bool): Reconcile against the nodes, links and configs already on this host instead
+                of tearing everything down first. Unchanged switches keep running and keep their BGP sessions.
+            convergence_timeout (float): Seconds to wait for BGP to converge once the links are up (see
+                wait_for_convergence). None returns as soon as the links are up, as does a switch backend that
+                runs no routing (Backend.runs_routing, e.g. dry-run).
+
+        Raises:
+            ConvergenceError: Raised if the fabric did not converge within convergence_timeout
+        """
+        phase = self.profiler.phase
+        self.profiler.start(next(filter(None, (backend.docker_client() for backend in self.backends())), None))
+        try:
+            with phase("build_fat_tree"):
+                if not incremental:
+                    with phase("cleanup"):
+                        self.cleanup()
+                    self.log("Cleaned up nodes of earlier builds.")
+                with phase("generate_core_switches"):
+                    self.generate_core_switches()
+                with phase("generate_pods"):
+                    self.generate_pods()
+                with phase("connect_pods_and_core"):
+                    self.connect_pods_and_core()
+                with phase("generate_ips"):
+                    self.generate_ips()
+                if incremental:
+                    with phase("prepare_backends"):
+                        self.prepare_backends()
+                    with phase("reconcile"):
+                        TopologyReconciler(self).reconcile()
+                else:
+                    with phase("generate_configs"):
+                        self.generate_configs()
+                    with phase("prepare_backends"):
+                        self.prepare_backends()
+                    with phase("create_containers"):
+                        self.create_containers()
+                    with phase("create_veth_connections"):
+                        self.create_veth_connections()
+                links_up = time.monotonic()
+                if convergence_timeout is not None and not self.switch_backend.runs_routing:
+                    self.log(f"Skipped waiting for convergence, the {self.switch_backend.name} backend runs no "
+                             f"routing.")
+                elif convergence_timeout is not None:
+                    with phase("wait_for_convergence"):
+                        self.wait_for_convergence(timeout=convergence_timeout, start_time=links_up)
+                # Uncomment the following lines if you want to create veth connections and other steps
+                # self.ping_mesh_parallel()
+                # self.generate_topology_graph_plotly()
+                # self.cleanup()
+        finally:
+            self.profiler.stop()
+            self.write_profile()
+        self.log("Fat Tree build process completed.")
+
+    def restore(self):
+        """Rebuilds the model of a fabric that was built earlier, e.g. by another process, without touching the
+        host. Nodes are attached to their running instances when first used (ping, traceroute)."""
         self.generate_core_switches()
         self.generate_pods()
         self.connect_pods_and_core()
         self.generate_ips()
-        self.generate_configs()
-        self.create_containers()
-        self.create_veth_connections()
-        # Uncomment the following lines if you want to create veth connections and other steps
-        # self.ping_mesh_parallel()
-        # self.generate_topology_graph_plotly()
-        # self.cleanup()
-        self.log("Fat Tree build process completed.")
 
-    def cleanup(self):
-        """
-        Stops and removes all Docker containers, deletes network namespaces,
-        and prunes Docker networks.
+    def _load_artifacts(self):
+        """Loads the address plan and configs of this k from the artifact cache, if it has them. Both are read
+        while the entry is protected from eviction; an entry that cannot be read counts as a miss."""
+        with self.profiler.phase("load artifacts"):
+            try:
+                with self.artifact_cache.reading(self.artifact_key) as entry:
+                    if entry is None:
+                        return
+                    ip_a, ip_b = self.artifact_cache.load_address_plan(self.artifact_key)
+                    configs = self.artifact_cache.load_configs(self.artifact_key)
+            except (OSError, ValueError, KeyError) as e:
+                self.log(f"Could not read the cached artifacts of k={self.k}, computing them instead: {e}", error=True)
+                self.artifact_cache.discard(self.artifact_key)
+                return
+            self.link_table.assign(ip_a, ip_b)
+            self._artifacts, self._cached_configs = entry, configs
+
+    def store_artifacts(self) -> str:
+        """Adds the address plan, the rendered configs and the topology HTML of this build to the artifact cache.
+        Does nothing beyond a cache hit if generate_ips found them cached already.
+
+        Returns:
+            str: folder of the cache entry
         """
-        try:
-            # Get all container IDs
-            container_ids = subprocess.run(
-                ["docker", "ps", "-a", "-q"],
-                capture_output=True,
-                text=True,
-                check=True
-            ).stdout.strip()
-
-            if container_ids:
-                # Stop all containers
-                subprocess.run(
-                    ["docker", "stop"] + container_ids.split("\n"),
-                    check=True
-                )
-                self.log("Stopped all Docker containers.")
-                
-                # Remove all containers
-                subprocess.run(
-                    ["docker", "rm"] + container_ids.split("\n"),
-                    check=True
-                )
-                self.log("Removed all Docker containers.")
-
-            # Get list of network namespaces
-            netns = subprocess.run(
-                ["ip", "netns"],
-                capture_output=True,
-                text=True,
-                check=True
-            ).stdout.strip()
-
-            if netns:
-                # Delete each network namespace
-                for ns in netns.split("\n"):
-                    subprocess.run(
-                        ["sudo", "ip", "netns", "delete", ns],
-                        check=True
-                    )
-                    self.log(f"Deleted network namespace: {ns}")
+        if self._artifacts is not None:
+            return self._artifacts
+        if self._rendered is None:
+            raise RuntimeError("store_artifacts needs the configs rendered by generate_configs")
+
+        def fill(folder):
+            ArtifactCache.save_address_plan(folder, self.link_table.ip_a, self.link_table.ip_b)
+            ArtifactCache.save_configs(folder, self._rendered)
+            with self.profiler.phase("plot topology"):
+                self.generate_topology_graph_plotly(os.path.join(folder, HTML_NAME))
+
+        self._artifacts = self.artifact_cache.put(self.artifact_key, fill)
+        self.log(f"Stored the artifacts of k={self.k} in the artifact cache ({self.artifact_key})")
+        return self._artifacts
+
+    def write_profile(self):
+        """Logs the profiler's summary table and, if profile_dir is set, writes build_profile.json and the
+        Chrome trace build_trace.json there. Can be called again after later phases (ping, plot) to include them."""
+        self.log("Build profile:\n" + self.profiler.summary_table())
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            self.profiler.save_json(os.path.join(self.profile_dir, "build_profile.json"))
+            self.profiler.save_chrome_trace(os.path.join(self.profile_dir, "build_trace.json"))
+            self.log(f"Wrote build profile to {self.profile_dir}")
+
+    def wait_for_convergence(self, timeout=120, poll_interval=1.0, max_workers=16, start_time=None):
+        """Blocks until every BGP session is Established and every switch has a route to every server subnet.
 
-            # Prune Docker networks
-            subprocess.run(
-                ["docker", "network", "prune", "-f"],
-                check=True
+        Args:
+            timeout (float): seconds after start_time to give up
+            poll_interval (float): seconds between polling rounds
+            max_workers (int): maximum number of switches polled at once
+            start_time (float): time.monotonic() at which the links came up, defaults to now
+
+        Returns:
+            dict: convergence metrics, see ConvergenceMonitor.run. Also kept in self.convergence.
+
+        Raises:
+            ConvergenceError: Raised if some switch did not converge within the timeout
+        """
+        monitor = ConvergenceMonitor(
+            self, max_workers=max_workers, poll_interval=poll_interval, timeout=timeout,
+            progress_callback=lambda switch, seconds, done, total: self.log(
+                f"{switch.name} converged after {seconds:.1f}s ({done}/{total})"
             )
-            self.log("Pruned Docker networks.")
+        )
+        self.convergence = monitor.run(start_time)
+        if not self.convergence['converged']:
+            unconverged = self.convergence['unconverged']
+            self.log(f"{len(unconverged)} switch(es) did not converge within {timeout}s: {unconverged[:10]}", error=True)
+            raise ConvergenceError(f"Fabric did not converge within {timeout}s")
+        self.log(
+            f"Fabric converged after {self.convergence['fabric_seconds']:.1f}s ({self.convergence['polls']} polling rounds)"
+        )
+        return self.convergence
 
-            self.log("Cleanup completed successfully.")
+    def check_ecmp(self, max_workers=16):
+        """Reports every switch whose FIB has fewer equal-cost next hops than the topology offers (see EcmpAnalyzer)
 
-        except subprocess.CalledProcessError as e:
-            self.log(f"An error occurred during cleanup: {e}", error=True)
-            raise
+        Returns:
+            dict: per switch expected/installed fan-out and the names of the deficient switches
+        """
+        return EcmpAnalyzer(self, max_workers=max_workers).analyze()
 
-    def ping_mesh_parallel(self):
-        servers = [server for pod in self.pods for server in pod.servers]
-        all_outputs = []
-        for server in servers:
-            target_ips = [
-                list(other.connections.values())[0]
-                for other in servers
-                if other.name != server.name
-            ]
-            if not target_ips:
-                continue
+    def find_node(self, name: str) -> Node:
+        """Finds a switch or server by its name.
+
+        Raises:
+            ValueError: Raised if there is no node with that name
+        """
+        if self.node_index is not None:
+            node = self.node_index.node(name)
+            if node is None:
+                raise ValueError(f"Unknown node '{name}'")
+            return node
+        for node in self.all_switches():
+            if node.name == name:
+                return node
+        server = self.find_server_by_name(name)
+        if server is None:
+            raise ValueError(f"Unknown node '{name}'")
+        return server
+
+    def _link_ends(self, a: str, b: str):
+        node_a, node_b = self.find_node(a), self.find_node(b)
+        if node_b not in node_a.connections:
+            raise ValueError(f"There is no link between {a} and {b}")
+        return node_a, node_b
+
+    def fail_link(self, a: str, b: str):
+        """Takes the link between two nodes down by setting both veth ends down.
+
+        Args:
+            a (str): name of one end
+            b (str): name of the other end
+        """
+        node_a, node_b = self._link_ends(a, b)
+        set_link_state(node_a, node_b, 'down')
+        self.failed_links.add(tuple(sorted((a, b))))
+        self.log(f"Failed link {node_a.veth_name(node_b)} <-> {node_b.veth_name(node_a)}")
+
+    def restore_link(self, a: str, b: str):
+        """Brings a link taken down by fail_link back up"""
+        node_a, node_b = self._link_ends(a, b)
+        set_link_state(node_a, node_b, 'up')
+        self.failed_links.discard(tuple(sorted((a, b))))
+        self.log(f"Restored link {node_a.veth_name(node_b)} <-> {node_b.veth_name(node_a)}")
+
+    def fail_switch(self, name: str, mode: str = 'links'):
+        """Fails a switch.
+
+        Args:
+            name (str): switch name
+            mode (str): 'links' sets all of the switch's interfaces down, so its neighbors see the carrier drop
+                and tear their sessions down right away. 'pause' freezes the switch's processes with its links up, so
+                neighbors only notice once the BGP hold timer expires, like a hung switch.
+        """
+        switch = self.find_node(name)
+        if not isinstance(switch, Switch):
+            raise ValueError(f"{name} is not a switch")
+        if mode == 'links':
+            for peer in switch.connections:
+                set_link_state(switch, peer, 'down', ends=[switch])
+        elif mode == 'pause':
+            switch.pause()
+        else:
+            raise ValueError(f"Unknown failure mode '{mode}', expected 'links' or 'pause'")
+        self.failed_switches[name] = mode
+        self.log(f"Failed switch {name} ({mode})")
+
+    def restore_switch(self, name: str):
+        """Undoes fail_switch"""
+        switch = self.find_node(name)
+        mode = self.failed_switches.pop(name, 'links')
+        if mode == 'pause':
+            switch.unpause()
+        else:
+            for peer in switch.connections:
+                set_link_state(switch, peer, 'up', ends=[switch])
+        self.log(f"Restored switch {name}")
+
+    def cleanup(self):
+        """Removes what the backends left on this host from earlier builds. With a session that is only the nodes
+        of that session. Without one, with the docker backend, it is every Docker container and network namespace
+        on the host, plus a prune of the Docker networks."""
+        if self.exec_mux is not None:
+            self.exec_mux.close()
+        for backend in self.backends():
+            backend.cleanup(self.log)
+
+    def ping_mesh_parallel(self, max_workers=16, count=3, timeout_ms=1000):
+        """Pings every server from every other server, running up to max_workers fping sources at once.
+
+        Args:
+            max_workers (int): maximum number of concurrent fping runs
+            count (int): pings sent to each target
+            timeout_ms (int): fping per-ping timeout
 
-            # -a: show alive hosts
-            # -s: print stats
-            fping_cmd = f"fping -a -s -t 1000 -c 3 {' '.join(target_ips)}"
-
-            self.log(f"Pinging from {server.name} to all other servers...")
-            result = server.container.exec_run(fping_cmd)
-
-            if result.exit_code != 0:
-                failed_ips = [
-                    line.split()[0]
-                    for line in result.output.decode().strip().split('\n')
-                    if "unreachable" in line
-                ]
-                output = f"Failed to reach: {failed_ips}"
-                self.log(output)
-                all_outputs.append(f"Server {server.name}: {output}")
+        Returns:
+            ReachabilityMatrix: loss/RTT of every server pair
+        """
+        servers = [server for pod in self.pods for server in pod.servers]
+        pods = [pod.pod_num for pod in self.pods for _ in pod.servers]
+
+        def report(server, stats, done, total):
+            # targets fping printed nothing for (fping missing, exec error, cut off output) count as unreachable
+            unreachable = [other.ip for other in servers
+                           if other is not server and stats.get(other.ip, {}).get('received', 0) == 0]
+            if unreachable:
+                self.log(f"[{done}/{total}] {server.name} failed to reach: {unreachable}")
             else:
-                success_output = "Ping Success!"
-                self.log(success_output)
-                all_outputs.append(f"Server {server.name}: {success_output}")
-        # Return all outputs as a single string
-        return "\n".join(all_outputs)
+                self.log(f"[{done}/{total}] {server.name}: Ping Success!")
+
+        engine = ReachabilityEngine(servers, pods, max_workers=max_workers, count=count, timeout_ms=timeout_ms,
+                                    progress_callback=report)
+        with self.profiler.phase("ping_mesh_parallel"):
+            matrix = engine.run()
+        summary = matrix.summary()
+        self.log(
+            f"Ping mesh complete: {summary['unreachable_pairs']} unreachable and {summary['lossy_pairs']} lossy "
+            f"pair(s) out of {summary['pairs']}, pods with loss: {matrix.pods_with_loss()}"
+        )
+        return matrix
+
+    def measure_throughput(self, pattern='permutation', duration=10, udp=False, link_gbps=None, max_concurrent=None,
+                           source_pod=0, destination_pod=1, seed=0):
+        """Runs an iperf3 traffic pattern between the servers (see ThroughputSuite).
+
+        Args:
+            pattern (str): 'pairwise' (stride N/2), 'permutation', 'all-to-all' or 'pod-to-pod'
+            duration (int): seconds per flow
+            udp (bool): measure UDP jitter/loss instead of TCP retransmits
+            link_gbps (float): host link rate for the bisection ideal. By default a single flow is measured first
+                while nothing else runs.
+            max_concurrent (int): flows in flight, defaults to what the host CPUs can sustain
+            source_pod (int): sending pod of the pod-to-pod pattern
+            destination_pod (int): receiving pod of the pod-to-pod pattern
+            seed (int): seed of the permutation pattern
+
+        Returns:
+            dict: 'matrix' (ThroughputMatrix), 'batches' with every flow's result, 'summary' and 'bisection'
+        """
+        servers = [server for pod in self.pods for server in pod.servers]
+        pods = [pod.pod_num for pod in self.pods for _ in pod.servers]
+        patterns = {
+            'pairwise': lambda: pairwise_pattern(len(servers)),
+            'permutation': lambda: permutation_pattern(len(servers), seed=seed),
+            'all-to-all': lambda: all_to_all_pattern(len(servers)),
+            'pod-to-pod': lambda: pod_to_pod_pattern(pods, source_pod, destination_pod),
+        }
+        if pattern not in patterns:
+            raise ValueError(f"Unknown traffic pattern '{pattern}', expected one of {sorted(patterns)}")
+
+        suite = ThroughputSuite(
+            servers, pods, duration=duration, udp=udp, max_concurrent=max_concurrent,
+            progress_callback=lambda batch, total, results: self.log(
+                f"[{batch}/{total}] {sum(r['gbps'] for r in results if r):.2f} Gbps over {len(results)} flow(s)"
+            )
+        )
+        if link_gbps is None:
+            baseline = suite.run_batch([(0, len(servers) - 1)])[0]
+            link_gbps = baseline['gbps'] if baseline else 0.0
+            self.log(f"Single flow baseline: {link_gbps:.2f} Gbps")
+
+        self.log(f"Running {pattern} throughput pattern with up to {suite.max_concurrent} concurrent flows")
+        matrix, batches = suite.run(patterns[pattern]())
+        bisection = suite.bisection(batches, link_gbps)
+        summary = matrix.summary()
+        self.log(f"Throughput: {summary['total_gbps']:.2f} Gbps over {summary['flows']} flows, bisection "
+                 f"{bisection['measured_gbps']:.2f} of {bisection['ideal_gbps']:.2f} Gbps ideal")
+        return {'matrix': matrix, 'batches': batches, 'summary': summary, 'bisection': bisection}
 
     def print_topology(self):
         """Print a human-readable representation of the fat tree topology and IP assignments"""
@@ -399,12 +660,15 @@ class FatTree:
             for server in pod.servers:
                 self.log(server)
 
-    def generate_topology_graph_plotly(self):
+    def generate_topology_graph_plotly(self, output_html_file=None):
         """
         Creates an interactive visual representation of the fat tree topology using Plotly
         and saves it as an HTML file with cores on top, pods arranged from left to right,
         and servers aligned on the same horizontal level. The height of the visualization
         can be adjusted by modifying vertical spacing parameters.
+
+        Args:
+            output_html_file (str): where to save the HTML, fat_tree_k<k>_topology.html by default
         """
         import math
 
@@ -656,20 +920,37 @@ class FatTree:
         )
 
         # Step 10: Save the figure as an HTML file
-        output_html_file = f"fat_tree_k{self.k}_topology.html"
+        output_html_file = output_html_file or f"fat_tree_k{self.k}_topology.html"
         fig.write_html(output_html_file, full_html=True, include_plotlyjs='cdn')
         self.log(f"Topology graph saved as {output_html_file}")
 
+    @staticmethod
+    def _attached(node: Node) -> Node:
+        """Attaches a node of a restored fat tree (see restore) to its running instance on first use"""
+        if node.container is None:
+            node.attach()
+        return node
+
+    @staticmethod
+    def _decoded(on_line):
+        return (lambda line: on_line(line.decode(errors='replace'))) if on_line else None
+
     def find_server_by_name(self, name: str):
         """Find a server by its name."""
+        if self.node_index is not None:
+            return self.node_index.server(name)
         for pod in self.pods:
             for server in pod.servers:
                 if server.name == name:
                     return server
         return None
 
-    def ping(self, source: str, destination: str):
-        """Ping from source server to destination server."""
+    def ping(self, source: str, destination: str, on_line=None):
+        """Ping from source server to destination server.
+
+        Args:
+            on_line (function): Called as on_line(line) with every output line (str), see Node.exec_run.
+        """
 
         source_server = self.find_server_by_name(source)
         destination_server = self.find_server_by_name(destination)
@@ -682,25 +963,27 @@ class FatTree:
             self.log(f"Destination server '{destination}' not found.", error=True)
             return {'success': False, 'output': f"Destination server '{destination}' not found."}
 
-        # print("TESTING!!!")
-        # print(list(source_server.connections.values())[0], list(destination_server.connections.values())[0])
-
-        destination_ip = list(destination_server.connections.values())[0] # Ensure 'ip' attribute exists
+        destination_ip = destination_server.ip
         self.log(f"Executing ping from {source} ({source_server.ip}) to {destination} ({destination_ip})")
 
         try:
             # Example: ping -c 4 destination_ip
-            result = source_server.container.exec_run(f"ping -c 4 {destination_ip}", stdout=True, stderr=True)
+            self._attached(source_server)
+            result = source_server.exec_run(f"ping -c 4 {destination_ip}", on_line=self._decoded(on_line))
             output = result.output.decode()
             success = result.exit_code == 0
             self.log(f"Ping result: {output}" if success else f"Ping failed: {output}", error=not success)
-            return {'success': success, 'output': output}
+            return {'success': success, 'output': output, 'stats': parse_ping_summary(output)}
         except Exception as e:
             self.log(f"Exception during ping: {str(e)}", error=True)
             return {'success': False, 'output': str(e)}
 
-    def traceroute(self, source: str, destination: str):
-        """Traceroute from source server to destination server."""
+    def traceroute(self, source: str, destination: str, on_line=None):
+        """Traceroute from source server to destination server.
+
+        Args:
+            on_line (function): Called as on_line(line) with every output line (str), see Node.exec_run.
+        """
 
         source_server = self.find_server_by_name(source)
         destination_server = self.find_server_by_name(destination)
@@ -713,12 +996,13 @@ class FatTree:
             self.log(f"Destination server '{destination}' not found.", error=True)
             return {'success': False, 'output': f"Destination server '{destination}' not found."}
 
-        destination_ip = list(destination_server.connections.values())[0]  # Ensure 'ip' attribute exists
+        destination_ip = destination_server.ip
         self.log(f"Executing traceroute from {source} ({source_server.ip}) to {destination} ({destination_ip})")
 
         try:
             # Example: traceroute destination_ip
-            result = source_server.container.exec_run(f"traceroute {destination_ip}", stdout=True, stderr=True)
+            self._attached(source_server)
+            result = source_server.exec_run(f"traceroute {destination_ip}", on_line=self._decoded(on_line))
             output = result.output.decode()
             success = result.exit_code == 0
             self.log(f"Traceroute result: {output}" if success else f"Traceroute failed: {output}", error=not success)
@@ -0,0 +1,224 @@
+# frr_renderer.py
+
+from __future__ import annotations
+from string import Formatter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+from node import Switch, veth_name
+from link_table import LinkTable, ip_to_int, int_to_ip, ints_to_ips
+
+SUBNET_MASK_30 = 0xFFFFFFFC
+
+# frr.conf of a switch, one fragment per repeated block. Fields are filled in in the order they appear.
+FRAGMENTS = {
+    'head': "\n".join([
+        "frr version 8.4",
+        "frr defaults traditional",
+        "hostname {name}",
+        "no ipv6 forwarding",
+        "ip forwarding",
+        "!",
+    ]) + "\n",
+    'interface': "interface {veth}\n ip address {ip}/30\n!\n",
+    'prefix_net': "ip prefix-list LOCAL_NETS seq {seq} permit {network}/30\n!\n",
+    'prefix_summary': "ip prefix-list LOCAL_NETS seq {seq} permit {prefix} le 30\n!\n",
+    'bgp': "\n".join([
+        "route-map ANNOUNCE_LOCAL permit 10",
+        " match ip address prefix-list LOCAL_NETS",
+        "!",
+        "router bgp {asn}",
+        " bgp router-id {router_id}",
+        " bgp log-neighbor-changes",
+        " no bgp ebgp-requires-policy",
+        " timers bgp 3 9",
+    ]) + "\n",
+    'neighbor': " neighbor {ip} remote-as {asn}\n",
+    'address_family': " address-family ipv4 unicast\n  network 0.0.0.0/0\n",  # advertise default route
+    'redistribute': "  redistribute connected route-map ANNOUNCE_LOCAL\n",
+    'aggregate': "  aggregate-address {prefix} summary-only\n",
+    'activate': "  neighbor {ip} activate\n",
+    'tail': "\n".join([
+        "  maximum-paths 64",
+        " exit-address-family",
+        "!",
+        "line vty",
+        "!",
+    ]),
+}
+
+
+class FrrTemplate(NamedTuple):
+    """Compiled fragments: the literal text around each field, so that filling in a fragment is a plain
+    string concatenation (literals[0] + field_0 + literals[1] + ...)."""
+    head: Tuple[str, ...]
+    interface: Tuple[str, ...]
+    prefix_net: Tuple[str, ...]
+    prefix_summary: Tuple[str, ...]
+    bgp: Tuple[str, ...]
+    neighbor: Tuple[str, ...]
+    address_family: Tuple[str, ...]
+    redistribute: Tuple[str, ...]
+    aggregate: Tuple[str, ...]
+    activate: Tuple[str, ...]
+    tail: Tuple[str, ...]
+
+
+def _literals(fragment: str) -> Tuple[str, ...]:
+    literals = []
+    field = None
+    for literal, field, _, _ in Formatter().parse(fragment):
+        literals.append(literal)
+    if field is not None:
+        literals.append("")
+    return tuple(literals)
+
+
+def compile_fragments() -> FrrTemplate:
+    """Splits the config fragments into their literal pieces.
+
+    Every role shares this skeleton. What differs between switches (which networks they announce, summaries,
+    aggregates) is decided by the address plan rather than by the role, see _assemble.
+    """
+    return FrrTemplate(**{name: _literals(fragment) for name, fragment in FRAGMENTS.items()})
+
+
+# compiled once per process
+TEMPLATE = compile_fragments()
+
+
+class FrrRenderer:
+    """Renders frr.conf for switches from the compiled fragments and a few per-switch parameters.
+
+    render_all() makes a single pass over a LinkTable and uses its integer addresses directly: network
+    addresses are ip & ~3 and the router-id is the highest interface address, both computed for all
+    switches at once with NumPy. Interfaces and neighbors are listed in link id order, which in a fat
+    tree is the order of the peers' node ids; render_switch() uses the same order, so both produce
+    identical configs.
+    """
+
+    def __init__(self, table: Optional[LinkTable] = None):
+        """
+        Args:
+            table (LinkTable): link table with assigned addresses, required by render_all()
+        """
+        self.table = table
+
+    @staticmethod
+    def _assemble(switch: Switch, router_id: str, interfaces: List[str], networks: List[str],
+                  neighbors: List[str], activates: List[str]) -> str:
+        """
+        Args:
+            switch (Switch): switch to render
+            router_id (str): BGP router id
+            interfaces (List[str]): rendered interface fragment of every link
+            networks (List[str]): /30 network address of every link, only used when the switch announces them all
+            neighbors (List[str]): rendered neighbor fragment of every switch peer
+            activates (List[str]): rendered activate fragment of every switch peer
+        """
+        template = TEMPLATE
+        head, bgp = template.head, template.bgp
+        parts = [head[0], switch.name, head[1]]
+        parts.extend(interfaces)
+
+        if switch.advertised_prefixes is None:
+            pre, mid, post = template.prefix_net
+            parts.extend(f"{pre}{5 * (i + 1)}{mid}{network}{post}" for i, network in enumerate(networks))
+        else:
+            # one entry per summary covers every connected /30 inside it
+            pre, mid, post = template.prefix_summary
+            parts.extend(f"{pre}{5 * (i + 1)}{mid}{prefix}{post}" for i, prefix in enumerate(switch.advertised_prefixes))
+
+        parts.extend((bgp[0], str(switch.asn), bgp[1], router_id, bgp[2]))
+        parts.extend(neighbors)
+        parts.append(template.address_family[0])
+        if switch.advertised_prefixes is None or switch.advertised_prefixes:
+            parts.append(template.redistribute[0])
+        pre, post = template.aggregate
+        parts.extend(pre + prefix + post for prefix in switch.aggregate_prefixes)
+        parts.extend(activates)
+        parts.append(template.tail[0])
+        return "".join(parts)
+
+    def render_switch(self, switch: Switch) -> str:
+        """Renders one switch from its connections, without a link table"""
+        template = TEMPLATE
+        peers = list(switch.connections)
+        if all(peer.node_id is not None for peer in peers):
+            peers.sort(key=lambda peer: peer.node_id)
+        addresses = [ip_to_int(switch.connections[peer]) for peer in peers]
+        if_pre, if_mid, if_post = template.interface
+        interfaces = [if_pre + switch.veth_name(peer) + if_mid + switch.connections[peer] + if_post for peer in peers]
+        networks = [int_to_ip(address & SUBNET_MASK_30) for address in addresses]
+        nb_pre, nb_mid, nb_post = template.neighbor
+        act_pre, act_post = template.activate
+        switch_peers = [peer for peer in peers if isinstance(peer, Switch)]
+        neighbors = [nb_pre + peer.connections[switch] + nb_mid + str(peer.asn) + nb_post for peer in switch_peers]
+        activates = [act_pre + peer.connections[switch] + act_post for peer in switch_peers]
+        return self._assemble(switch, int_to_ip(max(addresses)), interfaces, networks, neighbors, activates)
+
+    def render_all(self, switches: List[Switch]) -> Dict[str, str]:
+        """Renders every given switch in one pass over the link table.
+
+        Args:
+            switches (List[Switch]): switches to render, all of them nodes of the link table
+
+        Returns:
+            Dict[str, str]: switch name -> frr.conf content
+        """
+        table = self.table
+        nodes = table.nodes
+        num_nodes = len(nodes)
+        is_switch = np.fromiter((isinstance(node, Switch) for node in nodes), dtype=bool, count=num_nodes)
+        # the a-side of a link is always a switch, the b-side's address only matters if it is a switch too
+        peer_links = is_switch[table.endpoint_b]
+        ips_a = ints_to_ips(table.ip_a)
+        ips_b = [None] * len(table)
+        for link, ip_addr in zip(np.flatnonzero(peer_links).tolist(), ints_to_ips(table.ip_b[peer_links])):
+            ips_b[link] = ip_addr
+
+        switch_ids = np.fromiter((switch.node_id for switch in switches), dtype=np.int64, count=len(switches))
+        router_ids = np.zeros(num_nodes, dtype=np.uint32)
+        np.maximum.at(router_ids, table.endpoint_a, table.ip_a)
+        np.maximum.at(router_ids, table.endpoint_b, table.ip_b)
+        router_ids = dict(zip(switch_ids.tolist(), ints_to_ips(router_ids[switch_ids])))
+
+        # per-switch lists only; servers never get rendered
+        switch_flags = is_switch.tolist()
+        networks = [[] if flag else None for flag in switch_flags]
+        interfaces = [[] if flag else None for flag in switch_flags]
+        neighbors = [[] if flag else None for flag in switch_flags]
+        activates = [[] if flag else None for flag in switch_flags]
+
+        # networks are only listed by switches that announce every connected /30
+        if any(switch.advertised_prefixes is None for switch in switches):
+            is_listed = np.zeros(num_nodes, dtype=bool)
+            is_listed[[switch.node_id for switch in switches if switch.advertised_prefixes is None]] = True
+            networks_of_links = ints_to_ips(table.ip_a & np.uint32(SUBNET_MASK_30))
+            for a, b, network in zip(table.endpoint_a.tolist(), table.endpoint_b.tolist(), networks_of_links):
+                if is_listed[a]:
+                    networks[a].append(network)
+                if is_listed[b]:
+                    networks[b].append(network)
+
+        names = [node.name for node in nodes]
+        asns = [str(node.asn) if flag else None for node, flag in zip(nodes, switch_flags)]
+
+        if_pre, if_mid, if_post = TEMPLATE.interface
+        nb_pre, nb_mid, nb_post = TEMPLATE.neighbor
+        act_pre, act_post = TEMPLATE.activate
+        for a, b, ip_a, ip_b in zip(table.endpoint_a.tolist(), table.endpoint_b.tolist(), ips_a, ips_b):
+            interfaces[a].append(if_pre + veth_name(names[a], names[b]) + if_mid + ip_a + if_post)
+            if ip_b is None:
+                continue
+            neighbors[a].append(nb_pre + ip_b + nb_mid + asns[b] + nb_post)
+            activates[a].append(act_pre + ip_b + act_post)
+
+            interfaces[b].append(if_pre + veth_name(names[b], names[a]) + if_mid + ip_b + if_post)
+            neighbors[b].append(nb_pre + ip_a + nb_mid + asns[a] + nb_post)
+            activates[b].append(act_pre + ip_a + act_post)
+
+        return {
+            switch.name: self._assemble(switch, router_ids[switch.node_id], interfaces[switch.node_id],
+                                        networks[switch.node_id], neighbors[switch.node_id], activates[switch.node_id])
+            for switch in switches
+        }
@@ -0,0 +1,414 @@
+# jobs.py
+#
+# Build jobs of the website: the web process only queues jobs in a SQLite database, separate worker processes
+# build and tear down the fabrics, and their progress messages go back through the same database (see
+# JobStore.add_event) to be relayed to the SocketIO rooms. Workers are started by app.py, or by hand:
+#     python3 jobs.py worker --db fat_tree_jobs.sqlite3
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from enum import Enum
+from typing import List, Optional, Tuple
+
+DEFAULT_DB = 'fat_tree_jobs.sqlite3'
+
+
+class JobState(Enum):
+    QUEUED = "queued"             # waiting for a worker
+    BUILDING = "building"         # a worker is building the fabric
+    READY = "ready"               # built, its nodes are running
+    FAILED = "failed"             # the build failed; its nodes were removed
+    TEARING_DOWN = "tearing-down" # its nodes are being removed, then the job is deleted
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    session_id TEXT PRIMARY KEY,
+    k INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    config_folder TEXT NOT NULL,
+    options TEXT NOT NULL,
+    worker_pid INTEGER,
+    teardown_requested INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    message TEXT NOT NULL,
+    error INTEGER NOT NULL DEFAULT 0,
+    complete INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS events_session ON events (session_id, id);
+"""
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobStore:
+    """Build jobs and their progress events, persisted in SQLite so that they survive restarts of the web
+    process and can be shared by any number of worker processes.
+
+    Every thread gets its own connection (a build logs from the provisioner's threads).
+    """
+
+    def __init__(self, path: str = DEFAULT_DB):
+        """
+        Args:
+            path (str): database file, created if missing
+        """
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _job(row) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job['options'] = json.loads(job['options'])
+        return job
+
+    def submit(self, session_id: str, k: int, config_folder: str, options: dict):
+        """Queues the build of a fat tree.
+
+        Args:
+            session_id (str): the job's session, also the FatTree session of its nodes
+            k (int): k of the fat tree
+            config_folder (str): folder of the switch configs, relative to the worker's working directory
+            options (dict): everything else the worker needs (see fat_tree_for), stored as JSON
+        """
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO jobs (session_id, k, state, config_folder, options, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (session_id, k, JobState.QUEUED.value, config_folder, json.dumps(options), now, now)
+        )
+
+    def get(self, session_id: str) -> Optional[dict]:
+        row = self._connection().execute("SELECT * FROM jobs WHERE session_id = ?", (session_id,)).fetchone()
+        return self._job(row)
+
+    def jobs(self, states: Optional[List[JobState]] = None) -> List[dict]:
+        query, arguments = "SELECT * FROM jobs", ()
+        if states is not None:
+            query += f" WHERE state IN ({', '.join('?' * len(states))})"
+            arguments = tuple(state.value for state in states)
+        return [self._job(row) for row in self._connection().execute(query + " ORDER BY created_at", arguments)]
+
+    def reservations(self) -> List[Tuple[int, bool]]:
+        """(k, still building) of every job whose nodes exist or are about to, see AdmissionController.admit"""
+        building = (JobState.QUEUED.value, JobState.BUILDING.value)
+        return [(job['k'], job['state'] in building)
+                for job in self.jobs([JobState.QUEUED, JobState.BUILDING, JobState.READY, JobState.TEARING_DOWN])]
+
+    def claim(self, worker_pid: int) -> Optional[dict]:
+        """Hands the oldest queued build or unclaimed teardown to a worker, atomically across processes"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE state IN (?, ?) AND worker_pid IS NULL ORDER BY updated_at LIMIT 1",
+                (JobState.QUEUED.value, JobState.TEARING_DOWN.value)
+            ).fetchone()
+            if row is not None:
+                state = JobState.BUILDING.value if row['state'] == JobState.QUEUED.value else row['state']
+                connection.execute(
+                    "UPDATE jobs SET state = ?, worker_pid = ?, updated_at = ? WHERE session_id = ?",
+                    (state, worker_pid, time.time(), row['session_id'])
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return self.get(row['session_id']) if row is not None else None
+
+    def set_state(self, session_id: str, state: JobState, error: Optional[str] = None,
+                  worker_pid: Optional[int] = None):
+        """Moves a job to a new state.
+
+        Args:
+            error (str): recorded with the job, kept if None
+            worker_pid (int): worker that keeps working on the job; None releases it (a tearing-down job is
+                then claimed by the next free worker)
+        """
+        self._connection().execute(
+            "UPDATE jobs SET state = ?, error = COALESCE(?, error), worker_pid = ?, updated_at = ? "
+            "WHERE session_id = ?",
+            (state.value, error, worker_pid, time.time(), session_id)
+        )
+
+    def request_teardown(self, session_id: str) -> bool:
+        """Queues the removal of a job's nodes. A build in progress is torn down once its worker finished.
+
+        Returns:
+            bool: False if there is no such job
+        """
+        connection = self._connection()
+        # one transaction, so a worker cannot claim the job between reading its state and updating it
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            job = self.get(session_id)
+            if job is None:
+                pass
+            elif job['state'] == JobState.FAILED.value:
+                # its nodes were removed when the build failed
+                self.delete(session_id)
+            elif job['state'] == JobState.BUILDING.value:
+                # the building worker sees the request when it finishes (see BuildWorker.build)
+                connection.execute(
+                    "UPDATE jobs SET teardown_requested = 1, updated_at = ? WHERE session_id = ?",
+                    (time.time(), session_id)
+                )
+            else:
+                connection.execute(
+                    "UPDATE jobs SET state = ?, worker_pid = NULL, updated_at = ? WHERE session_id = ?",
+                    (JobState.TEARING_DOWN.value, time.time(), session_id)
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return job is not None
+
+    def mark_ready(self, session_id: str) -> bool:
+        """Moves a built job to ready unless its teardown was requested in the meantime.
+
+        Returns:
+            bool: False if a teardown was requested, the job is left as it is then
+        """
+        cursor = self._connection().execute(
+            "UPDATE jobs SET state = ?, worker_pid = NULL, updated_at = ? WHERE session_id = ? "
+            "AND teardown_requested = 0",
+            (JobState.READY.value, time.time(), session_id)
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, session_id: str):
+        connection = self._connection()
+        connection.execute("DELETE FROM events WHERE session_id = ?", (session_id,))
+        connection.execute("DELETE FROM jobs WHERE session_id = ?", (session_id,))
+
+    def recover(self) -> int:
+        """Requeues the work of workers that died (e.g. with the web process that started them): a half built
+        fabric is torn down and its job marked failed, an interrupted teardown is started again.
+
+        Returns:
+            int: number of jobs recovered
+        """
+        recovered = 0
+        for job in self.jobs([JobState.BUILDING, JobState.TEARING_DOWN]):
+            if job['worker_pid'] is None or _alive(job['worker_pid']):
+                continue
+            if job['state'] == JobState.BUILDING.value:
+                self.add_event(job['session_id'], "The build was interrupted, removing its nodes.", error=True)
+                self.set_state(job['session_id'], JobState.TEARING_DOWN, error="build interrupted")
+            else:
+                self.set_state(job['session_id'], JobState.TEARING_DOWN)
+            recovered += 1
+        return recovered
+
+    def add_event(self, session_id: str, message: str, error: bool = False, complete: bool = False):
+        self._connection().execute(
+            "INSERT INTO events (session_id, message, error, complete) VALUES (?, ?, ?, ?)",
+            (session_id, message, int(error), int(complete))
+        )
+
+    def last_event_id(self) -> int:
+        return self._connection().execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    def events_after(self, last_id: int, session_id: Optional[str] = None, up_to: Optional[int] = None) -> List[dict]:
+        """Events with an id above last_id (and up to up_to), oldest first, of one session or of all"""
+        query, arguments = "SELECT * FROM events WHERE id > ?", [last_id]
+        if session_id is not None:
+            query += " AND session_id = ?"
+            arguments.append(session_id)
+        if up_to is not None:
+            query += " AND id <= ?"
+            arguments.append(up_to)
+        return [dict(row) for row in self._connection().execute(query + " ORDER BY id", arguments)]
+
+
+def event_data(event: dict) -> dict:
+    """Payload of the build_status SocketIO event for a stored event"""
+    data = {'message': event['message']}
+    if event['error']:
+        data['error'] = True
+    if event['complete']:
+        data['complete'] = True
+    return data
+
+
+def fat_tree_for(job: dict, message_callback=None):
+    """FatTree of a job, with its backends, session and artifact cache. Nothing is built or attached."""
+    from fat_tree import FatTree
+    from backends import get_backend
+    from node import PullPolicy
+    from artifact_cache import ArtifactCache
+
+    options = job['options']
+    switch_backend = get_backend(options['switch_backend'])
+    server_backend = (get_backend(options['server_backend'])
+                      if options['server_backend'] != options['switch_backend'] else switch_backend)
+    return FatTree(
+        job['k'],
+        job['config_folder'],
+        message_callback,
+        pull_policy=PullPolicy(options['pull_policy']),
+        profile_dir=options.get('profile_dir'),
+        switch_backend=switch_backend,
+        server_backend=server_backend,
+        session=job['session_id'],
+        artifact_cache=ArtifactCache(options['artifact_dir'], options['artifact_max_mb'] << 20)
+    )
+
+
+class BuildWorker:
+    """Takes jobs from a JobStore one at a time and builds or tears down their fabrics.
+
+    Runs in its own process, so the blocking Docker, netlink and subprocess calls of a build never stall the
+    web process; run several to build several fabrics at once.
+    """
+
+    def __init__(self, store: JobStore, poll_interval: float = 0.5, parent_pid: Optional[int] = None):
+        """
+        Args:
+            store (JobStore): job database
+            poll_interval (float): seconds between looks at the queue while it is empty
+            parent_pid (int): pid of the process that started the worker; the worker exits once that process
+                is gone, after finishing its current job
+        """
+        self.store = store
+        self.poll_interval = poll_interval
+        self.parent_pid = parent_pid
+
+    def run(self):
+        while self.parent_pid is None or os.getppid() == self.parent_pid:
+            job = self.store.claim(os.getpid())
+            if job is None:
+                time.sleep(self.poll_interval)
+            elif job['state'] == JobState.BUILDING.value:
+                self.build(job)
+            else:
+                self.teardown(job)
+
+    def build(self, job: dict):
+        session_id = job['session_id']
+        options = job['options']
+
+        def log(message, error=False):
+            self.store.add_event(session_id, message, error=error)
+
+        fat_tree = None
+        try:
+            os.makedirs(job['config_folder'], exist_ok=True)
+            fat_tree = fat_tree_for(job, log)
+            if options.get('exec_mux'):
+                fat_tree.enable_exec_mux()
+            fat_tree.build_fat_tree()
+            with fat_tree.profiler.phase("store_artifacts"):
+                fat_tree.store_artifacts()
+            fat_tree.write_profile()
+            log("Topology HTML file generated successfully.")
+        except Exception as e:
+            log(f"Error during build: {str(e)}", error=True)
+            if fat_tree is None:
+                # the FatTree itself could not be set up (unknown backend, odd k, ...), so nothing was created
+                shutil.rmtree(os.path.dirname(job['config_folder']), ignore_errors=True)
+                self.fail(session_id, str(e))
+                return
+            self.store.set_state(session_id, JobState.TEARING_DOWN, error=str(e), worker_pid=os.getpid())
+            self.teardown(self.store.get(session_id), fat_tree)
+            return
+        finally:
+            if fat_tree is not None and fat_tree.exec_mux is not None:
+                fat_tree.exec_mux.close()
+
+        if not self.store.mark_ready(session_id):
+            # torn down as soon as it was built, see JobStore.request_teardown
+            self.store.set_state(session_id, JobState.TEARING_DOWN, worker_pid=os.getpid())
+            self.teardown(self.store.get(session_id), fat_tree)
+            return
+        self.store.add_event(session_id, "Build complete!", complete=True)
+
+    def teardown(self, job: dict, fat_tree=None):
+        """Removes the nodes and configs of a job's session. The job is deleted, or marked failed if its build
+        failed."""
+        session_id = job['session_id']
+        if fat_tree is None:
+            try:
+                fat_tree = fat_tree_for(job, lambda message, error=False: None)
+            except Exception:
+                # the build could not set up this FatTree either, so it created no nodes
+                fat_tree = None
+        try:
+            if fat_tree is not None:
+                fat_tree.cleanup()
+            shutil.rmtree(os.path.dirname(job['config_folder']), ignore_errors=True)
+        except Exception as e:
+            # kept by this worker: retried on the next cleanup request (request_teardown) or restart (recover)
+            self.store.add_event(session_id, f"Error during cleanup: {str(e)}", error=True)
+            self.store.set_state(session_id, JobState.TEARING_DOWN, worker_pid=os.getpid())
+            return
+        if job['error']:
+            self.fail(session_id, job['error'])
+        else:
+            self.store.delete(session_id)
+
+    def fail(self, session_id: str, error: str):
+        """Marks a job whose nodes are gone as failed and sends the final event, which stops the loading page"""
+        self.store.set_state(session_id, JobState.FAILED, error=error)
+        self.store.add_event(session_id, f"Build failed: {error}", error=True, complete=True)
+
+
+def spawn_workers(db_path: str, count: int) -> List[subprocess.Popen]:
+    """Starts worker processes that exit together with the calling process"""
+    return [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), 'worker', '--db', db_path,
+                          '--parent-pid', str(os.getpid())])
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build workers of the fat tree website")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    worker = subparsers.add_parser('worker', help="build and tear down queued fabrics")
+    worker.add_argument("--db", default=DEFAULT_DB, help="job database")
+    worker.add_argument("--poll-interval", type=float, default=0.5)
+    worker.add_argument("--parent-pid", type=int, help="exit once this process is gone")
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        BuildWorker(JobStore(args.db), poll_interval=args.poll_interval, parent_pid=args.parent_pid).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# link_fabric.py
+
+from __future__ import annotations
+import os
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+from pyroute2 import IPRoute
+from pyroute2.netns import pushns, popns, setns
+from node import Server
+
+
+@contextmanager
+def netns_socket(netns_path: str):
+    """Opens an IPRoute socket inside another network namespace.
+
+    The socket is created while the calling thread is switched into the namespace and stays bound to it
+    afterwards, so no helper process is forked (unlike pyroute2.NetNS).
+
+    Args:
+        netns_path (str): namespace file, e.g. /proc/<pid>/ns/net
+    """
+    fd = os.open(netns_path, os.O_RDONLY)
+    pushns()
+    try:
+        setns(fd)
+        ipr = IPRoute()
+    finally:
+        popns()
+        os.close(fd)
+    try:
+        yield ipr
+    finally:
+        ipr.close()
+
+
+class LinkFabric:
+    """Builds veth links between nodes using netlink only.
+
+    Links are queued with add_link() and created by build(): every veth pair is created directly inside
+    the two node namespaces with a single RTM_NEWLINK each, then every namespace is visited once to
+    assign all of its addresses, bring its interfaces up and (for servers) add the default route.
+    """
+
+    def __init__(self, ipr: IPRoute):
+        """
+        Args:
+            ipr (IPRoute): netlink socket in the host namespace (Backend.host_netlink())
+        """
+        self.ipr = ipr
+        self.links: List[Tuple] = []
+
+    def add_link(self, node_a, node_b):
+        """Queues a link between two nodes. Both nodes must already have IPs assigned in their connections."""
+        self.links.append((node_a, node_b))
+
+    def build(self, progress_callback=None):
+        """Creates all queued links.
+
+        Args:
+            progress_callback (function): Called as progress_callback(node_a, node_b) after each veth pair is created.
+        """
+        # namespaces come from each node's backend (for docker its PID cache), so no container is inspected here
+        netns_paths: Dict = {}
+        for node_a, node_b in self.links:
+            for node in (node_a, node_b):
+                if node not in netns_paths:
+                    netns_paths[node] = node.netns_path
+
+        # interface name -> (ip, default gateway or None), grouped per node
+        interfaces: Dict = {node: [] for node in netns_paths}
+        for node_a, node_b in self.links:
+            veth_a = node_a.veth_name(node_b)
+            veth_b = node_b.veth_name(node_a)
+            ip_a = node_a.connections[node_b]
+            ip_b = node_b.connections[node_a]
+
+            self.ipr.link(
+                'add',
+                ifname=veth_a,
+                kind='veth',
+                net_ns_fd=netns_paths[node_a],
+                peer={'ifname': veth_b, 'net_ns_fd': netns_paths[node_b]}
+            )
+
+            # servers need a default gateway so that traffic is sent to the switch they are connected to
+            interfaces[node_a].append((veth_a, ip_a, ip_b if isinstance(node_a, Server) else None))
+            interfaces[node_b].append((veth_b, ip_b, ip_a if isinstance(node_b, Server) else None))
+            if progress_callback:
+                progress_callback(node_a, node_b)
+
+        for node, node_interfaces in interfaces.items():
+            with node.netns_socket() as ns:
+                indexes = {link.get_attr('IFLA_IFNAME'): link['index'] for link in ns.get_links()}
+                for veth, ip_addr, gateway in node_interfaces:
+                    index = indexes[veth]
+                    ns.addr('add', index=index, address=ip_addr, prefixlen=30)
+                    ns.link('set', index=index, state='up')
+                    if gateway:
+                        ns.route('add', dst='0.0.0.0/0', gateway=gateway)
+
+        self.links = []
+
+
+def set_link_state(node_a, node_b, state: str, ends=None):
+    """Sets both ends (or only the given ends) of the veth link between two nodes 'up' or 'down'.
+
+    Bringing a server's interface down makes the kernel drop its default route, so it is put back when the
+    server's end comes up again.
+
+    Args:
+        node_a (Node): one end of the link
+        node_b (Node): the other end
+        state (str): 'up' or 'down'
+        ends (List[Node]): nodes whose end is changed, defaults to both
+    """
+    for node, peer in ((node_a, node_b), (node_b, node_a)):
+        if ends is not None and node not in ends:
+            continue
+        veth = node.veth_name(peer)
+        with node.netns_socket() as ns:
+            index = ns.link_lookup(ifname=veth)
+            if not index:
+                raise ValueError(f"{node.name} has no interface {veth}")
+            ns.link('set', index=index[0], state=state)
+            if state == 'up' and isinstance(node, Server):
+                ns.route('replace', dst='0.0.0.0/0', gateway=peer.connections[node])
@@ -0,0 +1,135 @@
+# link_table.py
+
+import socket
+from typing import List, Optional, Tuple
+import numpy as np
+from node import Server
+
+# 172.16.0.0/12, see ip_address_schema.md
+BASE_ADDRESS = 0xAC100000
+ADDRESS_SPACE = 1 << 20
+MAX_LINKS = ADDRESS_SPACE // 4
+
+
+def ip_to_int(ip: str) -> int:
+    """Dotted quad -> integer"""
+    return int.from_bytes(socket.inet_aton(ip), "big")
+
+
+def int_to_ip(value: int) -> str:
+    """Integer -> dotted quad"""
+    return socket.inet_ntoa(int(value).to_bytes(4, "big"))
+
+
+_LOW_HALVES = None  # ".c.d" for every 16 bit value, built on first use
+
+
+def ints_to_ips(values: np.ndarray) -> List[str]:
+    """Converts an array of integer addresses to dotted quads by joining precomputed halves"""
+    global _LOW_HALVES
+    if _LOW_HALVES is None:
+        _LOW_HALVES = [f".{i >> 8}.{i & 0xFF}" for i in range(1 << 16)]
+    values = np.asarray(values, dtype=np.uint32)
+    high = (values >> np.uint32(16)).tolist()
+    high_halves = {h: f"{h >> 8}.{h & 0xFF}" for h in set(high)}
+    low_halves = _LOW_HALVES
+    return [high_halves[h] + low_halves[l] for h, l in zip(high, (values & np.uint32(0xFFFF)).tolist())]
+
+
+class LinkTable:
+    """Compact, array-backed table of every point-to-point link in the topology.
+
+    Node ids are ordinals into `nodes` (also stored on each node as node.node_id). Link i connects
+    endpoint_a[i] and endpoint_b[i], whose interface addresses are ip_a[i] and ip_b[i] as integers.
+    A CSR index (offsets/node_links) gives the links of any node in O(1), and since every link owns
+    exactly one /30, a subnet index maps any address back to its link and node in O(1).
+    """
+
+    def __init__(self, nodes: List, links: List[Tuple], pods: Optional[List[int]] = None):
+        """
+        Args:
+            nodes (List[Node]): every node of the topology
+            links (List[Tuple[Node, Node]]): every link, each listed once, in allocation order
+            pods (List[int]): pod number of every node, -1 for core switches
+        """
+        self.nodes = nodes
+        for node_id, node in enumerate(nodes):
+            node.node_id = node_id
+        self.node_pod = np.asarray(pods if pods is not None else [-1] * len(nodes), dtype=np.int32)
+
+        num_links = len(links)
+        self.link_ids = np.arange(num_links, dtype=np.int32)
+        self.endpoint_a = np.fromiter((a.node_id for a, _ in links), dtype=np.int32, count=num_links)
+        self.endpoint_b = np.fromiter((b.node_id for _, b in links), dtype=np.int32, count=num_links)
+        self.ip_a = np.zeros(num_links, dtype=np.uint32)
+        self.ip_b = np.zeros(num_links, dtype=np.uint32)
+        self._subnet_index = None
+
+        # CSR adjacency: links of node n are node_links[offsets[n]:offsets[n + 1]]
+        endpoints = np.concatenate([self.endpoint_a, self.endpoint_b])
+        order = np.argsort(endpoints, kind="stable")
+        self.node_links = np.concatenate([self.link_ids, self.link_ids])[order]
+        self.offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(endpoints, minlength=len(nodes)), out=self.offsets[1:])
+
+    def __len__(self):
+        return len(self.link_ids)
+
+    def assign(self, ip_a: np.ndarray, ip_b: np.ndarray):
+        """Sets the interface addresses of every link (see address_plan.py)"""
+        self.ip_a = np.asarray(ip_a, dtype=np.uint32)
+        self.ip_b = np.asarray(ip_b, dtype=np.uint32)
+        self._subnet_index = None
+
+    def assign_sequential(self, base: int = BASE_ADDRESS):
+        """Gives link i the /30 at base + 4 * i: endpoint a gets .1 and endpoint b .2 of that subnet"""
+        if len(self) > MAX_LINKS:
+            raise ValueError("IP address space exhausted")
+        subnets = np.uint32(base) + self.link_ids.astype(np.uint32) * np.uint32(4)
+        self.assign(subnets + np.uint32(1), subnets + np.uint32(2))
+
+    def apply(self):
+        """Writes the assigned addresses into every node's connections (and Server.ip)"""
+        ips_a = ints_to_ips(self.ip_a)
+        ips_b = ints_to_ips(self.ip_b)
+        nodes = self.nodes
+        for a, b, ip_a, ip_b in zip(self.endpoint_a.tolist(), self.endpoint_b.tolist(), ips_a, ips_b):
+            node_a, node_b = nodes[a], nodes[b]
+            node_a.connections[node_b] = ip_a
+            node_b.connections[node_a] = ip_b
+        for node in nodes:
+            if isinstance(node, Server):
+                # servers have exactly one link, to their edge switch
+                node.ip = next(iter(node.connections.values()))
+
+    def pairs(self):
+        """Yields (node_a, node_b) for every link, in link id order"""
+        nodes = self.nodes
+        for a, b in zip(self.endpoint_a.tolist(), self.endpoint_b.tolist()):
+            yield nodes[a], nodes[b]
+
+    def links_of(self, node) -> np.ndarray:
+        """Ids of all links of a node"""
+        return self.node_links[self.offsets[node.node_id]:self.offsets[node.node_id + 1]]
+
+    def _subnets(self) -> dict:
+        # every link owns exactly one /30, so the subnet address identifies it
+        if self._subnet_index is None:
+            self._subnet_index = dict(zip((self.ip_a & np.uint32(0xFFFFFFFC)).tolist(), self.link_ids.tolist()))
+        return self._subnet_index
+
+    def link_of_ip(self, ip: int) -> Optional[int]:
+        """Id of the link an interface address belongs to, or None if the address is not assigned"""
+        return self._subnets().get(int(ip) & 0xFFFFFFFC)
+
+    def node_of_ip(self, ip: int) -> Optional[Tuple]:
+        """(node, link id) owning an interface address, or None"""
+        link = self.link_of_ip(ip)
+        if link is None:
+            return None
+        ip = int(ip)
+        if int(self.ip_a[link]) == ip:
+            return self.nodes[int(self.endpoint_a[link])], link
+        if int(self.ip_b[link]) == ip:
+            return self.nodes[int(self.endpoint_b[link])], link
+        return None
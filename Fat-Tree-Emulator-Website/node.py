@@ -2,11 +2,36 @@
 
 from __future__ import annotations
 from enum import Enum
+import hashlib
 import os
+import threading
 import docker
-from docker.types import Mount
 from pyroute2 import IPRoute
-import subprocess
+from config_writer import atomic_write
+
+FRR_IMAGE = 'frrouting/frr:latest'
+SERVER_IMAGE = 'nicolaka/netshoot:latest'
+
+# labels put on every container so that running fabrics can be found again (see reconcile.py)
+NODE_LABEL = 'fat-tree.node'
+ROLE_LABEL = 'fat-tree.role'
+SESSION_LABEL = 'fat-tree.session' # only on containers of a fat tree built with a session (see FatTree)
+
+IFNAMSIZ = 15 # longest interface name linux accepts
+
+
+def veth_name(name: str, peer_name: str) -> str:
+    """Name of the end of a veth link inside node `name` that leads to node `peer_name`.
+
+    Short pairs keep the readable <name><peer name>. Longer ones used to be truncated, which made all
+    servers of an edge switch collide once pod numbers reach two digits (E10-0S10-E10-0-...), so they get
+    a name derived from a hash of both names instead.
+    """
+    full = f"{name}{peer_name}"
+    if len(full) <= IFNAMSIZ:
+        return full
+    return "v" + hashlib.blake2s(full.encode(), digest_size=7).hexdigest()
+
 
 class SwitchType(Enum):
     CORE = 1
@@ -14,20 +39,52 @@ class SwitchType(Enum):
     EDGE = 3
 
 
+class PullPolicy(Enum):
+    ALWAYS = "always"         # pull on every Backend.prepare call
+    IF_MISSING = "if-missing" # pull only images that are not present locally
+    NEVER = "never"           # never pull, fail if an image is missing
+
+
 class Node:
-    # shared across all nodes
-    client = docker.from_env()
-    client.images.pull('frrouting/frr:latest')
-    client.images.pull('nicolaka/netshoot:latest')
-    ip = IPRoute()
-    
+    # shared across all nodes, created on first use so that importing this module has no side effects
+    _client = None
+    _iproute = None
+    _lock = threading.Lock()
+    # the provisioner talks to the docker daemon from several threads at once
+    docker_pool_size = 32
+    role = None # 'switch' or 'server', also the role label of the node's container
+
+    @classmethod
+    def get_client(cls) -> docker.DockerClient:
+        """Docker client shared by all nodes, created on first use"""
+        if Node._client is None:
+            with Node._lock:
+                if Node._client is None:
+                    Node._client = docker.from_env(max_pool_size=cls.docker_pool_size)
+        return Node._client
+
+    @classmethod
+    def get_iproute(cls) -> IPRoute:
+        """Netlink socket in the host namespace shared by all nodes, opened on first use"""
+        if Node._iproute is None:
+            with Node._lock:
+                if Node._iproute is None:
+                    Node._iproute = IPRoute()
+        return Node._iproute
 
-    def __init__(self, name: str, config_base:str):
+    def __init__(self, name: str, config_base:str, backend=None):
         self.name = name
         self.connections = {} # mapping between the node that the current node is connected to and the assigned ip address (internally managed to make sure that there are no repeats starting at 1.)
         self.ip_counter = 1
         self.folder_path = f"{config_base}/{self.name}"
-        self.container = None
+        if backend is None:
+            from backends import DockerBackend  # backends imports this module
+            backend = DockerBackend()
+        self.backend = backend # where the node runs, see backends.py
+        self.container = None # the backend's handle (docker container, namespace name, ...), None until started
+        self.node_id = None # ordinal in the fat tree's LinkTable, set by generate_ips
+        self._pid = None # cached container PID, resolved once per container start (DockerBackend)
+        self.index = None # NodeIndex told about this node's container changes, set by the NodeIndex
       
 
     def register_connection(self, other_node: Node):
@@ -41,47 +98,96 @@ class Node:
                 other_node.connections[self] = ""
     
 
+    def veth_name(self, other_node: Node) -> str:
+        """Name of this node's end of the veth link to other_node (see veth_name)"""
+        return veth_name(self.name, other_node.name)
+
+
     def establish_veth_link(self, other_node: Node):
-        """Creates a veth pair between two containers using their stored connection IPs"""
-        container1 = self.container
-        container2 = other_node.container
-        print(f"Adding veth connection between {container1.name} and {container2.name}")
-        
-        pid1 = self.client.api.inspect_container(container1.id)['State']['Pid']
-        pid2 = self.client.api.inspect_container(container2.id)['State']['Pid']
-        
-        # Create unique veth pair names using node names to avoid conflicts
-        
-        # we limit to 15 here because of the linux limitations
-        veth1 = f"{self.name}{other_node.name}"[:15]
-        veth2 = f"{other_node.name}{self.name}"[:15]
-        
-        # Create the veth pair
-        subprocess.run(['sudo', 'ip', 'link', 'add', veth1, 'type', 'veth', 'peer', 'name', veth2], check=True)
-        
-        # Move interfaces to their respective network namespaces
-        subprocess.run(['sudo', 'ip', 'link', 'set', veth1, 'netns', str(pid1)], check=True)
-        subprocess.run(['sudo', 'ip', 'link', 'set', veth2, 'netns', str(pid2)], check=True)
-        
-        # Get the specific IP addresses for this connection
-        ip1 = self.connections[other_node]
-        ip2 = other_node.connections[self]
-        print(f"IP 1: {ip1}")
-        print(f"IP 2: {ip2}")
-        
-        # Configure interfaces with /30 subnet mask
-        container1.exec_run(f"ip addr add {ip1}/30 dev {veth1}")
-        container1.exec_run(f"ip link set {veth1} up")
-        
-        container2.exec_run(f"ip addr add {ip2}/30 dev {veth2}")
-        container2.exec_run(f"ip link set {veth2} up")
-        
-        # for servers we need to add a default gateway so that we actually send traffic to the switch it is connected to 
-        if isinstance(self, Server):
-            self.container.exec_run(f"ip route add default via {ip2}")
-        elif isinstance(other_node, Server):
-            other_node.container.exec_run(f"ip route add default via {ip1}")
-        
+        """Creates a veth pair between two nodes using their stored connection IPs.
+        To create many links at once, queue them on a single LinkFabric instead.
+        """
+        from link_fabric import LinkFabric
+
+        print(f"Adding veth connection between {self.name} and {other_node.name}")
+        fabric = LinkFabric(self.backend.host_netlink())
+        fabric.add_link(self, other_node)
+        fabric.build()
+
+    @property
+    def container_name(self) -> str:
+        """Name of the node's instance on its backend: the node name, qualified by the backend's session if any"""
+        return self.backend.instance_name(self.name)
+
+    @property
+    def netns_path(self) -> str:
+        """Path of the node's network namespace"""
+        return self.backend.netns_path(self)
+
+    def netns_socket(self):
+        """Context manager yielding an IPRoute socket inside the node's namespace"""
+        return self.backend.netns_socket(self)
+
+    def start(self):
+        """Creates and starts the node on its backend"""
+        self.backend.create(self)
+        self._container_changed()
+
+    def attach(self):
+        """Adopts an already existing instance of this node (starting it if needed) instead of creating one"""
+        self.backend.attach(self)
+        self._container_changed()
+
+    def restart(self):
+        self.backend.restart(self)
+        self._container_changed()
+
+    def remove(self):
+        """Stops and removes this node. Does nothing if it was never started."""
+        if self.backend.exec_mux is not None:
+            self.backend.exec_mux.close_node(self)
+        self.backend.remove(self)
+        self._container_changed()
+
+    def _container_changed(self):
+        if self.index is not None:
+            self.index.update_container(self)
+
+    def pause(self):
+        self.backend.pause(self)
+
+    def unpause(self):
+        self.backend.unpause(self)
+
+    def exec_run(self, command, on_line=None):
+        """Runs a command inside the node, through the backend's ExecMux if one is enabled.
+
+        Args:
+            command (str or List[str]): command line
+            on_line (function): Called as on_line(line) with every output line (bytes). With an ExecMux lines
+                are passed on as they arrive, otherwise once the command finished.
+
+        Returns:
+            ExecResult: exit_code and output (bytes, stdout and stderr)
+        """
+        if self.backend.exec_mux is not None:
+            return self.backend.exec_mux.run(self, command, on_line=on_line)
+        result = self.backend.exec(self, command)
+        if on_line:
+            for line in result.output.splitlines():
+                on_line(line)
+        return result
+
+    def exec_batch(self, commands) -> list:
+        """Runs several commands in order, in a single round trip when an ExecMux is enabled
+
+        Returns:
+            List[ExecResult]: one result per command
+        """
+        if self.backend.exec_mux is not None:
+            return self.backend.exec_mux.run_batch(self, commands)
+        return [self.backend.exec(self, command) for command in commands]
+
 
     def __repr__(self):
         toRet = f"{self.name}:\n \nConnections: {len(self.connections)} nodes \n\n"
@@ -91,22 +197,30 @@ class Node:
 
 
 class Switch(Node):
-    def __init__(self, type: SwitchType, asn: int, name: str, config_base:str):
-        super().__init__(name=name, config_base=config_base)
+    role = 'switch'
+
+    def __init__(self, type: SwitchType, asn: int, name: str, config_base:str, backend=None):
+        super().__init__(name=name, config_base=config_base, backend=backend)
         self.type = type
         self.asn = asn
+        # set by the address plan: None announces every connected /30, otherwise only what falls inside these prefixes
+        self.advertised_prefixes = None
+        self.aggregate_prefixes = [] # announced as a single summary route instead of their more specifics
+    def generate_config_files(self) -> dict:
+        """Renders the contents of this switch's config folder
+
+        Returns:
+            dict: file name -> file content
+        """
+        return {"frr.conf": self.generate_frr_config(), "daemons": self.generate_daemon()}
+
     def generate_config_folder(self) -> None:
         """Generates config folder with frr routing and daemon file
         """
         if not os.path.exists(self.folder_path):
             os.makedirs(self.folder_path)
-        frr_conf_file = open(f"{self.folder_path}/frr.conf", "w")
-        frr_conf_file.write(self.generate_frr_config())
-        frr_conf_file.close()
-        
-        daemon_file = open(f"{self.folder_path}/daemons", "w")
-        daemon_file.write(self.generate_daemon())
-        daemon_file.close()
+        for name, content in self.generate_config_files().items():
+            atomic_write(f"{self.folder_path}/{name}", content)
     
     
     
@@ -119,83 +233,9 @@ class Switch(Node):
         return "bgpd=yes\nzebra=yes"
     
     def generate_frr_config(self) -> str:
-        config = [
-            "frr version 8.4",
-            "frr defaults traditional",
-            f"hostname {self.name}",
-            "no ipv6 forwarding",
-            "ip forwarding",
-            "!"
-        ]
-
-        # Configure interfaces (avoid duplicates)
-        seen_interfaces = set()
-        for peer, ip_addr in self.connections.items():
-            veth_name = f"{self.name}{peer.name}"[:15]
-            if veth_name not in seen_interfaces:
-                seen_interfaces.add(veth_name)
-                config.extend([
-                    f"interface {veth_name}",
-                    f" ip address {ip_addr}/30",
-                    "!"
-                ])
-
-        # Add prefix lists with incrementing sequence numbers
-        seq_num = 5
-        for peer, ip_addr in self.connections.items():
-            # Calculate network address for /30
-            ip_parts = ip_addr.split('.')
-            network = f"{ip_parts[0]}.{ip_parts[1]}.{ip_parts[2]}.{int(ip_parts[3]) & 0xFC}"
-            config.extend([
-                f"ip prefix-list LOCAL_NETS seq {seq_num} permit {network}/30",
-                "!"
-            ])
-            seq_num += 5
-
-        config.extend([
-            "route-map ANNOUNCE_LOCAL permit 10",
-            " match ip address prefix-list LOCAL_NETS",
-            "!"
-        ])
-
-        # BGP configuration
-        config.extend([
-            f"router bgp {self.asn}",
-            f" bgp router-id {sorted(list(self.connections.values()))[-1]}",
-            " bgp log-neighbor-changes",
-            " no bgp ebgp-requires-policy",
-            " timers bgp 3 9"
-        ])
-
-        # Configure neighbors
-        for peer, _ in self.connections.items():
-            if isinstance(peer, Switch):
-                peer_ip = peer.connections[self]
-                config.extend([
-                    f" neighbor {peer_ip} remote-as {peer.asn}",
-                ])
-
-        # Address family configuration
-        config.extend([
-            " address-family ipv4 unicast",
-            "  network 0.0.0.0/0",  # Advertise default route
-            "  redistribute connected route-map ANNOUNCE_LOCAL"
-        ])
-
-        for peer, _ in self.connections.items():
-            if isinstance(peer, Switch):
-                peer_ip = peer.connections[self]
-                config.append(f"  neighbor {peer_ip} activate")
-
-        config.extend([
-            "  maximum-paths 64",
-            " exit-address-family",
-            "!",
-            "line vty",
-            "!"
-        ])
-
-        return "\n".join(config)
+        """Renders frr.conf from this switch's connections (see FrrRenderer)"""
+        from frr_renderer import FrrRenderer  # frr_renderer imports this module
+        return FrrRenderer().render_switch(self)
     
     def __repr__(self):
         toRet = f"{self.name}:\nConnections: {len(self.connections)} nodes\n ASN {self.asn} \n\n"
@@ -204,51 +244,24 @@ class Switch(Node):
         return toRet
     
     
-    def create_frr_container(self):
-        # Define container configuration
-        container_config = {
-            'image': 'frrouting/frr:latest',
-            'name': self.name,
-            'network_mode': 'none',
-            'privileged':True,
-            'cap_add': ['NET_ADMIN', 'SYS_ADMIN'],
-            'mounts': [
-                Mount(
-                    target='/etc/frr',
-                    source=self.folder_path,
-                    type='bind'
-                )
-            ]
-        }
-                
-        # start container
-        self.container = Node.client.containers.create(**container_config)
-        self.container.start()
-        
-        print(f"Successfully started {self.container.name}!")
+    def reload_frr(self) -> bool:
+        """Applies the current frr.conf to the running FRR daemons without restarting them.
+
+        Returns:
+            bool: True if frr-reload succeeded
+        """
+        result = self.exec_run("/usr/lib/frr/frr-reload.py --reload /etc/frr/frr.conf")
+        if result.exit_code != 0:
+            print(f"Failed to reload FRR on {self.name}: {result.output.decode()}")
+        return result.exit_code == 0
 
 
 class Server(Node):
-    def __init__(self, name: str, config_base:str):
-        super().__init__(name=name, config_base=config_base)
-        self.ip = ""  # Initialize IP attribute
-    
-    def create_container(self):
-        # Define container configuration
-        container_config = {
-            'image': 'nicolaka/netshoot:latest',
-            'name': self.name,
-            'network_mode': 'none',
-            'cap_add': ['NET_ADMIN', 'SYS_ADMIN'],
-            'privileged':True,
-            'command':"tail -f /dev/null"
-        }
-                
-        # start container
-        self.container = Node.client.containers.create(**container_config)
-        self.container.start()
-        
-        print(f"Successfully started {self.container.name}!")
+    role = 'server'
+
+    def __init__(self, name: str, config_base:str, backend=None):
+        super().__init__(name=name, config_base=config_base, backend=backend)
+        self.ip = ""  # address of the server's only interface, set by generate_ips
     
     def ping_server(self, other_server: Server, count: int = 3) -> bool:
         """Pings another server in the fat tree topology
@@ -261,15 +274,14 @@ class Server(Node):
             bool: True if ping successful, False otherwise
         """
         if not self.container or not other_server.container:
-            print(f"Error: One or both containers not running")
+            print(f"Error: One or both servers not running")
             return False
             
-        # Get the IP of the other server's connection to its edge switch
-        # Since servers only have one connection, we can get the first (and only) one
-        target_ip = list(other_server.connections.values())[0]
+        # IP of the other server's connection to its edge switch
+        target_ip = other_server.ip
         
         print(f"\nPinging from {self.name} to {other_server.name} ({target_ip})")
-        result = self.container.exec_run(f"ping -c {count} {target_ip}")
+        result = self.exec_run(f"ping -c {count} {target_ip}")
         print(result.output.decode())
         
         # Check if ping was successful
@@ -286,14 +298,14 @@ class Server(Node):
             bool: True if traceroute successful, False otherwise
         """
         if not self.container or not other_server.container:
-            print(f"Error: One or both containers not running")
+            print(f"Error: One or both servers not running")
             return False
             
-        # Get the IP of the other server's connection to its edge switch
-        target_ip = list(other_server.connections.values())[0]
+        # IP of the other server's connection to its edge switch
+        target_ip = other_server.ip
         
         print(f"\nTracerouting from {self.name} to {other_server.name} ({target_ip})")
-        result = self.container.exec_run(f"traceroute -m {max_hops} {target_ip}")
+        result = self.exec_run(f"traceroute -m {max_hops} {target_ip}")
         print(result.output.decode())
         
         # Check if traceroute was successful (exit_code 0 typically means success)
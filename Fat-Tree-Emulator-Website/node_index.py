@@ -0,0 +1,109 @@
+# node_index.py
+
+from typing import Dict, List, Optional, Tuple
+from node import Node, Server, SwitchType
+from link_table import LinkTable, ip_to_int
+
+LAYERS = ('core', 'aggregation', 'edge', 'server')
+_SWITCH_LAYERS = {SwitchType.CORE: 'core', SwitchType.AGGREGATE: 'aggregation', SwitchType.EDGE: 'edge'}
+
+
+def layer_of(node: Node) -> str:
+    """'core', 'aggregation', 'edge' or 'server'"""
+    return 'server' if isinstance(node, Server) else _SWITCH_LAYERS[node.type]
+
+
+def container_id(node: Node) -> Optional[str]:
+    """Id of a node's instance: the docker container id, or the instance name on the other backends"""
+    if node.container is None:
+        return None
+    return getattr(node.container, 'id', node.container)
+
+
+class NodeIndex:
+    """Constant time lookups of the nodes of a fat tree by name, interface address, veth name, container id, pod
+    and layer. Built from the LinkTable once generate_ips assigned the addresses (see FatTree.generate_ips).
+
+    Addresses are resolved through the LinkTable's subnet index. Containers are mostly created after the index,
+    so nodes report every start, attach, restart and removal (see update_container).
+    """
+
+    def __init__(self, table: LinkTable):
+        """
+        Args:
+            table (LinkTable): link table of the fat tree, with addresses assigned
+        """
+        self.table = table
+        self.by_name: Dict[str, Node] = {node.name: node for node in table.nodes}
+
+        self._nodes: Dict[Tuple[Optional[int], Optional[str]], List[Node]] = {}
+        for node, pod in zip(table.nodes, table.node_pod.tolist()):
+            layer = layer_of(node)
+            pod = None if pod < 0 else pod
+            for key in {(None, None), (None, layer), (pod, None), (pod, layer)}:
+                self._nodes.setdefault(key, []).append(node)
+        self.servers: List[Server] = self.nodes(layer='server')
+        self.server_names: List[str] = [server.name for server in self.servers]
+
+        self.by_veth: Dict[str, Tuple[Node, Node]] = {}
+        for node_a, node_b in table.pairs():
+            self.by_veth[node_a.veth_name(node_b)] = (node_a, node_b)
+            self.by_veth[node_b.veth_name(node_a)] = (node_b, node_a)
+
+        self._by_container: Dict[str, Node] = {}
+        self._container_keys: Dict[str, List[str]] = {} # node name -> its keys in _by_container
+        for node in table.nodes:
+            node.index = self
+            self.update_container(node)
+
+    def node(self, name: str) -> Optional[Node]:
+        return self.by_name.get(name)
+
+    def server(self, name: str) -> Optional[Server]:
+        node = self.by_name.get(name)
+        return node if isinstance(node, Server) else None
+
+    def nodes(self, pod: Optional[int] = None, layer: Optional[str] = None) -> List[Node]:
+        """Nodes of a pod and/or layer (see LAYERS) in link table order, all nodes if both are None. Core
+        switches belong to no pod. The list is shared, callers must not modify it."""
+        return self._nodes.get((pod, layer), [])
+
+    def interface_of_ip(self, ip: str) -> Optional[Tuple[Node, str]]:
+        """(node, interface name) an interface address is assigned to, or None"""
+        try:
+            address = ip_to_int(ip)
+        except OSError:
+            return None
+        found = self.table.node_of_ip(address)
+        if found is None:
+            return None
+        node, link = found
+        table = self.table
+        peer_id = table.endpoint_b[link] if node.node_id == table.endpoint_a[link] else table.endpoint_a[link]
+        peer = table.nodes[int(peer_id)]
+        return node, node.veth_name(peer)
+
+    def node_of_veth(self, name: str) -> Optional[Tuple[Node, Node]]:
+        """(node, peer) of the veth end with that interface name, or None"""
+        return self.by_veth.get(name)
+
+    def node_of_container(self, container: str) -> Optional[Node]:
+        """Node running in a container, by docker container id (full or the 12 character short id), container
+        name or instance name, None if no running node has it"""
+        return self._by_container.get(container)
+
+    def update_container(self, node: Node):
+        """Re-indexes a node whose container was created, attached, restarted or removed"""
+        for key in self._container_keys.pop(node.name, []):
+            if self._by_container.get(key) is node:
+                del self._by_container[key]
+        instance = container_id(node)
+        if instance is None:
+            return
+        keys = [instance, node.container_name]
+        if hasattr(node.container, 'id'):
+            keys.append(instance[:12])
+        keys = list(dict.fromkeys(keys)) # the instance name is the id on every backend but docker
+        for key in keys:
+            self._by_container[key] = node
+        self._container_keys[node.name] = keys
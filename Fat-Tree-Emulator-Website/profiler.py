@@ -0,0 +1,193 @@
+# profiler.py
+
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+# container ids, exec ids and names in docker API paths are folded into one endpoint per call type
+_API_VERSION = re.compile(r"^/v[\d.]+")
+_API_ID = re.compile(r"/(containers|exec|images|networks)/[^/]+")
+
+
+# profilers between start() and stop(), see timed_run
+_started: List['BuildProfiler'] = []
+_started_lock = threading.Lock()
+
+
+def timed_run(args, *posargs, **kwargs) -> subprocess.CompletedProcess:
+    """subprocess.run, recorded by every started BuildProfiler. Backends run their host commands through it.
+
+    A process runs one build at a time (see jobs.py); profilers that overlap anyway all record the call.
+    """
+    start = time.perf_counter()
+    try:
+        return subprocess.run(args, *posargs, **kwargs)
+    finally:
+        end = time.perf_counter()
+        with _started_lock:
+            profilers = list(_started)
+        for profiler in profilers:
+            profiler._record_subprocess(args, start, end)
+
+
+def _endpoint(method: str, url: str) -> str:
+    path = url.split("://", 1)[-1]
+    path = path[path.find("/"):] if "/" in path else "/"
+    path = _API_VERSION.sub("", path.split("?", 1)[0])
+    return f"{method} {_API_ID.sub(lambda match: f'/{match.group(1)}/{{id}}', path)}"
+
+
+class BuildProfiler:
+    """Records where a build spends its time.
+
+    Phases are opened with `with profiler.phase(name):` and may nest, from any thread. While the profiler is
+    started it also records every Docker API round trip (through a requests response hook on the shared
+    client) and every host command the backends run (see timed_run). Results are available as a dict/JSON file, as a Chrome trace
+    (chrome://tracing or https://ui.perfetto.dev) and as a plain text summary table.
+    """
+
+    def __init__(self):
+        self.phases: List[dict] = []
+        self.docker_calls: List[dict] = []
+        self.subprocesses: List[dict] = []
+        self._stack = threading.local()
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._client = None
+
+    def _now(self) -> float:
+        return time.perf_counter() - self._origin
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times a block. Phases opened inside it (on the same thread) are recorded as its children."""
+        stack = getattr(self._stack, 'names', None)
+        if stack is None:
+            stack = self._stack.names = []
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        start = self._now()
+        try:
+            yield
+        finally:
+            end = self._now()
+            stack.pop()
+            with self._lock:
+                self.phases.append({
+                    'name': name,
+                    'parent': parent,
+                    'depth': len(stack),
+                    'start': start,
+                    'duration': end - start,
+                    'thread': threading.get_ident(),
+                })
+
+    def _on_response(self, response, *args, **kwargs):
+        elapsed = response.elapsed.total_seconds()
+        with self._lock:
+            self.docker_calls.append({
+                'endpoint': _endpoint(response.request.method, response.request.url),
+                'status': response.status_code,
+                'start': self._now() - elapsed,
+                'duration': elapsed,
+                'thread': threading.get_ident(),
+            })
+
+    def _record_subprocess(self, args, start: float, end: float):
+        command = args if isinstance(args, str) else " ".join(str(arg) for arg in list(args)[:3])
+        with self._lock:
+            self.subprocesses.append({
+                'command': command,
+                'start': start - self._origin,
+                'duration': end - start,
+                'thread': threading.get_ident(),
+            })
+
+    def start(self, client=None):
+        """Starts recording Docker API calls and subprocesses.
+
+        Args:
+            client (docker.DockerClient): client whose API calls are timed, e.g. Node.get_client()
+        """
+        if client is not None:
+            self._client = client
+            client.api.hooks['response'].append(self._on_response)
+        with _started_lock:
+            if self not in _started:
+                _started.append(self)
+
+    def stop(self):
+        """Removes the hooks installed by start()"""
+        if self._client is not None:
+            hooks = self._client.api.hooks['response']
+            if self._on_response in hooks:
+                hooks.remove(self._on_response)
+            self._client = None
+        with _started_lock:
+            if self in _started:
+                _started.remove(self)
+
+    @staticmethod
+    def _aggregate(records: List[dict], key: str) -> Dict[str, dict]:
+        totals: Dict[str, dict] = {}
+        for record in records:
+            entry = totals.setdefault(record[key], {'count': 0, 'total': 0.0, 'max': 0.0})
+            entry['count'] += 1
+            entry['total'] += record['duration']
+            entry['max'] = max(entry['max'], record['duration'])
+        return dict(sorted(totals.items(), key=lambda item: -item[1]['total']))
+
+    def to_dict(self) -> dict:
+        return {
+            'phases': sorted(self.phases, key=lambda phase: phase['start']),
+            'docker_api': self._aggregate(self.docker_calls, 'endpoint'),
+            'subprocesses': self._aggregate(self.subprocesses, 'command'),
+            'docker_calls': len(self.docker_calls),
+            'subprocess_calls': len(self.subprocesses),
+        }
+
+    def save_json(self, path: str):
+        with open(path, 'w') as json_file:
+            json.dump(self.to_dict(), json_file, indent=2)
+
+    def save_chrome_trace(self, path: str):
+        """Writes the phases, Docker calls and subprocesses as complete ('X') events of the Chrome trace format"""
+        pid = os.getpid()
+        events = []
+        for category, records, name_key in (('phase', self.phases, 'name'), ('docker', self.docker_calls, 'endpoint'),
+                                            ('subprocess', self.subprocesses, 'command')):
+            for record in records:
+                events.append({
+                    'name': record[name_key],
+                    'cat': category,
+                    'ph': 'X',
+                    'ts': record['start'] * 1e6,
+                    'dur': record['duration'] * 1e6,
+                    'pid': pid,
+                    'tid': record['thread'],
+                })
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+
+    def summary_table(self, top: int = 10) -> str:
+        """Phases in start order (indented by nesting) followed by the slowest Docker endpoints and subprocesses"""
+        total = max((phase['duration'] for phase in self.phases if phase['depth'] == 0), default=0.0)
+        lines = [f"{'phase':<48}{'seconds':>10}{'share':>8}"]
+        for phase in sorted(self.phases, key=lambda phase: phase['start']):
+            share = f"{phase['duration'] / total * 100:.1f}%" if total else ""
+            lines.append(f"{'  ' * phase['depth'] + phase['name']:<48}{phase['duration']:>10.3f}{share:>8}")
+        for title, totals in (('docker api', self._aggregate(self.docker_calls, 'endpoint')),
+                              ('subprocess', self._aggregate(self.subprocesses, 'command'))):
+            if not totals:
+                continue
+            lines.append("")
+            lines.append(f"{title:<48}{'calls':>8}{'total s':>10}{'mean ms':>10}{'max ms':>10}")
+            for name, entry in list(totals.items())[:top]:
+                lines.append(f"{name[:47]:<48}{entry['count']:>8}{entry['total']:>10.3f}"
+                             f"{entry['total'] / entry['count'] * 1000:>10.1f}{entry['max'] * 1000:>10.1f}")
+        return "\n".join(lines)
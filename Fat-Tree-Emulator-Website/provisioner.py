@@ -0,0 +1,97 @@
+# provisioner.py
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import Callable, List, Optional, Tuple
+from node import Node
+
+
+class ProvisioningError(Exception):
+    """Raised when a layer could not be provisioned. Every container started before the failure has already been removed."""
+
+
+class ContainerProvisioner:
+    """Creates and starts node containers with bounded concurrency, one layer at a time.
+
+    Every node in a layer is started before the next layer begins so that switches are up before the
+    nodes below them. If any node in a layer fails, the remaining work is cancelled and every container
+    created so far (in this and earlier layers) is removed again.
+    """
+
+    def __init__(self, max_workers: int = 8, progress_callback: Optional[Callable] = None,
+                 phase: Optional[Callable] = None):
+        """
+        Args:
+            max_workers (int): Maximum number of containers created/started at the same time.
+            progress_callback (function): Called as progress_callback(node, done, total) after each node starts.
+            phase (function): Context manager factory timing each layer, e.g. BuildProfiler.phase.
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_workers = max_workers
+        self.progress_callback = progress_callback
+        self.phase = phase
+
+    @staticmethod
+    def _start_node(node: Node):
+        node.start()
+        return node
+
+    def provision(self, layers: List[Tuple[str, List[Node]]]) -> List[Node]:
+        """Provisions every layer in order.
+
+        Args:
+            layers (List[Tuple[str, List[Node]]]): (layer name, nodes) pairs, provisioned in the given order.
+
+        Raises:
+            ProvisioningError: Raised if any node fails to start, after rolling back.
+
+        Returns:
+            List[Node]: all nodes that were started
+        """
+        total = sum(len(nodes) for _, nodes in layers)
+        done = 0
+        attempted: List[Node] = []
+        started: List[Node] = []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for layer_name, nodes in layers:
+                attempted.extend(nodes)
+                failures = []
+                with self.phase(f"{layer_name} layer") if self.phase else nullcontext():
+                    futures = {pool.submit(self._start_node, node): node for node in nodes}
+                    for future in as_completed(futures):
+                        node = futures[future]
+                        if future.cancelled():
+                            continue
+                        try:
+                            future.result()
+                        except Exception as e:
+                            failures.append((node, e))
+                            # stop scheduling the rest of this layer
+                            for pending in futures:
+                                pending.cancel()
+                            continue
+                        started.append(node)
+                        done += 1
+                        if self.progress_callback:
+                            self.progress_callback(node, done, total)
+
+                if failures:
+                    self.rollback(attempted, pool)
+                    node, error = failures[0]
+                    raise ProvisioningError(
+                        f"Failed to start {node.name} in {layer_name} layer "
+                        f"({len(failures)} failure(s)): {error}"
+                    ) from error
+        return started
+
+    @staticmethod
+    def rollback(nodes: List[Node], pool: ThreadPoolExecutor):
+        """Removes every node that got created on its backend, including containers that were created but never started"""
+        to_remove = [node for node in nodes if node.container is not None]
+        for future in as_completed([pool.submit(node.remove) for node in to_remove]):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error during rollback: {e}")
@@ -0,0 +1,286 @@
+# reachability.py
+
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from node import Server
+
+# per-target summary printed by `fping -q -c N`, e.g.
+# 172.16.0.82 : xmt/rcv/%loss = 3/3/0%, min/avg/max = 0.052/0.061/0.075
+# 172.16.0.86 : xmt/rcv/%loss = 3/0/100%
+FPING_SUMMARY = re.compile(
+    r"^(?P<ip>\S+)\s+: xmt/rcv/%loss = (?P<sent>\d+)/(?P<received>\d+)/(?P<loss>\d+)%"
+    r"(?:, min/avg/max = (?P<min>[\d.]+)/(?P<avg>[\d.]+)/(?P<max>[\d.]+))?"
+)
+
+
+def parse_fping_summary(output: str) -> Dict[str, dict]:
+    """Parses the per-target summary lines of `fping -q -c N`.
+
+    Args:
+        output (str): combined stdout/stderr of fping
+
+    Returns:
+        Dict[str, dict]: target ip -> {'sent', 'received', 'loss', 'min', 'avg', 'max'}. Loss is in percent,
+        RTTs are in ms and None when no reply was received.
+    """
+    stats = {}
+    for line in output.splitlines():
+        match = FPING_SUMMARY.match(line.strip())
+        if not match:
+            continue
+        stats[match.group('ip')] = {
+            'sent': int(match.group('sent')),
+            'received': int(match.group('received')),
+            'loss': float(match.group('loss')),
+            'min': float(match.group('min')) if match.group('min') else None,
+            'avg': float(match.group('avg')) if match.group('avg') else None,
+            'max': float(match.group('max')) if match.group('max') else None,
+        }
+    return stats
+
+
+# summary printed by iputils ping, e.g.
+# 4 packets transmitted, 4 received, 0% packet loss, time 3004ms
+# rtt min/avg/max/mdev = 0.061/0.074/0.095/0.013 ms
+PING_PACKETS = re.compile(r"(?P<sent>\d+) packets transmitted, (?P<received>\d+) (?:packets )?received.*?(?P<loss>[\d.]+)% packet loss")
+PING_RTT = re.compile(r"min/avg/max(?:/mdev)? = (?P<min>[\d.]+)/(?P<avg>[\d.]+)/(?P<max>[\d.]+)")
+
+
+def parse_ping_summary(output: str) -> Optional[dict]:
+    """Parses the summary of a single `ping -c N` run.
+
+    Returns:
+        Optional[dict]: {'sent', 'received', 'loss', 'min', 'avg', 'max'} like parse_fping_summary, or None if
+        the output has no summary (e.g. the command failed to start).
+    """
+    packets = PING_PACKETS.search(output)
+    if not packets:
+        return None
+    rtt = PING_RTT.search(output)
+    return {
+        'sent': int(packets.group('sent')),
+        'received': int(packets.group('received')),
+        'loss': float(packets.group('loss')),
+        'min': float(rtt.group('min')) if rtt else None,
+        'avg': float(rtt.group('avg')) if rtt else None,
+        'max': float(rtt.group('max')) if rtt else None,
+    }
+
+
+class ReachabilityMatrix:
+    """Loss and RTT for every source/destination server pair, stored as dense N x N NumPy arrays.
+
+    Rows are sources and columns destinations, both indexed by server ordinal. Pairs that were not
+    measured (including the diagonal) hold NaN, and RTTs are NaN for pairs that got no reply at all.
+    """
+
+    def __init__(self, servers: List[str], pods: List[int]):
+        """
+        Args:
+            servers (List[str]): server names, in ordinal order
+            pods (List[int]): pod number of each server
+        """
+        if len(servers) != len(pods):
+            raise ValueError("servers and pods must have the same length")
+        n = len(servers)
+        self.servers = list(servers)
+        self.pods = np.asarray(pods, dtype=np.int32)
+        self.index = {name: i for i, name in enumerate(self.servers)}
+        self.loss = np.full((n, n), np.nan, dtype=np.float32)  # percent
+        self.rtt_min = np.full((n, n), np.nan, dtype=np.float32)  # ms
+        self.rtt_avg = np.full((n, n), np.nan, dtype=np.float32)
+        self.rtt_max = np.full((n, n), np.nan, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.servers)
+
+    def _rtt(self, stat: str) -> np.ndarray:
+        return {'min': self.rtt_min, 'avg': self.rtt_avg, 'max': self.rtt_max}[stat]
+
+    def _names(self, pairs: np.ndarray) -> List[Tuple[str, str]]:
+        return [(self.servers[i], self.servers[j]) for i, j in pairs]
+
+    def set_row(self, source: int, targets: List[int], stats: List[dict]):
+        """Stores the results of one source.
+
+        Args:
+            source (int): source server ordinal
+            targets (List[int]): destination ordinals
+            stats (List[dict]): stats dict (as returned by parse_fping_summary) for each destination
+        """
+        columns = np.asarray(targets, dtype=np.intp)
+        values = np.array(
+            [[stat['loss'], stat['min'], stat['avg'], stat['max']] for stat in stats], dtype=np.float32
+        ).reshape(-1, 4)
+        self.loss[source, columns] = values[:, 0]
+        self.rtt_min[source, columns] = values[:, 1]
+        self.rtt_avg[source, columns] = values[:, 2]
+        self.rtt_max[source, columns] = values[:, 3]
+
+    def get(self, source: str, destination: str) -> dict:
+        """Stats of a single pair, by server name"""
+        i, j = self.index[source], self.index[destination]
+        return {
+            'loss': float(self.loss[i, j]),
+            'min': float(self.rtt_min[i, j]),
+            'avg': float(self.rtt_avg[i, j]),
+            'max': float(self.rtt_max[i, j]),
+        }
+
+    def measured(self) -> np.ndarray:
+        """Boolean N x N mask of the pairs that have a result"""
+        return ~np.isnan(self.loss)
+
+    def pairs_above(self, ms: float, stat: str = 'avg') -> List[Tuple[str, str]]:
+        """All (source, destination) pairs whose RTT statistic is above ms"""
+        with np.errstate(invalid='ignore'):
+            return self._names(np.argwhere(self._rtt(stat) > ms))
+
+    def pairs_with_loss(self, threshold: float = 0.0) -> List[Tuple[str, str]]:
+        """All (source, destination) pairs with loss above threshold percent"""
+        with np.errstate(invalid='ignore'):
+            return self._names(np.argwhere(self.loss > threshold))
+
+    def unreachable_pairs(self) -> List[Tuple[str, str]]:
+        """All pairs that lost every ping"""
+        with np.errstate(invalid='ignore'):
+            return self._names(np.argwhere(self.loss >= 100.0))
+
+    def pod_loss(self) -> np.ndarray:
+        """P x P matrix of the mean loss (percent) between servers of each pod pair"""
+        num_pods = int(self.pods.max()) + 1 if len(self.pods) else 0
+        measured = self.measured()
+        src, dst = np.nonzero(measured)
+        totals = np.zeros((num_pods, num_pods), dtype=np.float64)
+        counts = np.zeros((num_pods, num_pods), dtype=np.int64)
+        np.add.at(totals, (self.pods[src], self.pods[dst]), self.loss[src, dst])
+        np.add.at(counts, (self.pods[src], self.pods[dst]), 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return totals / counts
+
+    def pods_with_loss(self) -> List[int]:
+        """Pods that have any loss, as source or as destination"""
+        with np.errstate(invalid='ignore'):
+            src, dst = np.nonzero(self.loss > 0)
+        return np.unique(np.concatenate([self.pods[src], self.pods[dst]])).tolist()
+
+    def compare(self, other: 'ReachabilityMatrix') -> dict:
+        """Compares this run with an earlier one over the same servers.
+
+        Returns:
+            dict: 'loss_delta' and 'rtt_avg_delta' N x N arrays (this - other), plus the pairs that 'regressed'
+            (reachable before, lossy now) and 'recovered' (lossy before, loss-free now)
+        """
+        if self.servers != other.servers:
+            raise ValueError("Cannot compare reachability matrices of different server sets")
+        with np.errstate(invalid='ignore'):
+            regressed = np.argwhere((other.loss == 0) & (self.loss > 0))
+            recovered = np.argwhere((other.loss > 0) & (self.loss == 0))
+        return {
+            'loss_delta': self.loss - other.loss,
+            'rtt_avg_delta': self.rtt_avg - other.rtt_avg,
+            'regressed': self._names(regressed),
+            'recovered': self._names(recovered),
+        }
+
+    def summary(self) -> dict:
+        """Fabric-wide counts and RTT percentiles"""
+        measured = self.measured()
+        with np.errstate(invalid='ignore'):
+            lossy = int(np.count_nonzero(self.loss > 0))
+            unreachable = int(np.count_nonzero(self.loss >= 100.0))
+        rtts = self.rtt_avg[~np.isnan(self.rtt_avg)]
+        return {
+            'servers': len(self.servers),
+            'pairs': int(np.count_nonzero(measured)),
+            'lossy_pairs': lossy,
+            'unreachable_pairs': unreachable,
+            'rtt_avg_p50': float(np.percentile(rtts, 50)) if rtts.size else None,
+            'rtt_avg_p99': float(np.percentile(rtts, 99)) if rtts.size else None,
+        }
+
+    def save(self, path: str):
+        """Saves the matrix to a compressed .npz file"""
+        np.savez_compressed(
+            path,
+            servers=np.array(self.servers),
+            pods=self.pods,
+            loss=self.loss,
+            rtt_min=self.rtt_min,
+            rtt_avg=self.rtt_avg,
+            rtt_max=self.rtt_max,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'ReachabilityMatrix':
+        """Loads a matrix written by save()"""
+        with np.load(path) as data:
+            matrix = cls(data['servers'].tolist(), data['pods'])
+            matrix.loss = data['loss']
+            matrix.rtt_min = data['rtt_min']
+            matrix.rtt_avg = data['rtt_avg']
+            matrix.rtt_max = data['rtt_max']
+        return matrix
+
+
+class ReachabilityEngine:
+    """Runs one fping per source server against every other server, with the sources spread over a worker pool."""
+
+    def __init__(self, servers: List[Server], pods: List[int], max_workers: int = 16, count: int = 3,
+                 timeout_ms: int = 1000, progress_callback: Optional[Callable] = None):
+        """
+        Args:
+            servers (List[Server]): servers to test, in the order used for the result matrix
+            pods (List[int]): pod number of each server
+            max_workers (int): maximum number of fping runs in flight
+            count (int): pings sent to each target
+            timeout_ms (int): fping per-ping timeout
+            progress_callback (function): Called as progress_callback(server, stats, done, total) after each source finishes.
+        """
+        self.servers = servers
+        self.pods = pods
+        self.max_workers = max_workers
+        self.count = count
+        self.timeout_ms = timeout_ms
+        self.progress_callback = progress_callback
+
+    def _ping_from(self, source: Server, targets: List[str]) -> Dict[str, dict]:
+        fping_cmd = f"fping -q -c {self.count} -t {self.timeout_ms} {' '.join(targets)}"
+        result = source.exec_run(fping_cmd)
+        return parse_fping_summary(result.output.decode())
+
+    def run(self) -> ReachabilityMatrix:
+        """Runs the full mesh.
+
+        Returns:
+            ReachabilityMatrix: loss/RTT of every pair. Targets that fping did not report on count as 100% loss.
+        """
+        ips = [server.ip for server in self.servers]
+        total = len(self.servers)
+        matrix = ReachabilityMatrix([server.name for server in self.servers], self.pods)
+        lost = {'sent': self.count, 'received': 0, 'loss': 100.0, 'min': None, 'avg': None, 'max': None}
+        done = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {}
+            for i, server in enumerate(self.servers):
+                targets = [ip for j, ip in enumerate(ips) if j != i]
+                if targets:
+                    futures[pool.submit(self._ping_from, server, targets)] = i
+
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    stats = future.result()
+                except Exception as e:
+                    print(f"fping from {self.servers[i].name} failed: {e}")
+                    stats = {}
+                targets = [j for j in range(total) if j != i]
+                matrix.set_row(i, targets, [stats.get(ips[j], lost) for j in targets])
+                done += 1
+                if self.progress_callback:
+                    self.progress_callback(self.servers[i], stats, done, total)
+
+        return matrix
@@ -0,0 +1,198 @@
+# reconcile.py
+
+from __future__ import annotations
+import socket
+from typing import Dict, List, Set, Tuple
+from node import Node, Switch
+from link_fabric import LinkFabric
+from provisioner import ContainerProvisioner
+
+
+class TopologyReconciler:
+    """Brings the running nodes, veth links and config files in line with a FatTree model, touching only what differs.
+
+    Every backend the fat tree uses lists the instances it created (for docker, containers carrying the
+    fat-tree.node label) and they are matched to model nodes by name. Nodes that already run on their own
+    backend with the right role are adopted as they are, so their FRR daemons keep running and keep their BGP
+    sessions; only a switch whose config hash changed gets an in-place frr-reload. Missing nodes are
+    provisioned, instances of nodes that left the model are removed, and only links that are missing or
+    carry the wrong addresses are (re)created.
+    """
+
+    def __init__(self, fat_tree):
+        """
+        Args:
+            fat_tree (FatTree): desired topology, with IPs already assigned (generate_ips)
+        """
+        self.fat_tree = fat_tree
+        self.log = fat_tree.log
+
+    def _nodes(self) -> List[Node]:
+        nodes: List[Node] = list(self.fat_tree.core_switches)
+        for pod in self.fat_tree.pods:
+            nodes.extend(pod.aggregation_switches)
+            nodes.extend(pod.edge_switches)
+            nodes.extend(pod.servers)
+        return nodes
+
+    def sync_configs(self) -> Set[str]:
+        """Writes only the config folders whose content hash differs from the manifest (see ConfigWriter)
+
+        Returns:
+            Set[str]: names of switches whose config was written
+        """
+        return set(self.fat_tree.generate_configs())
+
+    def running_nodes(self) -> Dict[str, Tuple[str, object]]:
+        """Instances created by the emulator on this host: node name -> (role, backend)"""
+        running = {}
+        for backend in self.fat_tree.backends():
+            for name, role in backend.running().items():
+                running[name] = (role, backend)
+        return running
+
+    def plan(self) -> dict:
+        """Compares the model with the instances on the host.
+
+        Returns:
+            dict: 'keep' nodes to adopt, 'create' nodes without an instance and 'remove' (name, backend) pairs of
+            instances that do not belong to any node of the model
+        """
+        existing = self.running_nodes()
+        keep, create = [], []
+        for node in self._nodes():
+            instance = existing.pop(node.name, None)
+            if instance is not None and instance == (node.role, node.backend):
+                keep.append(node)
+            else:
+                if instance is not None:
+                    existing[node.name] = instance
+                create.append(node)
+        return {'keep': keep, 'create': create, 'remove': [(name, backend) for name, (_, backend) in existing.items()]}
+
+    @staticmethod
+    def _interfaces(node: Node) -> Dict[str, Tuple[int, Set[str], bool]]:
+        """ifname -> (index, IPv4 addresses, is veth) inside the node's namespace"""
+        with node.netns_socket() as ns:
+            addresses: Dict[int, Set[str]] = {}
+            for addr in ns.get_addr(family=socket.AF_INET):
+                addresses.setdefault(addr['index'], set()).add(addr.get_attr('IFA_ADDRESS'))
+            interfaces = {}
+            for link in ns.get_links():
+                link_info = link.get_attr('IFLA_LINKINFO')
+                is_veth = link_info is not None and link_info.get_attr('IFLA_INFO_KIND') == 'veth'
+                interfaces[link.get_attr('IFLA_IFNAME')] = (link['index'], addresses.get(link['index'], set()), is_veth)
+        return interfaces
+
+    def sync_links(self, kept: List[Node]) -> int:
+        """Creates every link that is missing or has the wrong addresses and removes veths that are not in the model.
+
+        Args:
+            kept (List[Node]): nodes that were adopted; every other node was freshly created
+
+        Returns:
+            int: number of links created
+        """
+        kept_set = set(kept)
+        interfaces = {node: self._interfaces(node) for node in kept}
+        wanted: Dict[Node, Set[str]] = {node: set() for node in kept}
+        stale: Dict[Node, Set[str]] = {node: set() for node in kept}
+        fabric = LinkFabric(self.fat_tree.switch_backend.host_netlink())
+        created = 0
+
+        for node_a, node_b in self.fat_tree.link_table.pairs():
+            ends = [
+                (node_a, node_a.veth_name(node_b), node_a.connections[node_b]),
+                (node_b, node_b.veth_name(node_a), node_b.connections[node_a]),
+            ]
+            for node, veth, _ in ends:
+                if node in kept_set:
+                    wanted[node].add(veth)
+            intact = all(
+                node in kept_set and veth in interfaces[node] and ip_addr in interfaces[node][veth][1]
+                for node, veth, ip_addr in ends
+            )
+            if intact:
+                continue
+            for node, veth, _ in ends:
+                if node in kept_set and veth in interfaces[node]:
+                    stale[node].add(veth)
+            fabric.add_link(node_a, node_b)
+            created += 1
+
+        for node in kept:
+            for ifname, (_, _, is_veth) in interfaces[node].items():
+                if is_veth and ifname not in wanted[node]:
+                    stale[node].add(ifname)
+
+        # deleting one end of a veth pair deletes its peer as well, so a missing index is expected here
+        for node, names in stale.items():
+            if not names:
+                continue
+            with node.netns_socket() as ns:
+                for ifname in names:
+                    index = ns.link_lookup(ifname=ifname)
+                    if index:
+                        ns.link('del', index=index[0])
+                        self.log(f"Removed stale interface {ifname} on {node.name}")
+
+        fabric.build(
+            progress_callback=lambda a, b: self.log(f"Established veth link between {a.name} and {b.name}")
+        )
+        return created
+
+    def reconcile(self) -> dict:
+        """Applies the difference between the model and the host.
+
+        Returns:
+            dict: counts of kept, created and removed nodes, (re)created links and reloaded switches
+        """
+        changed_configs = self.sync_configs()
+        plan = self.plan()
+
+        for name, backend in plan['remove']:
+            backend.remove_by_name(name)
+            self.log(f"Removed {name} (no longer part of the topology)")
+
+        kept = []
+        for node in plan['keep']:
+            node.attach()
+            kept.append(node)
+
+        create = set(plan['create'])
+        layers = [
+            ("core", [n for n in self.fat_tree.core_switches if n in create]),
+            ("aggregation", [n for pod in self.fat_tree.pods for n in pod.aggregation_switches if n in create]),
+            ("edge", [n for pod in self.fat_tree.pods for n in pod.edge_switches if n in create]),
+            ("server", [n for pod in self.fat_tree.pods for n in pod.servers if n in create]),
+        ]
+        provisioner = ContainerProvisioner(
+            max_workers=self.fat_tree.max_workers,
+            progress_callback=lambda node, done, total: self.log(f"Created {node.name} ({done}/{total})"),
+            phase=self.fat_tree.profiler.phase
+        )
+        # timed like FatTree.create_containers, so incremental builds report their provisioning time too
+        with self.fat_tree.profiler.phase("create_containers"):
+            provisioner.provision(layers)
+
+        links = self.sync_links(kept)
+
+        reloaded = 0
+        for node in kept:
+            if isinstance(node, Switch) and node.name in changed_configs:
+                if node.reload_frr():
+                    reloaded += 1
+                    self.log(f"Reloaded FRR config on {node.name}")
+
+        summary = {
+            'kept': len(kept),
+            'created': len(create),
+            'removed': len(plan['remove']),
+            'links': links,
+            'reloaded': reloaded,
+        }
+        self.log(
+            f"Reconciled topology: kept {summary['kept']}, created {summary['created']}, removed {summary['removed']} "
+            f"nodes; (re)created {summary['links']} links; reloaded {summary['reloaded']} switches"
+        )
+        return summary
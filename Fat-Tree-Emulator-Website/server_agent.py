@@ -0,0 +1,314 @@
+# server_agent.py
+#
+# One long-lived process that holds the network namespaces of all servers and runs their pings, traceroutes
+# and traffic, controlled over a single Unix socket with one JSON object per line. AgentServerBackend
+# (backends.py) starts it on demand; to run it by hand (as root):
+#     python3 server_agent.py --socket /run/fat-tree-agent.sock
+
+import argparse
+import itertools
+import json
+import os
+import random
+import select
+import socket
+import socketserver
+import statistics
+import struct
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from pyroute2 import IPRoute, netns
+from pyroute2.netns import setns
+
+DEFAULT_SOCKET = '/run/fat-tree-agent.sock'
+DEFAULT_PREFIX = 'fta-'
+NETNS_DIR = '/var/run/netns'
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+
+class AgentError(Exception):
+    """Raised by AgentClient when the agent rejects a request or the connection is lost"""
+
+
+def checksum(data: bytes) -> int:
+    """Internet checksum (RFC 1071)"""
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def echo_request(identifier: int, sequence: int, payload: bytes = b'\0' * 56) -> bytes:
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum(header + payload), identifier, sequence) + payload
+
+
+def format_ping(target: str, sent: int, replies: List[tuple], elapsed_ms: float) -> str:
+    """Renders a ping run like iputils ping, so parse_ping_summary reads it.
+
+    Args:
+        replies (List[tuple]): (sequence, ttl, rtt in ms) of every reply
+    """
+    lines = [f"PING {target} ({target}) 56(84) bytes of data."]
+    lines += [f"64 bytes from {target}: icmp_seq={seq} ttl={ttl} time={rtt:.3f} ms" for seq, ttl, rtt in replies]
+    loss = (sent - len(replies)) / sent * 100 if sent else 0.0
+    lines += ["", f"--- {target} ping statistics ---",
+              f"{sent} packets transmitted, {len(replies)} received, {loss:g}% packet loss, time {elapsed_ms:.0f}ms"]
+    if replies:
+        rtts = [rtt for _, _, rtt in replies]
+        lines.append(f"rtt min/avg/max/mdev = {min(rtts):.3f}/{statistics.mean(rtts):.3f}/{max(rtts):.3f}/"
+                     f"{statistics.pstdev(rtts):.3f} ms")
+    return "\n".join(lines) + "\n"
+
+
+class ServerAgent:
+    """Holds one bare network namespace per server and runs commands inside them.
+
+    Namespaces are named <prefix><server> and bind-mounted under /var/run/netns, so they outlive the agent
+    and a restarted agent finds them again. Pings are answered natively from a raw ICMP socket opened inside
+    the server's namespace, so a ping mesh costs no process per probe; every other command (traceroute,
+    fping, iperf3, ...) is forked straight into the namespace, using the host's binaries.
+    """
+
+    def __init__(self, prefix: str = DEFAULT_PREFIX, max_workers: int = 256):
+        """
+        Args:
+            prefix (str): prepended to server names to form namespace names
+            max_workers (int): maximum number of requests handled at once, over all connections
+        """
+        self.prefix = prefix
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        # opened before any worker thread exists, so it is the namespace the agent was started in
+        self._root_fd = os.open('/proc/self/ns/net', os.O_RDONLY)
+
+    def namespace(self, server: str) -> str:
+        return f"{self.prefix}{server}"
+
+    def netns_path(self, server: str) -> str:
+        return os.path.join(NETNS_DIR, self.namespace(server))
+
+    def _open_in(self, server: str, factory):
+        """Calls factory (e.g. a socket constructor) inside a server's namespace. Sockets stay bound to the
+        namespace they were created in; only the calling thread switches, and it switches back right away."""
+        fd = os.open(self.netns_path(server), os.O_RDONLY)
+        try:
+            setns(fd, flags=0)
+            try:
+                return factory()
+            finally:
+                setns(self._root_fd, flags=0)
+        finally:
+            os.close(fd)
+
+    def create(self, server: str) -> dict:
+        """Creates the server's namespace (if missing) with its loopback up"""
+        namespace = self.namespace(server)
+        if not os.path.exists(self.netns_path(server)):
+            netns.create(namespace)
+        ipr = self._open_in(server, IPRoute)
+        try:
+            ipr.link('set', index=ipr.link_lookup(ifname='lo')[0], state='up')
+        finally:
+            ipr.close()
+        return {'netns_path': self.netns_path(server)}
+
+    def remove(self, server: str) -> dict:
+        if os.path.exists(self.netns_path(server)):
+            netns.remove(self.namespace(server))
+        return {}
+
+    def list(self) -> dict:
+        return {'servers': [name[len(self.prefix):] for name in netns.listnetns() if name.startswith(self.prefix)]}
+
+    def ping(self, server: str, target: str, count: int = 3, interval: float = 0.2, timeout: float = 1.0) -> dict:
+        """Sends count ICMP echo requests from the server's namespace and waits up to timeout for each reply.
+
+        Returns:
+            dict: 'exit_code' (like ping: 0 if any reply came back, 1 if none, 2 if sending failed) and 'output'
+            in iputils format
+        """
+        sock = self._open_in(server, lambda: socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP))
+        # the raw socket sees every ICMP packet of the namespace, so replies are matched by id and sequence
+        identifier = random.getrandbits(16)
+        replies = []
+        start = time.monotonic()
+        try:
+            for sequence in range(1, count + 1):
+                sent_at = time.monotonic()
+                try:
+                    sock.sendto(echo_request(identifier, sequence), (target, 0))
+                except OSError as e:
+                    # e.g. no route to the target; ping reports these with exit code 2
+                    return {'exit_code': 2, 'output': f"ping: {target}: {e.strerror}\n"}
+                deadline = sent_at + timeout
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not select.select([sock], [], [], remaining)[0]:
+                        break
+                    packet = sock.recv(2048)
+                    header_length = (packet[0] & 0x0F) * 4
+                    icmp_type, _, _, reply_id, reply_sequence = struct.unpack(
+                        '!BBHHH', packet[header_length:header_length + 8]
+                    )
+                    if icmp_type == ICMP_ECHO_REPLY and reply_id == identifier and reply_sequence == sequence:
+                        replies.append((sequence, packet[8], (time.monotonic() - sent_at) * 1000))
+                        break
+                if sequence < count:
+                    time.sleep(max(0.0, interval - (time.monotonic() - sent_at)))
+        finally:
+            sock.close()
+        elapsed_ms = (time.monotonic() - start) * 1000
+        return {'exit_code': 0 if replies else 1, 'output': format_ping(target, count, replies, elapsed_ms)}
+
+    def exec(self, server: str, argv: List[str], timeout: Optional[float] = None) -> dict:
+        """Runs a command inside the server's namespace, stderr merged into stdout"""
+        # nsenter instead of a preexec_fn calling setns: preexec_fn is not safe with the agent's thread pool
+        argv = ["nsenter", f"--net={self.netns_path(server)}"] + list(argv)
+        try:
+            result = subprocess.run(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
+        except subprocess.TimeoutExpired as e:
+            return {'exit_code': 124, 'output': (e.output or b'').decode(errors='replace')}
+        except OSError as e:
+            return {'exit_code': 127, 'output': str(e)}
+        return {'exit_code': result.returncode, 'output': result.stdout.decode(errors='replace')}
+
+    def handle(self, request: dict) -> dict:
+        """Runs one request: {'id', 'op', ...arguments of the op} -> {'id', 'ok', ...result or 'error'}"""
+        operations = {
+            'create': lambda: self.create(request['server']),
+            'remove': lambda: self.remove(request['server']),
+            'list': self.list,
+            'ping': lambda: self.ping(request['server'], request['target'], request.get('count', 3),
+                                      request.get('interval', 0.2), request.get('timeout', 1.0)),
+            'exec': lambda: self.exec(request['server'], request['argv'], request.get('timeout')),
+        }
+        try:
+            if request.get('op') not in operations:
+                raise ValueError(f"unknown op {request.get('op')!r}")
+            if request['op'] in ('ping', 'exec') and not os.path.exists(self.netns_path(request['server'])):
+                raise ValueError(f"unknown server {request['server']!r}")
+            response = operations[request['op']]()
+            response['ok'] = True
+        except Exception as e:
+            response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+        response['id'] = request.get('id')
+        return response
+
+    def serve(self, socket_path: str = DEFAULT_SOCKET):
+        """Serves requests on a Unix socket until interrupted. Requests of one connection may be pipelined;
+        they run concurrently and every response carries the id of its request."""
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        agent = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                write_lock = threading.Lock()
+
+                def respond(future):
+                    with write_lock:
+                        self.wfile.write(json.dumps(future.result()).encode() + b"\n")
+                        self.wfile.flush()
+
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                    except ValueError:
+                        continue
+                    agent.pool.submit(agent.handle, request).add_done_callback(respond)
+
+        class Server(socketserver.ThreadingUnixStreamServer):
+            daemon_threads = True # connections that stay open must not keep the agent from exiting
+
+        with Server(socket_path, Handler) as server:
+            os.chmod(socket_path, 0o600)
+            print(f"Server agent listening on {socket_path}")
+            try:
+                server.serve_forever()
+            finally:
+                os.unlink(socket_path)
+
+
+class AgentClient:
+    """Thread-safe client of a ServerAgent. All callers share one connection: requests are tagged with an id
+    and a reader thread hands every response to the caller waiting for it."""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, list] = {}  # id -> [event, response]
+        self._lock = threading.Lock()
+        self._closed = False
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        try:
+            for line in self.sock.makefile('rb'):
+                response = json.loads(line)
+                with self._lock:
+                    waiter = self._pending.pop(response.get('id'), None)
+                if waiter:
+                    waiter[1] = response
+                    waiter[0].set()
+        except (OSError, ValueError):
+            pass
+        # the connection is gone, wake everybody up
+        with self._lock:
+            self._closed = True
+            pending, self._pending = self._pending, {}
+        for waiter in pending.values():
+            waiter[0].set()
+
+    def request(self, op: str, wait: Optional[float] = None, **arguments) -> dict:
+        """Sends one request and waits for its response.
+
+        Args:
+            op (str): 'create', 'remove', 'list', 'ping' or 'exec'
+            wait (float): seconds to wait for the response, forever by default
+            **arguments: arguments of the op, e.g. server, target, count, argv or timeout
+
+        Raises:
+            AgentError: Raised if the agent reports an error, the connection is lost or no response arrives
+                within wait seconds
+        """
+        waiter = [threading.Event(), None]
+        with self._lock:
+            if self._closed:
+                raise AgentError("connection to the server agent is closed")
+            request_id = next(self._ids)
+            self._pending[request_id] = waiter
+            self.sock.sendall(json.dumps(dict(arguments, id=request_id, op=op)).encode() + b"\n")
+        if not waiter[0].wait(wait):
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise AgentError(f"no response to {op} within {wait}s")
+        response = waiter[1]
+        if response is None:
+            raise AgentError("connection to the server agent was lost")
+        if not response['ok']:
+            raise AgentError(response['error'])
+        return response
+
+    def close(self):
+        self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Holds the namespaces of all fat tree servers and runs their commands")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket to listen on")
+    parser.add_argument("--prefix", default=DEFAULT_PREFIX, help="prefix of the namespace names")
+    parser.add_argument("--max-workers", type=int, default=256, help="requests handled at once")
+    args = parser.parse_args()
+    ServerAgent(prefix=args.prefix, max_workers=args.max_workers).serve(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+# conftest.py
+
+import os
+import sys
+
+# the modules live flat next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,71 @@
+# test_failover.py
+
+import pytest
+
+from backends import DryRunBackend
+from failover import FailoverBenchmark, FaultEvent, loss_windows
+from fat_tree import FatTree
+
+
+def test_gap_between_replies():
+    windows = loss_windows([(1, 10.0), (2, 10.1), (5, 10.4)], sent=5, start_time=9.9, end_time=11.0)
+    assert windows == [{'start': 10.1, 'end': 10.4, 'duration': 10.4 - 10.1, 'lost': 2}]
+
+
+def test_no_loss():
+    assert loss_windows([(1, 10.0), (2, 10.1)], sent=2, start_time=9.9, end_time=11.0) == []
+
+
+def test_loss_before_first_reply():
+    windows = loss_windows([(4, 10.3), (5, 10.4)], sent=5, start_time=10.0, end_time=11.0)
+    assert windows == [{'start': 10.0, 'end': 10.3, 'duration': 10.3 - 10.0, 'lost': 3}]
+
+
+def test_no_replies():
+    windows = loss_windows([], sent=50, start_time=10.0, end_time=15.0)
+    assert windows == [{'start': 10.0, 'end': None, 'duration': 5.0, 'lost': 50}]
+
+
+def test_no_replies_without_summary():
+    assert loss_windows([], sent=None, start_time=10.0, end_time=15.0)[0]['lost'] == 0
+
+
+def test_never_recovers():
+    windows = loss_windows([(1, 10.0), (2, 10.1)], sent=6, start_time=9.9, end_time=11.0)
+    assert windows == [{'start': 10.1, 'end': None, 'duration': 11.0 - 10.1, 'lost': 4}]
+
+
+@pytest.fixture
+def fat_tree(tmp_path):
+    fat_tree = FatTree(4, str(tmp_path / "configs"), lambda message, error=False: None,
+                       switch_backend=DryRunBackend(), session='failover-test')
+    fat_tree.build_fat_tree(convergence_timeout=None)
+    return fat_tree
+
+
+def test_rejects_empty_pairs(fat_tree):
+    with pytest.raises(ValueError):
+        FailoverBenchmark(fat_tree, [])
+
+
+def test_rejects_unknown_servers(fat_tree):
+    source = fat_tree.node_index.server_names[0]
+    with pytest.raises(ValueError, match="not found"):
+        FailoverBenchmark(fat_tree, [(source, 'S9-E9-9-9')])
+
+
+class BrokenFault(FaultEvent):
+    """Fails its switch, then raises as if the schedule broke halfway"""
+
+    def fail(self, fat_tree):
+        super().fail(fat_tree)
+        raise RuntimeError("injected")
+
+
+def test_aborted_schedule_restores_the_failed_target(fat_tree):
+    servers = fat_tree.node_index.server_names
+    benchmark = FailoverBenchmark(fat_tree, [(servers[0], servers[-1])], warmup=0)
+    switch = fat_tree.all_switches()[0].name
+    with pytest.raises(RuntimeError, match="injected"):
+        benchmark.run([BrokenFault('switch', switch, hold=0, settle=0)])
+    assert fat_tree.failed_switches == {}
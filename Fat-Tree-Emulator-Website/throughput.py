@@ -0,0 +1,283 @@
+# throughput.py
+
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from node import Server
+
+IPERF_BASE_PORT = 5201
+
+
+def parse_iperf3_json(output: str, udp: bool = False) -> Optional[dict]:
+    """Parses the report of `iperf3 -J` on the client.
+
+    Returns:
+        Optional[dict]: {'gbps', 'retransmits', 'jitter_ms', 'lost_percent'} (retransmits are TCP only, jitter and
+        loss UDP only, the others None), or None if iperf3 failed
+    """
+    try:
+        end = json.loads(output)['end']
+    except (ValueError, KeyError, TypeError):
+        return None
+    if udp:
+        total = end.get('sum', {})
+        return {
+            'gbps': total.get('bits_per_second', 0.0) / 1e9,
+            'retransmits': None,
+            'jitter_ms': total.get('jitter_ms'),
+            'lost_percent': total.get('lost_percent'),
+        }
+    return {
+        'gbps': end.get('sum_received', {}).get('bits_per_second', 0.0) / 1e9,
+        'retransmits': end.get('sum_sent', {}).get('retransmits'),
+        'jitter_ms': None,
+        'lost_percent': None,
+    }
+
+
+# traffic patterns: each returns rounds of (source, destination) server ordinals, the flows of a round run together
+
+def pairwise_pattern(num_servers: int, pairs: Optional[List[Tuple[int, int]]] = None) -> List[List[Tuple[int, int]]]:
+    """The given pairs, or by default every server to the server half the fabric away (stride N/2)"""
+    if pairs is None:
+        pairs = [(i, (i + num_servers // 2) % num_servers) for i in range(num_servers)]
+    return [list(pairs)]
+
+
+def permutation_pattern(num_servers: int, seed: int = 0) -> List[List[Tuple[int, int]]]:
+    """A random permutation without fixed points: every server sends to and receives from exactly one server"""
+    rng = random.Random(seed)
+    order = list(range(num_servers))
+    rng.shuffle(order)
+    # shifting a shuffled cycle by one never maps a server onto itself
+    return [[(order[i], order[(i + 1) % num_servers]) for i in range(num_servers)]] if num_servers > 1 else [[]]
+
+
+def all_to_all_pattern(num_servers: int) -> List[List[Tuple[int, int]]]:
+    """Every ordered pair, as N-1 rounds where round r sends i -> i + r, so each round is a permutation"""
+    return [[(i, (i + r) % num_servers) for i in range(num_servers)] for r in range(1, num_servers)]
+
+
+def pod_to_pod_pattern(pods: List[int], source_pod: int, destination_pod: int) -> List[List[Tuple[int, int]]]:
+    """The j-th server of one pod to the j-th server of another, all at once"""
+    sources = [i for i, pod in enumerate(pods) if pod == source_pod]
+    destinations = [i for i, pod in enumerate(pods) if pod == destination_pod]
+    return [list(zip(sources, destinations))]
+
+
+def flow_ports(flows: List[Tuple]) -> List[int]:
+    """iperf3 port of every flow: an iperf3 server runs one test at a time, so a destination that receives
+    several flows at once gets one server per flow, on consecutive ports from IPERF_BASE_PORT"""
+    ports = []
+    incoming: Dict = {}
+    for _, destination in flows:
+        ports.append(IPERF_BASE_PORT + incoming.get(destination, 0))
+        incoming[destination] = incoming.get(destination, 0) + 1
+    return ports
+
+
+def _iperf3_pidfile(server: Server, port: int) -> str:
+    # the instance name keeps the files of nodes sharing the host's /tmp (netns, agent backends) apart
+    return f"/tmp/iperf3-{server.container_name}-{port}.pid"
+
+
+def start_iperf3_server(server: Server, port: int):
+    """Starts a daemonized iperf3 server inside a server node"""
+    server.exec_run(f"iperf3 -s -D -p {port} -I {_iperf3_pidfile(server, port)}")
+
+
+def stop_iperf3_server(server: Server, port: int):
+    """Stops an iperf3 server started by start_iperf3_server. Killed by its pid, since on the netns and agent
+    backends it is a host process and pkill would hit the iperf3 servers of other nodes."""
+    pidfile = _iperf3_pidfile(server, port)
+    server.exec_run(["sh", "-c", f"kill $(cat {pidfile}) 2>/dev/null; rm -f {pidfile}"])
+
+
+class ThroughputMatrix:
+    """Gbps, TCP retransmits and UDP jitter of every measured source/destination pair (N x N, NaN when unmeasured)"""
+
+    def __init__(self, servers: List[str], pods: List[int]):
+        n = len(servers)
+        self.servers = list(servers)
+        self.pods = np.asarray(pods, dtype=np.int32)
+        self.index = {name: i for i, name in enumerate(self.servers)}
+        self.gbps = np.full((n, n), np.nan, dtype=np.float32)
+        self.retransmits = np.full((n, n), np.nan, dtype=np.float32)
+        self.jitter_ms = np.full((n, n), np.nan, dtype=np.float32)
+
+    def set(self, source: int, destination: int, stats: dict):
+        self.gbps[source, destination] = stats['gbps']
+        if stats['retransmits'] is not None:
+            self.retransmits[source, destination] = stats['retransmits']
+        if stats['jitter_ms'] is not None:
+            self.jitter_ms[source, destination] = stats['jitter_ms']
+
+    def get(self, source: str, destination: str) -> dict:
+        i, j = self.index[source], self.index[destination]
+        return {
+            'gbps': float(self.gbps[i, j]),
+            'retransmits': float(self.retransmits[i, j]),
+            'jitter_ms': float(self.jitter_ms[i, j]),
+        }
+
+    def pod_gbps(self) -> np.ndarray:
+        """P x P matrix of the total Gbps measured between each pod pair"""
+        num_pods = int(self.pods.max()) + 1 if len(self.pods) else 0
+        src, dst = np.nonzero(~np.isnan(self.gbps))
+        totals = np.zeros((num_pods, num_pods), dtype=np.float64)
+        np.add.at(totals, (self.pods[src], self.pods[dst]), self.gbps[src, dst])
+        return totals
+
+    def summary(self) -> dict:
+        values = self.gbps[~np.isnan(self.gbps)]
+        return {
+            'flows': int(values.size),
+            'total_gbps': float(values.sum()),
+            'gbps_p50': float(np.percentile(values, 50)) if values.size else None,
+            'gbps_min': float(values.min()) if values.size else None,
+            'retransmits': float(np.nansum(self.retransmits)),
+        }
+
+    def save(self, path: str):
+        """Saves the matrix to a compressed .npz file"""
+        np.savez_compressed(path, servers=np.array(self.servers), pods=self.pods, gbps=self.gbps,
+                            retransmits=self.retransmits, jitter_ms=self.jitter_ms)
+
+    @classmethod
+    def load(cls, path: str) -> 'ThroughputMatrix':
+        """Loads a matrix written by save()"""
+        with np.load(path) as data:
+            matrix = cls(data['servers'].tolist(), data['pods'])
+            matrix.gbps = data['gbps']
+            matrix.retransmits = data['retransmits']
+            matrix.jitter_ms = data['jitter_ms']
+        return matrix
+
+
+class ThroughputSuite:
+    """Runs iperf3 traffic patterns between server containers.
+
+    Every round of a pattern is split into batches of at most max_concurrent flows, since each flow keeps
+    about one host CPU busy on each end and an oversubscribed host measures its scheduler, not the fabric.
+    A destination that receives several flows of a batch runs one iperf3 server per flow, on consecutive
+    ports from 5201.
+    """
+
+    def __init__(self, servers: List[Server], pods: List[int], duration: int = 10, udp: bool = False,
+                 udp_bandwidth: str = '1G', cpus_per_flow: int = 2, max_concurrent: Optional[int] = None,
+                 progress_callback: Optional[Callable] = None):
+        """
+        Args:
+            servers (List[Server]): servers in ordinal order, as used by the patterns and the result matrix
+            pods (List[int]): pod number of each server
+            duration (int): seconds per flow
+            udp (bool): measure UDP (jitter, loss) instead of TCP (retransmits)
+            udp_bandwidth (str): iperf3 -b target of UDP flows
+            cpus_per_flow (int): host CPUs one flow is budgeted (client plus server)
+            max_concurrent (int): flows in flight, defaults to the host CPU count / cpus_per_flow
+            progress_callback (function): Called as progress_callback(batch, num_batches, results) after each batch.
+        """
+        self.servers = servers
+        self.pods = pods
+        self.duration = duration
+        self.udp = udp
+        self.udp_bandwidth = udp_bandwidth
+        self.max_concurrent = max_concurrent or max(1, (os.cpu_count() or 1) // cpus_per_flow)
+        self.progress_callback = progress_callback
+        self._listening = set()  # (server ordinal, port) with an iperf3 server running
+
+    def batches(self, rounds: List[List[Tuple[int, int]]]) -> List[List[Tuple[int, int]]]:
+        """Splits every round into batches that fit max_concurrent"""
+        batches = []
+        for flows in rounds:
+            for start in range(0, len(flows), self.max_concurrent):
+                batches.append(flows[start:start + self.max_concurrent])
+        return batches
+
+    def _ensure_server(self, destination: int, port: int):
+        if (destination, port) not in self._listening:
+            start_iperf3_server(self.servers[destination], port)
+            self._listening.add((destination, port))
+
+    def _run_flow(self, source: int, destination: int, port: int) -> Optional[dict]:
+        command = f"iperf3 -J -c {self.servers[destination].ip} -p {port} -t {self.duration}"
+        if self.udp:
+            command += f" -u -b {self.udp_bandwidth}"
+        result = self.servers[source].exec_run(command)
+        return parse_iperf3_json(result.output.decode(errors='replace'), udp=self.udp)
+
+    def run_batch(self, flows: List[Tuple[int, int]]) -> List[Optional[dict]]:
+        """Runs a set of flows at the same time"""
+        ports = flow_ports(flows)
+        with ThreadPoolExecutor(max_workers=max(1, len(flows))) as pool:
+            list(pool.map(lambda flow_port: self._ensure_server(flow_port[0][1], flow_port[1]), zip(flows, ports)))
+            return list(pool.map(lambda flow_port: self._run_flow(*flow_port[0], flow_port[1]), zip(flows, ports)))
+
+    def run(self, rounds: List[List[Tuple[int, int]]]) -> Tuple[ThroughputMatrix, List[dict]]:
+        """Runs every batch of a pattern.
+
+        Returns:
+            Tuple[ThroughputMatrix, List[dict]]: per pair results, and per batch its flows with their results
+            (None for flows that failed)
+        """
+        matrix = ThroughputMatrix([server.name for server in self.servers], self.pods)
+        batches = self.batches(rounds)
+        history = []
+        try:
+            for number, flows in enumerate(batches, 1):
+                results = self.run_batch(flows)
+                for (source, destination), stats in zip(flows, results):
+                    if stats is not None:
+                        matrix.set(source, destination, stats)
+                history.append({'flows': flows, 'results': results})
+                if self.progress_callback:
+                    self.progress_callback(number, len(batches), results)
+        finally:
+            self.stop_servers()
+        return matrix, history
+
+    def stop_servers(self):
+        """Stops every iperf3 server the suite started. On the netns and agent backends they are host processes
+        that would otherwise outlive the fabric and keep its namespaces alive."""
+        listening = sorted(self._listening)
+        with ThreadPoolExecutor(max_workers=max(1, min(len(listening), self.max_concurrent))) as pool:
+            list(pool.map(lambda server_port: stop_iperf3_server(self.servers[server_port[0]], server_port[1]),
+                          listening))
+        self._listening.clear()
+
+    def bisection(self, history: List[dict], link_gbps: float) -> dict:
+        """Aggregate bandwidth across the fabric's bisection (pods < k/2 vs. the rest) against the ideal.
+
+        A fat tree has full bisection bandwidth, so ideally every crossing flow of a batch gets the full host
+        link rate. Only flows that ran together count towards one batch; the best batch is reported.
+
+        Args:
+            history (List[dict]): batches as returned by run()
+            link_gbps (float): per host link rate, e.g. the Gbps of a single isolated flow
+
+        Returns:
+            dict: 'measured_gbps', 'ideal_gbps', 'ratio' and 'crossing_flows' of the best batch
+        """
+        num_pods = max(self.pods) + 1 if self.pods else 0
+        half = num_pods // 2
+        best = {'measured_gbps': 0.0, 'ideal_gbps': 0.0, 'ratio': None, 'crossing_flows': 0}
+        for batch in history:
+            crossing = [
+                stats for (source, destination), stats in zip(batch['flows'], batch['results'])
+                if (self.pods[source] < half) != (self.pods[destination] < half)
+            ]
+            if not crossing:
+                continue
+            measured = sum(stats['gbps'] for stats in crossing if stats is not None)
+            ideal = len(crossing) * link_gbps
+            if measured > best['measured_gbps']:
+                best = {
+                    'measured_gbps': measured,
+                    'ideal_gbps': ideal,
+                    'ratio': measured / ideal if ideal else None,
+                    'crossing_flows': len(crossing),
+                }
+        return best